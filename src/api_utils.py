@@ -1,7 +1,161 @@
-import requests
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+
 from loguru import logger
 
+if TYPE_CHECKING:
+    import aiohttp
+
 API_BASE = "https://api.openweathermap.org/data/2.5/weather"
+REQUEST_TIMEOUT = 10
+# квота по умолчанию - бесплатный тариф OpenWeatherMap, 60 запросов в минуту (первые 60 - сразу, дальше по
+# одному в секунду): 150 городов без кэша грузятся ~90 с. Для платного тарифа - OPENWEATHER_RATE_PER_MINUTE
+# или rate_per_minute в fetch_current_weather_many / configure_weather_scheduler
+DEFAULT_RATE_PER_MINUTE = float(os.environ.get("OPENWEATHER_RATE_PER_MINUTE", 60))
+
+# одна сессия на процесс, чтобы переиспользовать соединения; requests/aiohttp импортируются
+# при первом запросе, чтобы импорт модуля (и анализатора) не тянул HTTP-стек
+_session = None
+
+
+def _get_session():
+    global _session
+    if _session is None:
+        import requests
+
+        _session = requests.Session()
+    return _session
+
+
+# кэш ответов API: backend хранит (value, stored_at) и вытесняет давно не использованное (LRU),
+# TTL проверяет WeatherCache. Модульный объект живет между перезапусками скрипта streamlit
+class MemoryCacheBackend:
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key: tuple, value: dict, stored_at: float) -> None:
+        with self._lock:
+            self._data[key] = (value, stored_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key: tuple) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+# то же на диске (sqlite), переживает перезапуск приложения
+class SqliteCacheBackend:
+    def __init__(self, path: str = "weather_cache.sqlite", max_size: int = 10000):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS weather_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS weather_cache_accessed ON weather_cache (accessed_at)")
+        self._conn.commit()
+
+    def get(self, key: tuple):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, stored_at FROM weather_cache WHERE key = ?", (json.dumps(key),)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE weather_cache SET accessed_at = ? WHERE key = ?", (time.time(), json.dumps(key)))
+            self._conn.commit()
+            return json.loads(row[0]), row[1]
+
+    def set(self, key: tuple, value: dict, stored_at: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO weather_cache (key, value, stored_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (json.dumps(key), json.dumps(value), stored_at, time.time()),
+            )
+            self._conn.execute(
+                "DELETE FROM weather_cache WHERE key NOT IN "
+                "(SELECT key FROM weather_cache ORDER BY accessed_at DESC LIMIT ?)",
+                (self.max_size,),
+            )
+            self._conn.commit()
+
+    def delete(self, key: tuple) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM weather_cache WHERE key = ?", (json.dumps(key),))
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM weather_cache")
+            self._conn.commit()
+
+
+# hits - ответы из кэша, misses - реальные запросы к API (считаются в планировщике один раз на запрос,
+# не на каждую проверку кэша и не на повторы): пакетная загрузка и склеенные запросы проверяют кэш
+# несколько раз, и промах при каждой проверке завышал бы их число
+class WeatherCache:
+    def __init__(self, backend=None, ttl: float = 600):
+        self.backend = backend if backend is not None else MemoryCacheBackend()
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, city: str, units: str = "metric") -> dict | None:
+        key = (city, units)
+        entry = self.backend.get(key)
+        if entry is not None and time.time() - entry[1] < self.ttl:
+            self.hits += 1
+            return entry[0]
+        if entry is not None:
+            self.backend.delete(key)
+        return None
+
+    def record_miss(self) -> None:
+        self.misses += 1
+
+    def set(self, city: str, units: str, value: dict) -> None:
+        self.backend.set((city, units), value, time.time())
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
+
+
+weather_cache = WeatherCache()
+
+
+# подмена кэша (другой backend/TTL); backend=None без ttl - оставить текущий backend
+def configure_weather_cache(backend=None, ttl: float = 600) -> WeatherCache:
+    global weather_cache
+    weather_cache = WeatherCache(backend if backend is not None else weather_cache.backend, ttl)
+    return weather_cache
 
 
 """
@@ -52,22 +206,335 @@ Joblib (параллелизация на уровне процессов) -
 """
 
 
-def get_current_weather_sync(city: str, api_key: str) -> dict:
-    # cинхронный запрос к API.
-    params = {"q": city, "appid": api_key, "units": "metric"}
+def _parse_weather(data: dict) -> dict:
+    return {
+        "temperature": data["main"]["temp"],
+        "description": data["weather"][0]["description"],
+        "timestamp": data["dt"],
+    }
+
+
+# ограничитель частоты (token bucket): rate_per_minute запросов в минуту, до burst подряд.
+# reserve() сразу списывает токен и возвращает, сколько подождать до запроса, поэтому годится
+# и для потоков (time.sleep), и для asyncio (asyncio.sleep)
+class TokenBucket:
+    def __init__(self, rate_per_minute: float = 60, burst: int | None = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst if burst is not None else max(1, int(rate_per_minute)))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            return max(wait, self._paused_until - now)
+
+    # после 429 сервер просит подождать: придерживаем все следующие запросы
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = min(self._tokens, 0.0)
+
+
+# экспоненциальная задержка с полным jitter: uniform(0, min(max_delay, base_delay * 2**attempt)).
+# Если сервер прислал Retry-After - ждем его плюс uniform(0, base_delay), чтобы все запросы,
+# получившие 429 одновременно, не вернулись тоже одновременно
+class RetryPolicy:
+    def __init__(self, max_retries: int = 3, base_delay: float = 0.5, max_delay: float = 20.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int, retry_after: float | None = None) -> float:
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.base_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+
+def _retry_after(headers) -> float | None:
+    value = headers.get("Retry-After")
     try:
-        response = requests.get(API_BASE, params=params)
-        response.raise_for_status()
-        data = response.json()
-        return {
-            "temperature": data["main"]["temp"],
-            "description": data["weather"][0]["description"],
-            "timestamp": data["dt"],
-        }
-    except requests.exceptions.HTTPError as e:
-        if response.status_code == 401:
-            raise ValueError("Invalid API key")
-        raise e
-    except Exception as e:
-        logger.error(f"API error: {e}")
-        raise
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+# повторяем только то, что может пройти со второй попытки: 429, 5xx, таймауты и обрывы соединения
+def _is_retryable_status(status: int) -> bool:
+    return status == 429 or status >= 500
+
+
+class WeatherRequestScheduler:
+    """
+    Планировщик запросов к OpenWeatherMap: общий token bucket на процесс (квота API в минуту),
+    таймаут на запрос, повторы с jitter-задержкой и общий бюджет времени на вызов (total_timeout),
+    чтобы медленный API не подвешивал страницу. Одновременные запросы одного города
+    (с тем же ключом) склеиваются в один: остальные ждут результат уже идущего запроса.
+    """
+
+    def __init__(
+        self,
+        rate_per_minute: float = DEFAULT_RATE_PER_MINUTE,
+        burst: int | None = None,
+        timeout: float = REQUEST_TIMEOUT,
+        total_timeout: float = 30.0,
+        retry: RetryPolicy | None = None,
+    ):
+        self.bucket = TokenBucket(rate_per_minute, burst)
+        self.timeout = timeout
+        self.total_timeout = total_timeout
+        self.retry = retry if retry is not None else RetryPolicy()
+        self.requests = 0
+        self.retries = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._async_inflight = weakref.WeakKeyDictionary()
+
+    def stats(self) -> dict:
+        return {"requests": self.requests, "retries": self.retries, "coalesced": self.coalesced}
+
+    # None - повторять нельзя или бюджет времени исчерпан
+    def _next_delay(self, attempt: int, started: float, retry_after: float | None) -> float | None:
+        if attempt >= self.retry.max_retries:
+            return None
+        delay = self.retry.delay(attempt, retry_after)
+        if time.monotonic() - started + delay > self.total_timeout:
+            return None
+        self.retries += 1
+        return delay
+
+    def fetch(self, city: str, api_key: str, api_base: str = API_BASE, units: str = "metric") -> dict:
+        cached = weather_cache.get(city, units)
+        if cached is not None:
+            return cached
+        key = (city, units, api_base, api_key)
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = concurrent.futures.Future()
+            else:
+                self.coalesced += 1
+        if not owner:
+            return future.result()
+        try:
+            current = self._fetch(city, api_key, api_base, units)
+            future.set_result(current)
+            return current
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _fetch(self, city: str, api_key: str, api_base: str, units: str) -> dict:
+        import requests
+
+        weather_cache.record_miss()
+        params = {"q": city, "appid": api_key, "units": units}
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            time.sleep(self.bucket.reserve())
+            self.requests += 1
+            retry_after = None
+            try:
+                response = _get_session().get(api_base, params=params, timeout=self.timeout)
+                if response.status_code == 401:
+                    raise ValueError("Invalid API key")
+                if _is_retryable_status(response.status_code):
+                    retry_after = _retry_after(response.headers)
+                    if response.status_code == 429:
+                        self.bucket.pause(retry_after or self.retry.base_delay)
+                response.raise_for_status()
+                current = _parse_weather(response.json())
+                weather_cache.set(city, units, current)
+                return current
+            except requests.exceptions.HTTPError as e:
+                if not _is_retryable_status(e.response.status_code):
+                    raise
+                error = e
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                error = e
+            delay = self._next_delay(attempt, started, retry_after)
+            if delay is None:
+                logger.error(f"API error for {city} after {attempt + 1} attempts: {error}")
+                raise error
+            logger.warning(f"API error for {city}: {error}, retry in {delay:.2f}s")
+            time.sleep(delay)
+            attempt += 1
+
+    async def fetch_async(
+        self,
+        city: str,
+        api_key: str,
+        session: aiohttp.ClientSession | None = None,
+        api_base: str = API_BASE,
+        units: str = "metric",
+        bucket: TokenBucket | None = None,
+    ) -> dict:
+        cached = weather_cache.get(city, units)
+        if cached is not None:
+            return cached
+        # склейка - в пределах одного event loop (streamlit на каждый вызов делает свой asyncio.run)
+        loop = asyncio.get_running_loop()
+        inflight = self._async_inflight.setdefault(loop, {})
+        key = (city, units, api_base, api_key)
+        task = inflight.get(key)
+        if task is None:
+            task = loop.create_task(self._fetch_async(city, api_key, session, api_base, units, bucket))
+            inflight[key] = task
+            task.add_done_callback(lambda _: inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # отмена одного ожидающего не отменяет общий запрос
+        return await asyncio.shield(task)
+
+    async def _fetch_async(
+        self,
+        city: str,
+        api_key: str,
+        session: aiohttp.ClientSession | None,
+        api_base: str,
+        units: str,
+        bucket: TokenBucket | None = None,
+    ) -> dict:
+        import aiohttp
+
+        if session is None:
+            async with aiohttp.ClientSession() as own_session:
+                return await self._fetch_async(city, api_key, own_session, api_base, units, bucket)
+        bucket = bucket if bucket is not None else self.bucket
+
+        weather_cache.record_miss()
+        params = {"q": city, "appid": api_key, "units": units}
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            await asyncio.sleep(bucket.reserve())
+            self.requests += 1
+            retry_after = None
+            try:
+                async with session.get(api_base, params=params, timeout=timeout) as response:
+                    if response.status == 401:
+                        raise ValueError("Invalid API key")
+                    if _is_retryable_status(response.status):
+                        retry_after = _retry_after(response.headers)
+                        if response.status == 429:
+                            bucket.pause(retry_after or self.retry.base_delay)
+                    response.raise_for_status()
+                    current = _parse_weather(await response.json(content_type=None))
+                weather_cache.set(city, units, current)
+                return current
+            except aiohttp.ClientResponseError as e:
+                if not _is_retryable_status(e.status):
+                    logger.error(f"API error for {city}: {e}")
+                    raise
+                error = e
+            except (asyncio.TimeoutError, aiohttp.ClientConnectionError) as e:
+                error = e
+            delay = self._next_delay(attempt, started, retry_after)
+            if delay is None:
+                logger.error(f"API error for {city} after {attempt + 1} attempts: {error!r}")
+                raise error
+            logger.warning(f"API error for {city}: {error!r}, retry in {delay:.2f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    # пакетная загрузка: одна сессия с пулом соединений, не больше concurrency запросов одновременно,
+    # темп - общий token bucket или, если задан rate_per_minute, отдельная квота на этот вызов
+    # (например, ключ платного тарифа). Города, по которым запрос упал, в результат не попадают (ошибка в логе)
+    async def fetch_many(
+        self,
+        cities: list,
+        api_key: str,
+        concurrency: int = 20,
+        api_base: str = API_BASE,
+        units: str = "metric",
+        rate_per_minute: float | None = None,
+    ) -> dict:
+        results = {}
+        for city in cities:
+            cached = weather_cache.get(city, units)
+            if cached is not None:
+                results[city] = cached
+        cities = [city for city in dict.fromkeys(cities) if city not in results]
+        if not cities:
+            return results
+        bucket = TokenBucket(rate_per_minute) if rate_per_minute is not None else self.bucket
+        over_burst = len(cities) - bucket.capacity
+        if over_burst > 0:
+            seconds = over_burst / bucket.rate
+            logger.info(f"Fetching {len(cities)} cities at {bucket.rate * 60:g} requests/min takes ~{seconds:.0f}s")
+
+        import aiohttp
+
+        semaphore = asyncio.Semaphore(concurrency)
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency)) as session:
+
+            async def fetch(city: str) -> dict:
+                async with semaphore:
+                    return await self.fetch_async(city, api_key, session, api_base, units, bucket)
+
+            responses = await asyncio.gather(*(fetch(city) for city in cities), return_exceptions=True)
+
+        for city, response in zip(cities, responses):
+            if isinstance(response, ValueError):
+                raise response
+            if isinstance(response, BaseException):
+                continue
+            results[city] = response
+        return results
+
+
+weather_scheduler = WeatherRequestScheduler()
+
+
+# другие квота/таймауты/повторы (например, для платного тарифа или тестов с локальным сервером)
+def configure_weather_scheduler(
+    rate_per_minute: float = DEFAULT_RATE_PER_MINUTE,
+    burst: int | None = None,
+    timeout: float = REQUEST_TIMEOUT,
+    total_timeout: float = 30.0,
+    retry: RetryPolicy | None = None,
+) -> WeatherRequestScheduler:
+    global weather_scheduler
+    weather_scheduler = WeatherRequestScheduler(rate_per_minute, burst, timeout, total_timeout, retry)
+    return weather_scheduler
+
+
+def get_current_weather_sync(city: str, api_key: str, api_base: str = API_BASE, units: str = "metric") -> dict:
+    # cинхронный запрос к API (через планировщик: квота, таймаут, повторы)
+    return weather_scheduler.fetch(city, api_key, api_base, units)
+
+
+# асинхронный запрос, сессию можно передать снаружи (для пакетной загрузки)
+async def get_current_weather_async(
+    city: str,
+    api_key: str,
+    session: aiohttp.ClientSession | None = None,
+    api_base: str = API_BASE,
+    units: str = "metric",
+) -> dict:
+    return await weather_scheduler.fetch_async(city, api_key, session, api_base, units)
+
+
+# rate_per_minute - квота на этот вызов вместо общей (по умолчанию DEFAULT_RATE_PER_MINUTE на процесс)
+async def fetch_current_weather_many(
+    cities: list,
+    api_key: str,
+    concurrency: int = 20,
+    api_base: str = API_BASE,
+    units: str = "metric",
+    rate_per_minute: float | None = None,
+) -> dict:
+    return await weather_scheduler.fetch_many(cities, api_key, concurrency, api_base, units, rate_per_minute)
@@ -1,15 +1,19 @@
 import asyncio
 
-import pandas as pd
 import streamlit as st
 from loguru import logger
 
-from historycal_analiz import HistoricalDataAnalyzer
+import api_utils
+import metrics as analyzer_metrics
+from dataset_cache import analyzer_cache, upload_digest
 
 
 def run_analysis():
     st.set_page_config(page_title="Анализ температурных данных", page_icon="🌡️", layout="wide")
     st.title("🌡️ Анализ исторических и текущих температурных данных")
+    # метрики стадий свои у каждой сессии: галочка и сброс не трогают метрики других пользователей
+    metrics = st.session_state.setdefault("metrics", analyzer_metrics.MetricsRecorder())
+    analyzer_metrics.bind(metrics)
 
     # решил сделать через  боковое меню, так показалось будет лучше выглядеть
     with st.sidebar:
@@ -23,21 +27,26 @@ def run_analysis():
         if api_key_input:
             st.session_state["api_key"] = api_key_input
 
-    # обработчик загрузки
-    df = None
+    # обработчик загрузки: анализатор общий для всех сессий с тем же содержимым файла (dataset_cache),
+    # на rerun CSV не перечитывается. Хэш загрузки запоминаем в сессии, чтобы не считать его на каждый rerun
     analyzer = None
     cities = []
     if uploaded_file:
         try:
-            df = pd.read_csv(uploaded_file)
-            required_columns = ["city", "timestamp", "temperature", "season"]
-            missing = [col for col in required_columns if col not in df.columns]
-            if missing:
-                st.error(f'Отсутствуют колонки: {", ".join(missing)}')
-                return
-            analyzer = HistoricalDataAnalyzer(df)
-            cities = sorted(df["city"].unique())
+            data = uploaded_file.getvalue()
+            upload_key = getattr(uploaded_file, "file_id", None) or (uploaded_file.name, len(data))
+            if st.session_state.get("upload_key") != upload_key:
+                st.session_state["upload_key"] = upload_key
+                st.session_state["upload_digest"] = upload_digest(data)
+            with st.spinner("Загрузка данных..."):
+                analyzer = analyzer_cache.get_or_load(data, st.session_state["upload_digest"])
+            cities = analyzer.cities
+            cache_stats = analyzer_cache.stats()
             st.sidebar.success("Данные загружены")
+            st.sidebar.caption(
+                f"Кэш наборов данных: {cache_stats['entries']} шт., {cache_stats['bytes'] / 2**20:.1f} МБ "
+                f"из {cache_stats['max_bytes'] / 2**20:.0f} МБ"
+            )
         except Exception as e:
             st.error(f"Ошибка: {e}")
             return
@@ -48,6 +57,13 @@ def run_analysis():
             selected_city = st.selectbox("Выберите город", cities)
             window_size = st.slider("Окно скользящего среднего (дни)", 7, 90, 30)
             anomaly_threshold = st.slider("Порог аномалий (σ)", 1.0, 3.0, 2.0, 0.5)
+            # mad: медиана и MAD окна вместо среднего и std - выбросы не раздувают порог для соседних дней
+            anomaly_mode = st.radio(
+                "Режим аномалий",
+                ["std", "mad"],
+                format_func={"std": "Среднее ± k·σ", "mad": "Медиана ± k·MAD (устойчивый)"}.get,
+                horizontal=True,
+            )
 
             analysis_method = st.radio(
                 "Метод анализа",
@@ -56,6 +72,7 @@ def run_analysis():
                     "Параллельный (Joblib)",
                     "Многопоточный",
                     "Многопроцессный",
+                    "Авто (планировщик)",
                     "Асинхронный",
                     "Бенчмарк всех методов",
                 ],
@@ -67,6 +84,14 @@ def run_analysis():
             method_map = {"Синхронный": "sync"}
             st.session_state["api_method"] = method_map.get("Синхронный", "sync")
 
+            # телеметрия по стадиям (время, строки, память) вместо одной цифры на метод
+            collect_metrics = st.checkbox("Метрики по стадиям", help="Время, строки и память по этапам анализа")
+            track_memory = collect_metrics and st.checkbox("Учитывать память (медленнее)")
+            if collect_metrics and (not metrics.enabled or metrics.track_memory != track_memory):
+                metrics.enable(track_memory)
+            elif not collect_metrics and metrics.enabled:
+                metrics.disable()
+
     # текущая погода вверху (только если ключ введён и файл загружен)
     api_key = st.session_state.get("api_key", "")
     api_method = st.session_state.get("api_method", "sync")
@@ -82,6 +107,12 @@ def run_analysis():
                 f"Сезонная норма: {current_analysis['seasonal_mean']:.2f} ± {current_analysis['seasonal_std']:.2f}°C"
             )
             st.write(current_analysis["anomaly_desc"])
+            cache_stats = api_utils.weather_cache.stats()
+            scheduler_stats = api_utils.weather_scheduler.stats()
+            st.caption(
+                f"Кэш погоды: попаданий {cache_stats['hits']}, промахов {cache_stats['misses']}; "
+                f"запросов к API {scheduler_stats['requests']}, повторов {scheduler_stats['retries']}"
+            )
         except Exception as e:
             st.error(f"Ошибка: {e}")
             logger.error(f"Error in weather display: {e}")
@@ -92,25 +123,44 @@ def run_analysis():
         if analysis_method == "Бенчмарк всех методов":
             with st.spinner("Бенчмарк..."):
                 benchmark = analyzer.benchmark_methods(selected_city, window_size, anomaly_threshold)
-            st.subheader("Результаты бенчмарка (время, сек)")
-            st.table(benchmark)
-            results = analyzer.analyze_city_sync(selected_city, window_size, anomaly_threshold)
+            if not metrics.enabled:
+                st.subheader("Результаты бенчмарка (время, сек)")
+                st.table(benchmark)
+            # бенчмарки по всем городам и режимам долгие - только по кнопке, а не на каждый rerun.
+            # Таблицы хранятся в сессии, пока не поменяются данные, город, окно или порог
+            benchmark_key = (analyzer.fingerprint, selected_city, window_size, anomaly_threshold)
+            if st.button("Бенчмарк по всем городам и режимам аномалий"):
+                with st.spinner("Бенчмарк по всем городам..."):
+                    benchmark_all = analyzer.benchmark_all_cities(window_size, anomaly_threshold)
+                with st.spinner("Бенчмарк режимов аномалий..."):
+                    benchmark_modes = analyzer.benchmark_modes(selected_city, window_size, anomaly_threshold)
+                st.session_state["extra_benchmarks"] = (benchmark_key, benchmark_all, benchmark_modes)
+            extra_benchmarks = st.session_state.get("extra_benchmarks")
+            if extra_benchmarks is not None and extra_benchmarks[0] == benchmark_key and not metrics.enabled:
+                st.subheader("Все города (время, сек)")
+                st.table(extra_benchmarks[1])
+                st.subheader("Режимы аномалий: среднее/σ и медиана/MAD (время, сек)")
+                st.table(extra_benchmarks[2])
+            results = analyzer.analyze_city_sync(selected_city, window_size, anomaly_threshold, mode=anomaly_mode)
         elif analysis_method == "Синхронный":
-            results = analyzer.analyze_city_sync(selected_city, window_size, anomaly_threshold)
-        elif analysis_method == "Параллельный (Joblib)":
-            results = analyzer.analyze_city_parallel([selected_city], window_size, anomaly_threshold, "joblib")[
-                selected_city
-            ]
-        elif analysis_method == "Многопоточный":
-            results = analyzer.analyze_city_parallel([selected_city], window_size, anomaly_threshold, "multithread")[
-                selected_city
-            ]
-        elif analysis_method == "Многопроцессный":
-            results = analyzer.analyze_city_parallel([selected_city], window_size, anomaly_threshold, "multiprocess")[
-                selected_city
-            ]
+            results = analyzer.analyze_city_sync(selected_city, window_size, anomaly_threshold, mode=anomaly_mode)
+        elif analysis_method in ("Параллельный (Joblib)", "Многопоточный", "Многопроцессный", "Авто (планировщик)"):
+            parallel_method = {
+                "Параллельный (Joblib)": "joblib",
+                "Многопоточный": "multithread",
+                "Многопроцессный": "multiprocess",
+                "Авто (планировщик)": "auto",
+            }[analysis_method]
+            parallel_results = analyzer.analyze_city_parallel(
+                [selected_city], window_size, anomaly_threshold, parallel_method, mode=anomaly_mode
+            )
+            results = parallel_results[selected_city]
+            if parallel_method == "auto":
+                st.caption(f"Планировщик: {parallel_results.plan.reason}")
         elif analysis_method == "Асинхронный":
-            results = asyncio.run(analyzer.analyze_city_async(selected_city, window_size, anomaly_threshold))
+            results = asyncio.run(
+                analyzer.analyze_city_async(selected_city, window_size, anomaly_threshold, mode=anomaly_mode)
+            )
 
         # визуализация резщов
         st.subheader("Базовая статистика")
@@ -128,12 +178,40 @@ def run_analysis():
         st.subheader("Тренд")
         st.write(results["trend"]["trend_description"])
 
+        # все окна 7-90 и пороги 1.0-3.0 разом по всем городам (кэшируется вместе с анализатором)
+        if st.checkbox("Подбор окна и порога", help="Доля аномалий для всех комбинаций окна и порога"):
+            with st.spinner("Перебор параметров..."):
+                sweep = analyzer.sweep_anomalies(range(7, 91), [round(1.0 + 0.1 * i, 1) for i in range(21)])
+            st.plotly_chart(
+                analyzer.plot_anomaly_sweep(sweep, selected_city, window_size, anomaly_threshold), width="stretch"
+            )
+
+        if metrics.enabled:
+            st.subheader("Метрики по стадиям")
+            st.dataframe([{"stage": name, **stats} for name, stats in metrics.snapshot().items()], width="stretch")
+            if st.button("Сбросить метрики"):
+                metrics.reset()
+            with st.expander("Prometheus"):
+                st.code(metrics.to_prometheus(), language="text")
+
         # графики
-        city_data = df[df["city"] == selected_city]
+        city_data = analyzer.get_city_frame(selected_city)
         st.subheader("Графики")
 
+        # длинные ряды прореживаются до ~2000 точек в видимом интервале, аномалии рисуются все
+        first_date = city_data["timestamp"].min().to_pydatetime()
+        last_date = city_data["timestamp"].max().to_pydatetime()
+        x_range = st.slider("Период на графиках", first_date, last_date, (first_date, last_date), format="YYYY-MM-DD")
+
         st.plotly_chart(
-            analyzer.plot_time_series(city_data, window_size, anomaly_threshold),
+            analyzer.plot_time_series(
+                city_data,
+                window_size,
+                anomaly_threshold,
+                x_range=x_range,
+                anomalies=results["anomalies"],
+                mode=anomaly_mode,
+            ),
             width="stretch",
         )
 
@@ -143,10 +221,10 @@ def run_analysis():
             st.plotly_chart(analyzer.plot_seasonal_boxplot(city_data), width="stretch")
         with col2:
             st.plotly_chart(
-                analyzer.plot_heatmap_anomalies(results["anomalies"]["anomalies"]),
+                analyzer.plot_heatmap_anomalies(results["anomalies"]),
                 width="stretch",
             )
-            st.plotly_chart(analyzer.plot_trend(city_data, results["trend"]), width="stretch")
+            st.plotly_chart(analyzer.plot_trend(city_data, results["trend"], x_range=x_range), width="stretch")
 
 
 # для тестов делал
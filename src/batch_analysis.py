@@ -0,0 +1,137 @@
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+from loguru import logger
+
+from columnar_storage import load_dataset, read_csv_typed
+from historycal_analiz import HistoricalDataAnalyzer
+
+"""
+Ночной батч без streamlit/plotly: анализ всех (или выбранных) городов и выгрузка в JSON/Parquet.
+
+    python batch_analysis.py --input temperature_data.csv --output-dir out --format parquet
+    python batch_analysis.py --input data.csv.columnar --cities Moscow London --method multiprocess
+
+В output-dir пишутся три таблицы: summary (статистика, число аномалий и тренд по городу),
+seasonal (сезонный профиль) и anomalies (все аномальные дни), плюс seasonal_norms.npz -
+таблица норм город x сезон для оценки текущих наблюдений (SeasonalNorms.load).
+"""
+
+METHODS = ["vectorized", "sync", "multithread", "multiprocess", "joblib"]
+
+
+def analyze(analyzer: HistoricalDataAnalyzer, window_size: int, threshold: float, method: str) -> dict:
+    if method == "vectorized":
+        return analyzer.analyze_all_cities(window_size, threshold)
+    if method == "sync":
+        return {city: analyzer.analyze_city_sync(city, window_size, threshold) for city in analyzer.cities}
+    return analyzer.analyze_city_parallel(analyzer.cities, window_size, threshold, method)
+
+
+# результаты по городам -> три плоские таблицы
+def results_to_frames(results: dict) -> tuple:
+    summary_rows = []
+    seasonal_frames = []
+    anomaly_frames = []
+    for city, result in results.items():
+        anomalies = result["anomalies"]
+        trend = result["trend"]
+        summary_rows.append(
+            {
+                "city": city,
+                **{key: float(value) for key, value in result["stats"].items()},
+                "anomaly_count": anomalies["anomaly_count"],
+                "anomaly_percent": anomalies["anomaly_percent"],
+                "trend_slope": trend["slope"],
+                "trend_intercept": trend["intercept"],
+                "trend_r_value": trend["r_value"],
+                "trend_p_value": trend["p_value"],
+                "trend_std_err": trend["std_err"],
+            }
+        )
+        seasonal = result["seasonal"].reset_index()
+        seasonal.insert(0, "city", city)
+        seasonal_frames.append(seasonal)
+        city_anomalies = anomalies["anomalies"]
+        if len(city_anomalies):
+            # окно в имени колонок (ma_30/std_30) -> общие имена, чтобы таблица была одна
+            city_anomalies = city_anomalies.rename(
+                columns=lambda c: "ma" if str(c).startswith("ma_") else "std" if str(c).startswith("std_") else c
+            )
+            anomaly_frames.append(city_anomalies)
+
+    summary = pd.DataFrame(summary_rows)
+    seasonal = pd.concat(seasonal_frames, ignore_index=True) if seasonal_frames else pd.DataFrame()
+    anomalies = pd.concat(anomaly_frames, ignore_index=True) if anomaly_frames else pd.DataFrame()
+    for frame in (summary, seasonal, anomalies):
+        for column in ("city", "season"):
+            if column in frame.columns:
+                frame[column] = frame[column].astype(str)
+    if "count" in summary.columns:
+        summary["count"] = summary["count"].astype(int)
+    return summary, seasonal, anomalies
+
+
+def write_frames(frames: dict, output_dir: str, fmt: str) -> None:
+    os.makedirs(output_dir, exist_ok=True)
+    for name, frame in frames.items():
+        path = os.path.join(output_dir, f"{name}.{fmt}")
+        if fmt == "parquet":
+            frame.to_parquet(path, index=False)
+        else:
+            frame.to_json(path, orient="records", date_format="iso", force_ascii=False, indent=2)
+        logger.info(f"Wrote {len(frame)} rows to {path}")
+
+
+def main(argv: list | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Батч-анализ температур по всем городам")
+    parser.add_argument("--input", required=True, help="CSV или каталог columnar_storage")
+    parser.add_argument("--output-dir", default="analysis_output")
+    parser.add_argument("--format", choices=["json", "parquet"], default="json")
+    parser.add_argument("--cities", nargs="+", help="только эти города (по умолчанию все)")
+    parser.add_argument("--window", type=int, default=30)
+    parser.add_argument("--threshold", type=float, default=2.0)
+    parser.add_argument("--method", choices=METHODS, default="vectorized")
+    parser.add_argument("--no-columnar-cache", action="store_true", help="не создавать <csv>.columnar рядом с CSV")
+    args = parser.parse_args(argv)
+
+    if args.format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            logger.error("Parquet output requires pyarrow (pip install pyarrow), use --format json")
+            return 2
+
+    start = time.perf_counter()
+    if args.no_columnar_cache and not os.path.isdir(args.input):
+        df = read_csv_typed(args.input)
+    else:
+        df = load_dataset(args.input)
+    if args.cities:
+        missing = sorted(set(args.cities) - set(df["city"].astype(str).unique()))
+        if missing:
+            logger.warning(f"Cities not found in data: {', '.join(missing)}")
+        df = df[df["city"].isin(args.cities)]
+        if len(df) == 0:
+            logger.error("No data for the requested cities")
+            return 1
+
+    analyzer = HistoricalDataAnalyzer(df)
+    logger.info(f"Loaded {len(analyzer.df)} rows, {len(analyzer.cities)} cities in {time.perf_counter() - start:.2f}s")
+    try:
+        results = analyze(analyzer, args.window, args.threshold, args.method)
+    finally:
+        analyzer.close()
+    logger.info(f"Analyzed {len(results)} cities with {args.method} in {time.perf_counter() - start:.2f}s")
+
+    summary, seasonal, anomalies = results_to_frames(results)
+    write_frames({"summary": summary, "seasonal": seasonal, "anomalies": anomalies}, args.output_dir, args.format)
+    analyzer.seasonal_norms.save(os.path.join(args.output_dir, "seasonal_norms.npz"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from create_temperature_data import generate_temperature_data, make_city_catalog
+from historycal_analiz import HistoricalDataAnalyzer
+from results import ANOMALY_MODES
+
+"""
+Бенчмарк стратегий анализа: перебирает число городов, строк на город и окно,
+каждую стратегию (и режим аномалий: std - среднее/σ, mad - медиана/MAD) гоняет warmup раз вхолостую
+и repeats раз с perf_counter, отдельным прогоном под tracemalloc меряет пиковую память (только текущий процесс,
+память воркеров multiprocess/joblib сюда не попадает). Результат - JSON, чтобы сравнивать релизы.
+
+    python benchmark.py --cities 15 100 --rows 365 3650 --windows 7 30 --modes std mad --output bench.json
+"""
+
+
+def _run_sync(analyzer, cities, window_size, threshold, mode):
+    for city in cities:
+        analyzer.analyze_city_sync(city, window_size, threshold, use_cache=False, mode=mode)
+
+
+def _run_async(analyzer, cities, window_size, threshold, mode):
+    async def run_all():
+        await asyncio.gather(
+            *(analyzer.analyze_city_async(city, window_size, threshold, use_cache=False, mode=mode) for city in cities)
+        )
+
+    asyncio.run(run_all())
+
+
+def _parallel(method):
+    def run(analyzer, cities, window_size, threshold, mode):
+        analyzer.analyze_city_parallel(cities, window_size, threshold, method, use_cache=False, mode=mode)
+
+    return run
+
+
+def _run_vectorized(analyzer, cities, window_size, threshold, mode):
+    analyzer.analyze_all_cities(window_size, threshold, mode)
+
+
+STRATEGIES = {
+    "sync": _run_sync,
+    "joblib": _parallel("joblib"),
+    "multithread": _parallel("multithread"),
+    "multiprocess": _parallel("multiprocess"),
+    "auto": _parallel("auto"),
+    "async": _run_async,
+    "vectorized": _run_vectorized,
+}
+
+
+# синтетика через create_temperature_data: каталог из n городов, rows_per_city дней на город
+def make_dataset(n_cities: int, rows_per_city: int, seed: int = 42) -> pd.DataFrame:
+    return generate_temperature_data(make_city_catalog(n_cities, seed), periods=rows_per_city, seed=seed)
+
+
+def _percentile(values: list, q: float) -> float:
+    return float(np.percentile(values, q))
+
+
+# warmup + repeats по perf_counter, затем отдельный прогон под tracemalloc
+def measure(fn, warmup: int = 1, repeats: int = 5, track_memory: bool = True) -> dict:
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    peak = None
+    if track_memory:
+        tracemalloc.start()
+        try:
+            fn()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return {
+        "median_s": statistics.median(timings),
+        "p95_s": _percentile(timings, 95),
+        "min_s": min(timings),
+        "mean_s": statistics.fmean(timings),
+        "repeats": repeats,
+        "peak_memory_bytes": peak,
+    }
+
+
+# все стратегии на одном анализаторе; для бенчмарка страницы в app
+def benchmark_analyzer(
+    analyzer: HistoricalDataAnalyzer,
+    cities: list,
+    window_size: int,
+    threshold: float,
+    strategies: list | None = None,
+    warmup: int = 1,
+    repeats: int = 5,
+    track_memory: bool = True,
+    mode: str = "std",
+) -> dict:
+    results = {}
+    for name in strategies or list(STRATEGIES):
+        run = STRATEGIES[name]
+        results[name] = measure(
+            lambda: run(analyzer, cities, window_size, threshold, mode), warmup, repeats, track_memory
+        )
+    return results
+
+
+def run_suite(
+    city_counts: list,
+    rows_per_city: list,
+    windows: list,
+    threshold: float = 2.0,
+    strategies: list | None = None,
+    warmup: int = 1,
+    repeats: int = 5,
+    seed: int = 42,
+    track_memory: bool = True,
+    modes: list | None = None,
+) -> dict:
+    records = []
+    for n_cities in city_counts:
+        for rows in rows_per_city:
+            analyzer = HistoricalDataAnalyzer(make_dataset(n_cities, rows, seed))
+            for window_size, mode in ((w, m) for w in windows for m in modes or ["std"]):
+                timings = benchmark_analyzer(
+                    analyzer, analyzer.cities, window_size, threshold, strategies, warmup, repeats, track_memory, mode
+                )
+                for name, result in timings.items():
+                    records.append(
+                        {
+                            "strategy": name,
+                            "mode": mode,
+                            "n_cities": n_cities,
+                            "rows_per_city": rows,
+                            "window_size": window_size,
+                            "threshold": threshold,
+                            **result,
+                        }
+                    )
+                    print(
+                        f"{name:>12} mode={mode:<3} cities={n_cities:<6} rows={rows:<7} window={window_size:<3} "
+                        f"median={result['median_s']:.4f}s p95={result['p95_s']:.4f}s",
+                        file=sys.stderr,
+                    )
+    return {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "warmup": warmup,
+            "seed": seed,
+        },
+        "results": records,
+    }
+
+
+def main(argv: list | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк стратегий анализа температур")
+    parser.add_argument("--cities", type=int, nargs="+", default=[15])
+    parser.add_argument("--rows", type=int, nargs="+", default=[3650], help="строк на город")
+    parser.add_argument("--windows", type=int, nargs="+", default=[30])
+    parser.add_argument("--threshold", type=float, default=2.0)
+    parser.add_argument("--strategies", nargs="+", choices=list(STRATEGIES), default=None)
+    parser.add_argument("--modes", nargs="+", choices=list(ANOMALY_MODES), default=["std"], help="режимы аномалий")
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-memory", action="store_true", help="не мерить пиковую память")
+    parser.add_argument("--output", help="куда записать JSON (по умолчанию stdout)")
+    parser.add_argument(
+        "--calibrate", action="store_true", help="откалибровать модель стоимости для method='auto' и выйти"
+    )
+    parser.add_argument("--cost-model", help="файл модели стоимости (по умолчанию ANALYZER_COST_MODEL)")
+    args = parser.parse_args(argv)
+
+    if args.calibrate:
+        from execution_planner import ExecutionPlanner
+
+        ExecutionPlanner(args.cost_model).recalibrate()
+        return
+
+    report = run_suite(
+        args.cities,
+        args.rows,
+        args.windows,
+        args.threshold,
+        args.strategies,
+        args.warmup,
+        args.repeats,
+        args.seed,
+        not args.no_memory,
+        args.modes,
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    main()
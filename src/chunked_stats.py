@@ -0,0 +1,243 @@
+import sys
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from historycal_analiz import trend_from_moments
+
+"""
+Потоковый режим для CSV, который не влезает в память: файл читается кусками, по каждому куску
+считаются агрегаты и сливаются с накопленными (формулы Чана для среднего/M2 и ко-моментов).
+В памяти только состояние размера O(городов * сезонов) + гистограммы для квантилей.
+
+Квантили (median/q1/q3) приблизительные: гистограмма с шагом bin_width (по умолчанию 0.1°C),
+ошибка не больше половины шага. Пропуски (NaN) не входят ни в моменты, ни в гистограмму, ни в тренд,
+count в статистике - число строк, как у анализатора. Тренд считается по дробным дням от первого наблюдения города,
+для дневных данных это совпадает с calculate_trend.
+"""
+
+NS_PER_DAY = 86_400_000_000_000
+
+
+# слияние моментов (rows/count/mean/m2/min/max) двух таблиц с одинаковым индексом-ключом.
+# rows - все строки, count - строки с известной температурой
+def _merge_moments(a: pd.DataFrame, b: pd.DataFrame) -> pd.DataFrame:
+    if a.empty or b.empty:
+        return (b if a.empty else a).copy()
+    index = a.index.union(b.index)
+    a = a.reindex(index)
+    b = b.reindex(index)
+    na = a["count"].fillna(0)
+    nb = b["count"].fillna(0)
+    n = na + nb
+    delta = b["mean"].fillna(0) - a["mean"].fillna(0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        share = (nb / n).fillna(0)
+    return pd.DataFrame(
+        {
+            "rows": a["rows"].fillna(0) + b["rows"].fillna(0),
+            "count": n,
+            "mean": a["mean"].fillna(0) + delta * share,
+            "m2": a["m2"].fillna(0) + b["m2"].fillna(0) + delta**2 * na * share,
+            "min": np.fmin(a["min"], b["min"]),
+            "max": np.fmax(a["max"], b["max"]),
+        },
+        index=index,
+    )
+
+
+# слияние ко-моментов для регрессии temperature ~ days
+def _merge_comoments(a: pd.DataFrame, b: pd.DataFrame) -> pd.DataFrame:
+    if a.empty or b.empty:
+        return (b if a.empty else a).copy()
+    index = a.index.union(b.index)
+    a = a.reindex(index)
+    b = b.reindex(index)
+    na = a["count"].fillna(0)
+    nb = b["count"].fillna(0)
+    n = na + nb
+    dx = b["mean_x"].fillna(0) - a["mean_x"].fillna(0)
+    dy = b["mean_y"].fillna(0) - a["mean_y"].fillna(0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        share = (nb / n).fillna(0)
+    return pd.DataFrame(
+        {
+            "count": n,
+            "mean_x": a["mean_x"].fillna(0) + dx * share,
+            "mean_y": a["mean_y"].fillna(0) + dy * share,
+            "sxx": a["sxx"].fillna(0) + b["sxx"].fillna(0) + dx * dx * na * share,
+            "syy": a["syy"].fillna(0) + b["syy"].fillna(0) + dy * dy * na * share,
+            "sxy": a["sxy"].fillna(0) + b["sxy"].fillna(0) + dx * dy * na * share,
+            "first_x": np.fmin(a["first_x"], b["first_x"]),
+        },
+        index=index,
+    )
+
+
+class ChunkedCityStatistics:
+    def __init__(self, bin_width: float = 0.1, value_range: tuple = (-100.0, 70.0)):
+        self.bin_width = bin_width
+        self.value_range = value_range
+        self.n_bins = int(np.ceil((value_range[1] - value_range[0]) / bin_width))
+        self.seasonal_moments = pd.DataFrame(columns=["rows", "count", "mean", "m2", "min", "max"], dtype=float)
+        self.trend_moments = pd.DataFrame(
+            columns=["count", "mean_x", "mean_y", "sxx", "syy", "sxy", "first_x"], dtype=float
+        )
+        self._city_rows = {}
+        self._histograms = np.zeros((0, self.n_bins), dtype=np.int64)
+
+    @property
+    def cities(self) -> list:
+        return sorted(self._city_rows)
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        if len(chunk) == 0:
+            return
+        city = chunk["city"].astype(str)
+        season = chunk["season"].astype(str)
+        temps = chunk["temperature"].astype(float)
+        finite = np.isfinite(temps.to_numpy())
+        temps = temps.where(finite)
+
+        grouped = temps.groupby([city, season])
+        seasonal = grouped.agg(["size", "count", "mean", "min", "max"]).rename(columns={"size": "rows"})
+        seasonal["m2"] = grouped.var(ddof=0) * seasonal["count"]
+        seasonal.index.names = ["city", "season"]
+        self.seasonal_moments = _merge_moments(self.seasonal_moments, seasonal)
+
+        timestamps_ns = pd.to_datetime(chunk["timestamp"]).to_numpy().astype("datetime64[ns]").astype(np.int64)
+        days = pd.Series(timestamps_ns / NS_PER_DAY, index=chunk.index)
+        # начало отсчета дней - первая строка города (как в calculate_trend), ко-моменты - только по парам без NaN
+        first_x = days.groupby(city).min()
+        pair_city = city[finite]
+        x, y = days[finite], temps[finite]
+        dx = x - x.groupby(pair_city).transform("mean")
+        dy = y - y.groupby(pair_city).transform("mean")
+        centered = pd.DataFrame({"xx": dx * dx, "yy": dy * dy, "xy": dx * dy, "x": x, "y": y})
+        sums = centered.groupby(pair_city).agg(
+            {"xx": "sum", "yy": "sum", "xy": "sum", "x": "mean", "y": ["mean", "count"]}
+        )
+        trend = pd.DataFrame(
+            {
+                "count": sums[("y", "count")],
+                "mean_x": sums[("x", "mean")],
+                "mean_y": sums[("y", "mean")],
+                "sxx": sums[("xx", "sum")],
+                "syy": sums[("yy", "sum")],
+                "sxy": sums[("xy", "sum")],
+            }
+        ).reindex(first_x.index)
+        trend["count"] = trend["count"].fillna(0)
+        trend["first_x"] = first_x
+        self.trend_moments = _merge_comoments(self.trend_moments, trend)
+
+        for name in city.unique():
+            if name not in self._city_rows:
+                self._city_rows[name] = len(self._city_rows)
+        if len(self._city_rows) > len(self._histograms):
+            grown = np.zeros((len(self._city_rows), self.n_bins), dtype=np.int64)
+            grown[: len(self._histograms)] = self._histograms
+            self._histograms = grown
+        rows = city[finite].map(self._city_rows).to_numpy()
+        bins = ((temps[finite].to_numpy() - self.value_range[0]) / self.bin_width).astype(np.int64)
+        bins = np.clip(bins, 0, self.n_bins - 1)
+        self._histograms += np.bincount(rows * self.n_bins + bins, minlength=self._histograms.size).reshape(
+            self._histograms.shape
+        )
+
+    # слияние с другим накопителем (например, посчитанным по другой части файла в другом процессе)
+    def merge(self, other: "ChunkedCityStatistics") -> None:
+        if (other.bin_width, other.value_range) != (self.bin_width, self.value_range):
+            raise ValueError("Histogram settings differ")
+        self.seasonal_moments = _merge_moments(self.seasonal_moments, other.seasonal_moments)
+        self.trend_moments = _merge_comoments(self.trend_moments, other.trend_moments)
+        for name in other._city_rows:
+            if name not in self._city_rows:
+                self._city_rows[name] = len(self._city_rows)
+        histograms = np.zeros((len(self._city_rows), self.n_bins), dtype=np.int64)
+        histograms[: len(self._histograms)] = self._histograms
+        for name, row in other._city_rows.items():
+            histograms[self._city_rows[name]] += other._histograms[row]
+        self._histograms = histograms
+
+    def _quantile(self, city: str, q: float, low: float, high: float) -> float:
+        histogram = self._histograms[self._city_rows[city]]
+        cumulative = np.cumsum(histogram)
+        if cumulative[-1] == 0:
+            return np.nan
+        # позиция как у pandas quantile(interpolation="linear"), внутри корзины значения считаем равномерными
+        position = q * (cumulative[-1] - 1)
+        bin_index = int(np.searchsorted(cumulative, position, side="right"))
+        before = cumulative[bin_index - 1] if bin_index > 0 else 0
+        inside = (position - before + 0.5) / histogram[bin_index]
+        value = self.value_range[0] + self.bin_width * (bin_index + inside)
+        return float(min(max(value, low), high))
+
+    def calculate_basic_statistics(self, city: str) -> dict:
+        seasons = self.seasonal_moments.xs(city, level="city")
+        count = int(seasons["count"].sum())
+        mean = (seasons["count"] * seasons["mean"]).sum() / count if count else np.nan
+        m2 = seasons["m2"].sum() + (seasons["count"] * (seasons["mean"] - mean) ** 2).sum()
+        low, high = seasons["min"].min(), seasons["max"].max()
+        return {
+            "mean": mean,
+            "std": np.sqrt(m2 / (count - 1)) if count > 1 else np.nan,
+            "min": low,
+            "max": high,
+            "median": self._quantile(city, 0.5, low, high),
+            "q1": self._quantile(city, 0.25, low, high),
+            "q3": self._quantile(city, 0.75, low, high),
+            "count": int(seasons["rows"].sum()),
+        }
+
+    def calculate_seasonal_profile(self, city: str) -> pd.DataFrame:
+        seasons = self.seasonal_moments.xs(city, level="city").sort_index()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            std = np.sqrt(seasons["m2"] / (seasons["count"] - 1)).where(seasons["count"] > 1)
+        mean = seasons["mean"].where(seasons["count"] > 0)
+        seasonal_stats = pd.DataFrame({"mean": mean, "std": std, "count": seasons["count"].astype(int)})
+        seasonal_stats.index.name = "season"
+        seasonal_stats["lower"] = seasonal_stats["mean"] - seasonal_stats["std"]
+        seasonal_stats["upper"] = seasonal_stats["mean"] + seasonal_stats["std"]
+        return seasonal_stats
+
+    def calculate_trend(self, city: str) -> dict:
+        row = self.trend_moments.loc[[city]]
+        return trend_from_moments(
+            row["count"].to_numpy(),
+            (row["mean_x"] - row["first_x"]).to_numpy(),
+            row["mean_y"].to_numpy(),
+            row["sxx"].to_numpy(),
+            row["syy"].to_numpy(),
+            row["sxy"].to_numpy(),
+        )[0]
+
+    # то же, что analyze_city_sync, но без аномалий (для них нужен весь ряд)
+    def analyze_city(self, city: str) -> dict:
+        return {
+            "city": city,
+            "stats": self.calculate_basic_statistics(city),
+            "seasonal": self.calculate_seasonal_profile(city),
+            "trend": self.calculate_trend(city),
+        }
+
+
+# один проход по файлу с ограниченной памятью: в памяти только текущий кусок и агрегаты
+def read_csv_chunked(path, chunksize: int = 1_000_000, **kwargs) -> ChunkedCityStatistics:
+    statistics = ChunkedCityStatistics(**kwargs)
+    rows = 0
+    for chunk in pd.read_csv(path, chunksize=chunksize, usecols=["city", "timestamp", "temperature", "season"]):
+        statistics.update(chunk)
+        rows += len(chunk)
+        logger.debug(f"Processed {rows} rows from {path}")
+    logger.info(f"Chunked ingestion of {path}: {rows} rows, {len(statistics.cities)} cities")
+    return statistics
+
+
+if __name__ == "__main__":
+    # python chunked_stats.py temperature_data.csv [chunksize]
+    statistics = read_csv_chunked(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 1_000_000)
+    for city in statistics.cities:
+        result = statistics.analyze_city(city)
+        print(city, {k: round(float(v), 3) for k, v in result["stats"].items()}, result["trend"]["trend_description"])
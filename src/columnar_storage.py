@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+"""
+Колоночное хранилище: каталог с .npy на каждую колонку + meta.json.
+city и season лежат кодами категорий, temperature - float32, timestamp - datetime64[ns].
+.npy открывается через np.load(mmap_mode="r"), поэтому повторная загрузка не парсит и не копирует данные,
+страницы подтягиваются с диска по мере обращения. Строки отсортированы по (city, timestamp),
+так что HistoricalDataAnalyzer не пересортировывает их.
+"""
+
+STORAGE_VERSION = 1
+CSV_DTYPES = {"city": "category", "temperature": "float32", "season": "category"}
+
+
+# чтение CSV сразу в нужные типы, чтобы анализатору не пришлось копировать и перепарсивать df.
+# Отсутствующие колонки не ломают чтение - их проверяет вызывающий код
+def read_csv_typed(path_or_buffer) -> pd.DataFrame:
+    df = pd.read_csv(path_or_buffer, dtype=CSV_DTYPES)
+    if "timestamp" in df.columns:
+        df["timestamp"] = pd.to_datetime(df["timestamp"])
+    return df
+
+
+def _codes_dtype(n_categories: int):
+    return np.int8 if n_categories < 128 else np.int16 if n_categories < 32768 else np.int32
+
+
+def save_columnar(df: pd.DataFrame, out_dir: str, temperature_dtype=np.float32) -> None:
+    df = df.sort_values(["city", "timestamp"], kind="stable") if len(df) else df
+    os.makedirs(out_dir, exist_ok=True)
+    meta = {"version": STORAGE_VERSION, "rows": len(df), "categories": {}}
+    for column in ("city", "season"):
+        values = df[column].astype("category")
+        categories = [str(c) for c in values.cat.categories]
+        meta["categories"][column] = categories
+        codes = values.cat.codes.to_numpy().astype(_codes_dtype(len(categories)))
+        np.save(os.path.join(out_dir, f"{column}.npy"), codes)
+    np.save(os.path.join(out_dir, "timestamp.npy"), pd.to_datetime(df["timestamp"]).to_numpy(dtype="datetime64[ns]"))
+    np.save(os.path.join(out_dir, "temperature.npy"), df["temperature"].to_numpy(dtype=temperature_dtype))
+    with open(os.path.join(out_dir, "meta.json"), "w") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    logger.info(f"Saved {len(df)} rows to columnar storage {out_dir}")
+
+
+def load_columnar(out_dir: str, mmap: bool = True) -> pd.DataFrame:
+    with open(os.path.join(out_dir, "meta.json")) as f:
+        meta = json.load(f)
+    if meta.get("version") != STORAGE_VERSION:
+        raise ValueError(f"Unsupported columnar storage version: {meta.get('version')}")
+    mmap_mode = "r" if mmap else None
+
+    def column(name: str) -> np.ndarray:
+        return np.load(os.path.join(out_dir, f"{name}.npy"), mmap_mode=mmap_mode)
+
+    columns = {
+        name: pd.Categorical.from_codes(column(name), categories=meta["categories"][name])
+        for name in ("city", "season")
+    }
+    columns["timestamp"] = column("timestamp")
+    columns["temperature"] = column("temperature")
+    return pd.DataFrame(
+        {name: columns[name] for name in ("city", "timestamp", "temperature", "season")},
+        copy=False,
+    )
+
+
+def _storage_dir(csv_path: str) -> str:
+    return f"{csv_path}.columnar"
+
+
+def _source_signature(csv_path: str) -> str:
+    st = os.stat(csv_path)
+    return hashlib.sha1(f"{os.path.abspath(csv_path)}:{st.st_size}:{st.st_mtime_ns}".encode()).hexdigest()
+
+
+# CSV конвертируется один раз (рядом кладется <csv>.columnar), дальше открывается через mmap.
+# Если CSV поменялся (размер/mtime), хранилище пересобирается
+def load_dataset(path: str, mmap: bool = True) -> pd.DataFrame:
+    if os.path.isdir(path):
+        return load_columnar(path, mmap)
+
+    out_dir = _storage_dir(path)
+    signature_path = os.path.join(out_dir, "source.sha1")
+    signature = _source_signature(path)
+    if os.path.exists(signature_path):
+        with open(signature_path) as f:
+            if f.read() == signature:
+                return load_columnar(out_dir, mmap)
+
+    logger.info(f"Converting {path} to columnar storage")
+    save_columnar(read_csv_typed(path), out_dir)
+    with open(signature_path, "w") as f:
+        f.write(signature)
+    return load_columnar(out_dir, mmap)
+
+
+if __name__ == "__main__":
+    # python columnar_storage.py temperature_data.csv [out_dir]
+    if len(sys.argv) > 2:
+        save_columnar(read_csv_typed(sys.argv[1]), sys.argv[2])
+    else:
+        load_dataset(sys.argv[1])
@@ -1,3 +1,7 @@
+import argparse
+import json
+import os
+
 import numpy as np
 import pandas as pd
 
@@ -38,25 +42,197 @@ month_to_season = {
 }
 
 
-# Генерация данных о температуре
-def generate_realistic_temperature_data(cities, num_years=10):
-    dates = pd.date_range(start="2010-01-01", periods=365 * num_years, freq="D")
-    data = []
+SEASONS = ["autumn", "spring", "summer", "winter"]  # порядок категорий как в columnar_storage (по алфавиту)
+MONTH_SEASON_CODES = np.array([0] + [SEASONS.index(month_to_season[m]) for m in range(1, 13)], dtype=np.int8)
+
+
+# синтетический каталог на n городов: базовые города + их "соседи" со сдвигом сезонных норм
+def make_city_catalog(n_cities: int, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    base = list(seasonal_temperatures.items())
+    catalog = {}
+    for i in range(n_cities):
+        name, seasons = base[i % len(base)]
+        if i < len(base):
+            catalog[name] = dict(seasons)
+        else:
+            shift = rng.normal(0, 3)
+            catalog[f"{name} {i // len(base)}"] = {season: temp + shift for season, temp in seasons.items()}
+    return catalog
+
+
+# температуры одного города: сезонная норма (ступенькой по сезонам или гладкой синусоидой) + тренд + шум.
+# Свой генератор на город (seed, номер города) - результат не зависит от того, какими кусками пишем
+def _city_temperatures(
+    norms: dict, dates: pd.DatetimeIndex, season_codes: np.ndarray, rng, noise_std, trend_per_year, seasonality
+):
+    if seasonality == "step":
+        season_means = np.array([norms[season] for season in SEASONS])
+        base = season_means[season_codes]
+    elif seasonality == "smooth":
+        # максимум в середине лета (~200-й день), амплитуда - половина разницы лето/зима
+        mean = np.mean([norms[season] for season in SEASONS])
+        amplitude = (norms["summer"] - norms["winter"]) / 2
+        base = mean + amplitude * np.cos(2 * np.pi * (dates.dayofyear.to_numpy() - 200) / 365.25)
+    else:
+        raise ValueError(f"Unknown seasonality: {seasonality}")
+    years = (dates - dates[0]).days.to_numpy() / 365.25
+    return base + trend_per_year * years + rng.normal(0, noise_std, len(dates))
+
+
+def _iter_chunks(catalog, dates, seed, noise_std, trend_per_year, seasonality, cities_per_chunk):
+    season_codes = MONTH_SEASON_CODES[dates.month.to_numpy()]
+    cities = sorted(catalog)
+    for chunk_start in range(0, len(cities), cities_per_chunk):
+        chunk_cities = cities[chunk_start : chunk_start + cities_per_chunk]
+        temperatures = np.concatenate(
+            [
+                _city_temperatures(
+                    catalog[city],
+                    dates,
+                    season_codes,
+                    np.random.default_rng([seed, chunk_start + i]),
+                    noise_std,
+                    trend_per_year,
+                    seasonality,
+                )
+                for i, city in enumerate(chunk_cities)
+            ]
+        )
+        city_codes = np.repeat(np.arange(chunk_start, chunk_start + len(chunk_cities)), len(dates))
+        yield cities, city_codes, np.tile(dates.to_numpy(), len(chunk_cities)), temperatures, np.tile(
+            season_codes, len(chunk_cities)
+        )
+
+
+def _chunk_frame(cities, city_codes, timestamps, temperatures, season_codes) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "city": pd.Categorical.from_codes(city_codes, categories=cities),
+            "timestamp": timestamps,
+            "temperature": temperatures,
+            "season": pd.Categorical.from_codes(season_codes, categories=SEASONS),
+        }
+    )
 
-    for city in cities:
-        for date in dates:
-            season = month_to_season[date.month]
-            mean_temp = seasonal_temperatures[city][season]
-            # Добавляем случайное отклонение
-            temperature = np.random.normal(loc=mean_temp, scale=5)
-            data.append({"city": city, "timestamp": date, "temperature": temperature})
 
-    df = pd.DataFrame(data)
-    df["season"] = df["timestamp"].dt.month.map(lambda x: month_to_season[x])
+# векторизованная генерация в память
+def generate_temperature_data(
+    catalog: dict | None = None,
+    start: str = "2010-01-01",
+    periods: int = 3650,
+    freq: str = "D",
+    noise_std: float = 5.0,
+    trend_per_year: float = 0.0,
+    seasonality: str = "step",
+    seed: int = 0,
+) -> pd.DataFrame:
+    catalog = catalog if catalog is not None else seasonal_temperatures
+    dates = pd.date_range(start=start, periods=periods, freq=freq)
+    chunks = [
+        _chunk_frame(*chunk)
+        for chunk in _iter_chunks(catalog, dates, seed, noise_std, trend_per_year, seasonality, 1000)
+    ]
+    return pd.concat(chunks, ignore_index=True) if chunks else _chunk_frame([], [], [], [], [])
+
+
+# запись кусками по cities_per_chunk городов, в памяти только текущий кусок.
+# fmt="csv" - обычный CSV, fmt="columnar" - каталог для columnar_storage.load_columnar (mmap)
+def write_temperature_data(
+    path: str,
+    catalog: dict | None = None,
+    start: str = "2010-01-01",
+    periods: int = 3650,
+    freq: str = "D",
+    noise_std: float = 5.0,
+    trend_per_year: float = 0.0,
+    seasonality: str = "step",
+    seed: int = 0,
+    fmt: str = "csv",
+    cities_per_chunk: int = 100,
+) -> int:
+    catalog = catalog if catalog is not None else seasonal_temperatures
+    dates = pd.date_range(start=start, periods=periods, freq=freq)
+    chunks = _iter_chunks(catalog, dates, seed, noise_std, trend_per_year, seasonality, cities_per_chunk)
+    total = len(catalog) * len(dates)
+
+    if fmt == "csv":
+        with open(path, "w", newline="") as f:
+            for i, chunk in enumerate(chunks):
+                _chunk_frame(*chunk).to_csv(f, index=False, header=i == 0)
+        return total
+    if fmt != "columnar":
+        raise ValueError(f"Unknown format: {fmt}")
+
+    from columnar_storage import STORAGE_VERSION, _codes_dtype
+
+    os.makedirs(path, exist_ok=True)
+    columns = {
+        "city": np.lib.format.open_memmap(
+            os.path.join(path, "city.npy"), mode="w+", dtype=_codes_dtype(len(catalog)), shape=(total,)
+        ),
+        "timestamp": np.lib.format.open_memmap(
+            os.path.join(path, "timestamp.npy"), mode="w+", dtype="datetime64[ns]", shape=(total,)
+        ),
+        "temperature": np.lib.format.open_memmap(
+            os.path.join(path, "temperature.npy"), mode="w+", dtype=np.float32, shape=(total,)
+        ),
+        "season": np.lib.format.open_memmap(os.path.join(path, "season.npy"), mode="w+", dtype=np.int8, shape=(total,)),
+    }
+    offset = 0
+    for cities, city_codes, timestamps, temperatures, season_codes in chunks:
+        stop = offset + len(city_codes)
+        columns["city"][offset:stop] = city_codes
+        columns["timestamp"][offset:stop] = timestamps
+        columns["temperature"][offset:stop] = temperatures
+        columns["season"][offset:stop] = season_codes
+        offset = stop
+    for column in columns.values():
+        column.flush()
+    meta = {
+        "version": STORAGE_VERSION,
+        "rows": total,
+        "categories": {"city": sorted(catalog), "season": SEASONS},
+    }
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    return total
+
+
+# Генерация данных о температуре (прежний интерфейс, теперь через векторизованный генератор)
+def generate_realistic_temperature_data(cities, num_years=10, seed=None):
+    catalog = {city: seasonal_temperatures[city] for city in cities}
+    if seed is None:
+        seed = int(np.random.randint(0, 2**31 - 1))
+    df = generate_temperature_data(catalog, periods=365 * num_years, seed=seed)
+    df["city"] = df["city"].astype(str)
+    df["season"] = df["season"].astype(str)
     return df
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Генерация синтетических температур")
+    parser.add_argument("--cities", type=int, default=len(seasonal_temperatures), help="число городов в каталоге")
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--start", default="2010-01-01")
+    parser.add_argument("--noise", type=float, default=5.0)
+    parser.add_argument("--trend", type=float, default=0.0, help="°C в год")
+    parser.add_argument("--seasonality", choices=["step", "smooth"], default="step")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--format", choices=["csv", "columnar"], default="csv")
+    parser.add_argument("--output", default="temperature_data.csv")
+    args = parser.parse_args()
+
     # Генерация данных
-    data = generate_realistic_temperature_data(list(seasonal_temperatures.keys()))
-    data.to_csv("temperature_data.csv", index=False)
+    rows = write_temperature_data(
+        args.output,
+        make_city_catalog(args.cities, args.seed),
+        start=args.start,
+        periods=365 * args.years,
+        noise_std=args.noise,
+        trend_per_year=args.trend,
+        seasonality=args.seasonality,
+        seed=args.seed,
+        fmt=args.format,
+    )
+    print(f"{rows} rows -> {args.output}")
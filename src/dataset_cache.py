@@ -0,0 +1,134 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from loguru import logger
+
+from columnar_storage import read_csv_typed
+from historycal_analiz import HistoricalDataAnalyzer
+
+"""
+Общий на процесс кэш готовых анализаторов по хэшу содержимого загруженного CSV.
+Streamlit перезапускает скрипт на каждое действие в интерфейсе, и без кэша каждый rerun заново
+читал CSV и строил анализатор (копия df, парсинг дат, сортировка, отпечаток). Здесь файл с тем же
+содержимым парсится один раз, все сессии (в том числе разные пользователи с одним файлом) получают
+один и тот же анализатор и одну копию данных в памяти.
+
+Размер кэша ограничен бюджетом памяти (по memory_usage df анализатора) и числом записей,
+вытесняются давно не использованные; вместе с анализатором уходят его результаты из result_cache.
+Пул воркеров вытесненного анализатора не останавливается: другие сессии могут еще считать на нем,
+пул закроет weakref.finalize, когда анализатор больше никому не нужен. Одновременная загрузка одного файла из нескольких сессий парсит его один раз:
+остальные ждут результата первой. Бюджет - ANALYZER_CACHE_MB (по умолчанию 1024 МБ).
+"""
+
+REQUIRED_COLUMNS = ["city", "timestamp", "temperature", "season"]
+
+
+# хэш содержимого загрузки; blake2b быстрее sha на больших файлах
+def upload_digest(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+def load_analyzer(data: bytes, fingerprint: str | None = None) -> HistoricalDataAnalyzer:
+    df = read_csv_typed(io.BytesIO(data))
+    missing = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    if missing:
+        raise ValueError(f'Отсутствуют колонки: {", ".join(missing)}')
+    return HistoricalDataAnalyzer(df, fingerprint=fingerprint)
+
+
+def _frame_bytes(analyzer: HistoricalDataAnalyzer) -> int:
+    return int(analyzer.df.memory_usage(index=True, deep=True).sum())
+
+
+class AnalyzerCache:
+    def __init__(self, max_bytes: int = 1024 * 2**20, max_entries: int = 16):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # анализатор для содержимого data; digest можно передать, если он уже посчитан (например, в session_state)
+    def get_or_load(self, data: bytes, digest: str | None = None) -> HistoricalDataAnalyzer:
+        digest = digest or upload_digest(data)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return entry[0]
+            future = self._loading.get(digest)
+            owner = future is None
+            if owner:
+                future = self._loading[digest] = Future()
+                self.misses += 1
+        if not owner:
+            return future.result()
+
+        try:
+            # отпечаток данных = хэш загрузки, анализатору не нужно хэшировать df заново
+            analyzer = load_analyzer(data, fingerprint=f"upload-{digest}")
+        except BaseException as e:
+            with self._lock:
+                del self._loading[digest]
+            future.set_exception(e)
+            raise
+        size = _frame_bytes(analyzer)
+        with self._lock:
+            del self._loading[digest]
+            self._entries[digest] = (analyzer, size)
+            evicted = self._evict()
+        future.set_result(analyzer)
+        logger.info(f"Cached analyzer {digest[:12]}: {len(analyzer.df)} rows, {size / 2**20:.1f} MB")
+        for old in evicted:
+            self._release(old)
+        return analyzer
+
+    # вытесняем LRU, пока не уложимся в бюджет; только что загруженный (последний) остается,
+    # даже если он один больше бюджета
+    def _evict(self) -> list:
+        evicted = []
+        total = sum(size for _, size in self._entries.values())
+        while len(self._entries) > 1 and (total > self.max_bytes or len(self._entries) > self.max_entries):
+            digest, (analyzer, size) = next(iter(self._entries.items()))
+            del self._entries[digest]
+            total -= size
+            self.evictions += 1
+            evicted.append(analyzer)
+        if total > self.max_bytes:
+            logger.warning(f"Analyzer cache over budget: {total / 2**20:.1f} MB > {self.max_bytes / 2**20:.1f} MB")
+        return evicted
+
+    # только забываем анализатор: сессии, которые еще держат его, продолжают работать на том же пуле
+    # (результаты считаются заново), а пул закроется при сборке анализатора
+    def _release(self, analyzer: HistoricalDataAnalyzer) -> None:
+        analyzer.results.drop(analyzer.fingerprint)
+        logger.info(f"Evicted analyzer {analyzer.fingerprint}")
+
+    def clear(self) -> None:
+        with self._lock:
+            analyzers = [analyzer for analyzer, _ in self._entries.values()]
+            self._entries.clear()
+        for analyzer in analyzers:
+            self._release(analyzer)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(size for _, size in self._entries.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+analyzer_cache = AnalyzerCache(max_bytes=int(float(os.environ.get("ANALYZER_CACHE_MB", 1024)) * 2**20))
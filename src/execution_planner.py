@@ -0,0 +1,307 @@
+import json
+import math
+import os
+import platform
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+"""
+Планировщик для analyze_city_parallel(method="auto"): сам выбирает sync / потоки / процессы / векторный
+проход и нарезку задач для процессов. Лучший способ сильно зависит от данных (см. выводы в api_utils):
+на мелких городах процессы проигрывают из-за накладных расходов, на больших выигрывают, а векторный
+проход выгоден, когда нужны почти все города.
+
+Модель стоимости линейная, коэффициенты меряются коротким микробенчмарком на синтетике (пара секунд,
+включая запуск пула процессов). Калибровка запускается явно, не внутри запроса приложения:
+
+    python benchmark.py --calibrate [--cost-model путь]
+
+и сохраняется в JSON (--cost-model, ANALYZER_COST_MODEL или ~/.cache/temperature_analysis/cost_model.json).
+Планировщик только читает этот файл; если его нет или он снят при другом числе ядер или других версиях
+Python/NumPy/pandas, используется DEFAULT_MODEL - грубые коэффициенты с осторожной оценкой процессов.
+
+    sync        = per_city * n + per_row * rows
+    multithread = sync / min(thread_speedup, n)
+    multiprocess= [startup, если пул не запущен] + per_batch * ceil(batches / workers)
+                  + max(sync / workers, самая тяжелая пачка) / efficiency
+    vectorized  = fixed + per_city * все города + per_row * все строки (проход считает весь набор)
+
+В режиме mad к per_row добавляется стоимость скользящей медианы. Уже закэшированные города для sync
+и потоков считаются бесплатными.
+"""
+
+MODEL_VERSION = 2
+STRATEGIES = ("sync", "multithread", "multiprocess", "vectorized")
+# (городов, строк на город) для калибровки: форм больше, чем неизвестных в модели (до трех),
+# чтобы шум замеров усреднялся, а не уходил целиком в коэффициенты. Последняя - самая длинная,
+# на ней же меряются mad, потоки и процессы
+CALIBRATION_SHAPES = ((32, 180), (16, 365), (8, 730), (4, 1460), (2, 4380), (4, 4380))
+# модель без калибровки: порядок величин для одного ядра, запуск пула процессов - с запасом (spawn)
+DEFAULT_MODEL = {
+    "meta": {"version": MODEL_VERSION, "source": "default"},
+    "sync": {"per_city": 2e-3, "per_row": 1e-6},
+    "vectorized": {"fixed": 5e-3, "per_city": 1e-4, "per_row": 3e-7},
+    "mad_per_row": 6e-6,
+    "thread_speedup": 1.0,
+    "process": {"startup": 0.5, "per_batch": 5e-3, "efficiency": 0.7},
+}
+# целевая длительность пачки процессов относительно накладных расходов на пачку
+_BATCH_OVERHEAD_RATIO = 10
+
+
+def available_cores() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0)) or 1
+    return os.cpu_count() or 1
+
+
+def default_model_path() -> str:
+    default = os.path.join(os.path.expanduser("~"), ".cache", "temperature_analysis", "cost_model.json")
+    return os.environ.get("ANALYZER_COST_MODEL", default)
+
+
+def _environment() -> dict:
+    return {
+        "version": MODEL_VERSION,
+        "cores": available_cores(),
+        "python": ".".join(platform.python_version_tuple()[:2]),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+    }
+
+
+# лучшее из нескольких повторов (первый прогон - прогрев)
+def _best_time(fn, repeats: int = 3) -> float:
+    fn()
+    best = math.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+# коэффициенты a * cities + b * rows (+ c) по замерам, неотрицательные: слагаемое с отрицательным
+# коэффициентом убирается из модели и остальные подбираются заново (NNLS для двух-трех неизвестных)
+def _fit(samples: list, with_fixed: bool) -> list:
+    design = np.array([[cities, rows] + ([1.0] if with_fixed else []) for cities, rows, _ in samples], dtype=float)
+    times = np.array([seconds for _, _, seconds in samples])
+    if len(samples) <= design.shape[1]:
+        raise ValueError(f"Need more than {design.shape[1]} calibration samples, got {len(samples)}")
+    active = list(range(design.shape[1]))
+    coefficients = np.zeros(design.shape[1])
+    while active:
+        solution = np.linalg.lstsq(design[:, active], times, rcond=None)[0]
+        if (solution >= 0).all():
+            coefficients[active] = solution
+            break
+        dropped = active.pop(int(np.argmin(solution)))
+        logger.warning(f"Cost model term {('per_city', 'per_row', 'fixed')[dropped]} fitted negative, dropping it")
+    residual = times - design @ coefficients
+    logger.info(f"Cost model fit: max relative error {np.max(np.abs(residual) / times):.0%} over {len(samples)} shapes")
+    return [float(value) for value in coefficients]
+
+
+def calibrate(seed: int = 7) -> dict:
+    from benchmark import make_dataset
+    from historycal_analiz import HistoricalDataAnalyzer, ResultCache
+
+    started = time.perf_counter()
+    window_size, threshold = 30, 2.0
+    sync_samples, vectorized_samples = [], []
+    analyzer = None
+    for n_cities, rows_per_city in CALIBRATION_SHAPES:
+        analyzer = HistoricalDataAnalyzer(make_dataset(n_cities, rows_per_city, seed), ResultCache(0))
+        cities = analyzer.cities
+        rows = len(analyzer.df)
+
+        def run_sync(mode="std"):
+            for city in cities:
+                analyzer.analyze_city_sync(city, window_size, threshold, use_cache=False, mode=mode)
+
+        sync_samples.append((len(cities), rows, _best_time(run_sync)))
+        vectorized_time = _best_time(lambda: analyzer.analyze_all_cities(window_size, threshold))
+        vectorized_samples.append((len(cities), rows, vectorized_time))
+
+    sync_per_city, sync_per_row = _fit(sync_samples, with_fixed=False)
+    vectorized_per_city, vectorized_per_row, vectorized_fixed = _fit(vectorized_samples, with_fixed=True)
+
+    # последний (самый длинный) набор: надбавка mad, потоки и процессы
+    cities = analyzer.cities
+    rows = len(analyzer.df)
+    sync_time = sync_samples[-1][2]
+    mad_time = _best_time(lambda: run_sync("mad"), repeats=1)
+    mad_per_row = max(mad_time - sync_time, 0.0) / rows
+    thread_time = _best_time(
+        lambda: analyzer.analyze_city_parallel(cities, window_size, threshold, "multithread", use_cache=False)
+    )
+    thread_speedup = sync_time / thread_time if thread_time > 0 else 1.0
+
+    pool = analyzer.worker_pool()
+    tasks = [(city, *analyzer.city_offsets[city]) for city in cities]
+    try:
+        start = time.perf_counter()
+        pool.map(tasks[:1], window_size, threshold)
+        startup = time.perf_counter() - start
+        tiny = [(cities[0], tasks[0][1], tasks[0][1] + 10)]
+        per_batch = _best_time(lambda: pool.map(tiny, window_size, threshold))
+        workers = min(pool.max_workers, len(tasks))
+        process_time = _best_time(lambda: pool.map(tasks, window_size, threshold, rows_per_batch=1))
+        compute = max(process_time - per_batch * math.ceil(len(tasks) / workers), 1e-9)
+        efficiency = min(max(sync_time / (compute * workers), 0.05), 1.0)
+    finally:
+        analyzer.close()
+
+    model = {
+        "meta": {**_environment(), "created_at": datetime.now(timezone.utc).isoformat()},
+        "sync": {"per_city": sync_per_city, "per_row": sync_per_row},
+        "vectorized": {"fixed": vectorized_fixed, "per_city": vectorized_per_city, "per_row": vectorized_per_row},
+        "mad_per_row": mad_per_row,
+        "thread_speedup": max(thread_speedup, 0.1),
+        "process": {"startup": max(startup - per_batch, 0.0), "per_batch": per_batch, "efficiency": efficiency},
+    }
+    logger.info(f"Calibrated cost model in {time.perf_counter() - started:.1f}s: {model}")
+    return model
+
+
+# строки пачек при той же жадной нарезке, что и worker_pool.make_batches(rows_per_batch=...)
+def _batch_rows(rows_per_city: list, rows_per_batch: int) -> list:
+    batches, rows = [], 0
+    for city_rows in rows_per_city:
+        rows += city_rows
+        if rows >= rows_per_batch:
+            batches.append(rows)
+            rows = 0
+    return batches + [rows] if rows else batches
+
+
+class ExecutionPlan:
+    __slots__ = ("strategy", "workers", "rows_per_batch", "batches", "estimates", "reason")
+
+    def __init__(
+        self, strategy: str, workers: int, rows_per_batch: int | None, batches: int, estimates: dict, reason: str
+    ):
+        self.strategy = strategy
+        self.workers = workers
+        self.rows_per_batch = rows_per_batch
+        self.batches = batches
+        self.estimates = estimates
+        self.reason = reason
+
+    def __repr__(self) -> str:
+        return f"ExecutionPlan(strategy={self.strategy!r}, workers={self.workers}, batches={self.batches})"
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+# результаты analyze_city_parallel(method="auto"): обычный dict город -> анализ, плюс выбранный план
+class PlannedResults(dict):
+    def __init__(self, results: dict, plan: ExecutionPlan):
+        super().__init__(results)
+        self.plan = plan
+
+
+class ExecutionPlanner:
+    def __init__(self, model_path: str | None = None, cores: int | None = None):
+        self.model_path = model_path or default_model_path()
+        self.cores = cores or available_cores()
+        self._model = None
+
+    # модель с диска, если она снята в этом же окружении, иначе DEFAULT_MODEL (без калибровки на лету)
+    @property
+    def model(self) -> dict:
+        if self._model is None:
+            self._model = self._load()
+            if self._model is None:
+                logger.info(f"No cost model at {self.model_path}, using defaults (python benchmark.py --calibrate)")
+                self._model = DEFAULT_MODEL
+        return self._model
+
+    def _load(self) -> dict | None:
+        try:
+            with open(self.model_path) as f:
+                model = json.load(f)
+        except (OSError, ValueError):
+            return None
+        meta = {key: value for key, value in model.get("meta", {}).items() if key != "created_at"}
+        if meta != _environment():
+            logger.warning(f"Cost model {self.model_path} was calibrated for {meta}, not {_environment()}")
+            return None
+        return model
+
+    # калибровка и сохранение в model_path (из benchmark.py --calibrate)
+    def recalibrate(self) -> dict:
+        model = calibrate()
+        os.makedirs(os.path.dirname(self.model_path) or ".", exist_ok=True)
+        with open(self.model_path, "w") as f:
+            json.dump(model, f, indent=2)
+        logger.info(f"Saved cost model to {self.model_path}")
+        self._model = model
+        return model
+
+    # rows_per_city - строки запрошенных городов, cached - сколько из них уже в кэше результатов;
+    # total_rows/total_cities - весь набор (векторный проход считает все города)
+    def plan(
+        self,
+        rows_per_city: list,
+        total_rows: int,
+        total_cities: int,
+        mode: str = "std",
+        cached: list | None = None,
+        pool_started: bool = False,
+    ) -> ExecutionPlan:
+        model = self.model
+        n_cities = len(rows_per_city)
+        rows = int(sum(rows_per_city))
+        cached = cached or [False] * n_cities
+        if n_cities == 0 or all(cached):
+            reason = "nothing to compute" if n_cities == 0 else "all results cached"
+            return ExecutionPlan("sync", 1, None, 0, {"sync": 0.0}, reason)
+
+        mad_per_row = model["mad_per_row"] if mode == "mad" else 0.0
+        sync_per_row = model["sync"]["per_row"] + mad_per_row
+        uncached_cities = sum(1 for hit in cached if not hit)
+        uncached_rows = sum(r for r, hit in zip(rows_per_city, cached) if not hit)
+        sync = model["sync"]["per_city"] * uncached_cities + sync_per_row * uncached_rows
+        full_sync = model["sync"]["per_city"] * n_cities + sync_per_row * rows
+
+        process = model["process"]
+        workers = min(self.cores, n_cities)
+        # пачка должна работать заметно дольше накладных расходов на нее, но пачек - хотя бы по несколько на воркер
+        min_batch_rows = _BATCH_OVERHEAD_RATIO * process["per_batch"] / max(sync_per_row, 1e-12)
+        rows_per_batch = int(max(min_batch_rows, rows / (workers * 4), 1))
+        batch_rows = _batch_rows(rows_per_city, rows_per_batch)
+        batches = len(batch_rows)
+        # время - не меньше самой тяжелой пачки (крупный город не делится между воркерами)
+        row_share = full_sync / max(rows, 1)
+        compute = max(full_sync / min(workers, batches), max(batch_rows) * row_share) / process["efficiency"]
+        multiprocess = (
+            (0.0 if pool_started else process["startup"])
+            + process["per_batch"] * math.ceil(batches / workers)
+            + compute
+        )
+        vectorized_model = model["vectorized"]
+        estimates = {
+            "sync": sync,
+            "multithread": sync / max(min(model["thread_speedup"], uncached_cities), 0.1),
+            "multiprocess": multiprocess if self.cores > 1 and n_cities > 1 else math.inf,
+            "vectorized": vectorized_model["fixed"]
+            + vectorized_model["per_city"] * total_cities
+            + (vectorized_model["per_row"] + mad_per_row) * total_rows,
+        }
+        strategy = min(STRATEGIES, key=lambda name: estimates[name])
+        reason = (
+            f"{n_cities} cities, {rows} rows of {total_rows}, {self.cores} cores: "
+            f"{strategy} ~{estimates[strategy] * 1000:.1f} ms"
+        )
+        if strategy != "multiprocess":
+            return ExecutionPlan(strategy, 1, None, n_cities, estimates, reason)
+        return ExecutionPlan(strategy, min(workers, batches), rows_per_batch, batches, estimates, reason)
+
+
+execution_planner = ExecutionPlanner()
@@ -0,0 +1,159 @@
+import argparse
+import asyncio
+import random
+import threading
+import time
+import zlib
+from collections import Counter, deque
+
+from aiohttp import web
+from loguru import logger
+
+"""
+Локальный фейковый OpenWeatherMap (/data/2.5/weather) для проверки планировщика запросов из api_utils:
+задержка ответа, лимит запросов в окне с ответом 429 + Retry-After, случайные 5xx, неизвестные города (404),
+неверный ключ (401). Считает запросы по городам, чтобы было видно склейку одинаковых запросов.
+
+    python fake_weather_server.py --port 8765 --latency 0.3 --rate-limit 30 --window 60 --fail-rate 0.1
+
+    with FakeWeatherServer(latency=0.1, rate_limit=5, window=1) as server:
+        configure_weather_scheduler(rate_per_minute=600)
+        get_current_weather_sync("Moscow", server.api_key, api_base=server.url)
+"""
+
+
+class FakeWeatherServer:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        rate_limit: int | None = None,
+        window: float = 60.0,
+        retry_after: float = 1.0,
+        fail_rate: float = 0.0,
+        api_key: str = "test",
+        missing_cities: tuple = ("Nowhere",),
+        seed: int | None = None,
+    ):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.window = window
+        self.retry_after = retry_after
+        self.fail_rate = fail_rate
+        self.api_key = api_key
+        self.missing_cities = set(missing_cities)
+        self.requests = Counter()
+        self.statuses = Counter()
+        self._recent = deque()
+        self._random = random.Random(seed)
+        self._loop = None
+        self._runner = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/data/2.5/weather"
+
+    def _throttled(self) -> bool:
+        if self.rate_limit is None:
+            return False
+        now = time.monotonic()
+        while self._recent and now - self._recent[0] > self.window:
+            self._recent.popleft()
+        if len(self._recent) >= self.rate_limit:
+            return True
+        self._recent.append(now)
+        return False
+
+    def _respond(self, status: int, payload: dict, headers: dict | None = None) -> web.Response:
+        self.statuses[status] += 1
+        return web.json_response(payload, status=status, headers=headers)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        city = request.query.get("q", "")
+        self.requests[city] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if request.query.get("appid") != self.api_key:
+            return self._respond(401, {"cod": 401, "message": "Invalid API key"})
+        if self._throttled():
+            return self._respond(
+                429, {"cod": 429, "message": "Too many requests"}, {"Retry-After": str(self.retry_after)}
+            )
+        if self.fail_rate and self._random.random() < self.fail_rate:
+            return self._respond(503, {"cod": 503, "message": "Service unavailable"})
+        if city in self.missing_cities:
+            return self._respond(404, {"cod": "404", "message": "city not found"})
+        # стабильная "погода" по имени города
+        temperature = round(zlib.crc32(city.encode()) % 600 / 10 - 20, 1)
+        return self._respond(
+            200,
+            {
+                "main": {"temp": temperature},
+                "weather": [{"description": "clear sky"}],
+                "dt": int(time.time()),
+                "name": city,
+            },
+        )
+
+    def _make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/data/2.5/weather", self.handle)
+        return app
+
+    # сервер в отдельном потоке со своим event loop; порт 0 - выбрать свободный
+    def start(self) -> str:
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._runner = web.AppRunner(self._make_app())
+            self._loop.run_until_complete(self._runner.setup())
+            site = web.TCPSite(self._runner, self.host, self.port)
+            self._loop.run_until_complete(site.start())
+            self.port = self._runner.addresses[0][1]
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self._runner.cleanup())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait()
+        logger.info(f"Fake weather server on {self.url}")
+        return self.url
+
+    def stop(self) -> None:
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+
+    def __enter__(self) -> "FakeWeatherServer":
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Фейковый OpenWeatherMap для локальных проверок")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа, сек")
+    parser.add_argument("--rate-limit", type=int, help="запросов в окне до ответа 429")
+    parser.add_argument("--window", type=float, default=60.0, help="окно лимита, сек")
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="доля ответов 503")
+    parser.add_argument("--api-key", default="test")
+    args = parser.parse_args()
+
+    server = FakeWeatherServer(
+        args.host, args.port, args.latency, args.rate_limit, args.window, args.retry_after, args.fail_rate, args.api_key
+    )
+    web.run_app(server._make_app(), host=args.host, port=args.port)
@@ -1,27 +1,225 @@
+from __future__ import annotations
+
+import hashlib
+import threading
 import warnings
-from datetime import datetime
+import weakref
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING
 
+import numpy as np
 import pandas as pd
-import plotly.graph_objects as go
 
 warnings.filterwarnings("ignore")
 import asyncio
-from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 
-from joblib import Parallel, delayed
 from loguru import logger
-from scipy import stats
 
-from api_utils import get_current_weather_sync
+from metrics import metrics
+from regression import (
+    days_since_start,
+    regression_from_moments,
+    rolling_regression,
+    segment_moments,
+    segment_regression,
+)
+from results import (
+    AnomalyResult,
+    AnomalySweep,
+    CityAnalysis,
+    SeasonalProfile,
+    TrendResult,
+    rolling_moments,
+)
+from robust_window import rolling_median_mad
+from rollup_cube import RollupCube
+from seasonal_norms import SeasonalNorms
+from streaming_anomalies import StreamingAnomalyDetector
+from worker_pool import AnalyzerPool
+
+if TYPE_CHECKING:
+    import plotly.graph_objects as go
+
+    from execution_planner import ExecutionPlan
+
+
+# скользящие среднее/std с center=True и min_periods=1 для всех городов сразу
+# через префиксные суммы; границы окна обрезаются по границам города (как у rolling внутри города)
+def _centered_rolling_moments(values: np.ndarray, starts: np.ndarray, stops: np.ndarray, window_size: int):
+    return _window_moments(_centered_prefix_sums(values, starts, stops), window_size)
+
+
+# префиксные суммы x, x^2 и числа непустых значений одни на все окна: любое окно дальше - разности на строку.
+# NaN пропускаются, как в rolling: окно без значений дает NaN (min_periods=1), std - от двух значений
+def _centered_prefix_sums(values: np.ndarray, starts: np.ndarray, stops: np.ndarray) -> tuple:
+    counts = stops - starts
+    group_start = np.repeat(starts, counts)
+    group_stop = np.repeat(stops, counts)
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0.0)
+    # центрируем по среднему города, чтобы сумма квадратов не теряла точность
+    nonempty = starts[counts > 0]
+    sums = np.add.reduceat(filled, nonempty) if len(values) else np.array([])
+    valid_counts = np.add.reduceat(valid, nonempty) if len(values) else np.array([])
+    centers = np.zeros(len(counts))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        centers[counts > 0] = np.where(valid_counts > 0, sums / valid_counts, 0.0)
+    row_centers = np.repeat(centers, counts)
+    shifted = np.where(valid, filled - row_centers, 0.0)
+    cs0 = np.concatenate(([0], np.cumsum(valid)))
+    cs1 = np.concatenate(([0.0], np.cumsum(shifted)))
+    cs2 = np.concatenate(([0.0], np.cumsum(shifted**2)))
+    # серии одинаковых значений среди непустых: run_start[k] - где началась серия, в которую входит k-е значение
+    present = values[valid]
+    new_run = np.concatenate(([True], present[1:] != present[:-1])) if len(present) else np.array([], dtype=bool)
+    run_start = np.maximum.accumulate(np.where(new_run, np.arange(len(present)), 0)) if len(present) else new_run
+    return cs0, cs1, cs2, row_centers, group_start, group_stop, present, run_start
+
+
+def _window_moments(prefix: tuple, window_size: int):
+    cs0, cs1, cs2, row_centers, group_start, group_stop, present, run_start = prefix
+    end = np.arange(1, len(row_centers) + 1) + (window_size - 1) // 2
+    lo = np.maximum(end - window_size, group_start)
+    hi = np.minimum(end, group_stop)
+    n = (cs0[hi] - cs0[lo]).astype(float)
+    s1 = cs1[hi] - cs1[lo]
+    s2 = cs2[hi] - cs2[lo]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = s1 / n
+        var = np.maximum(s2 - s1 * mean, 0.0) / (n - 1)
+    var[n < 2] = np.nan
+    mean += row_centers
+    # окно из одинаковых значений: как rolling в pandas - среднее ровно это значение, std ровно 0
+    # (разности префиксных сумм дали бы шум ~1e-6, и строки на пороге считались бы аномалиями)
+    if len(present):
+        last = np.maximum(cs0[hi] - 1, 0)
+        constant = (n > 0) & (run_start[last] <= cs0[lo])
+        mean[constant] = present[last[constant]]
+        var[constant & (n >= 2)] = 0.0
+    return mean, np.sqrt(var)
+
+
+# число аномалий по городам для всех пар (окно, порог): префиксные суммы считаются один раз,
+# каждое окно - O(n) разностей. Пороги не перебираются: для строки ищется, сколько порогов она превышает
+# (searchsorted по |x - ma| / std), и результат уточняется точным условием detect_anomalies на соседних
+# порогах, так что счетчики совпадают с одиночными запусками, а цена почти не зависит от числа порогов
+def sweep_anomaly_counts(
+    values: np.ndarray, starts: np.ndarray, stops: np.ndarray, window_sizes, thresholds
+) -> np.ndarray:
+    window_sizes = np.asarray(window_sizes, dtype=np.int64)
+    thresholds = np.asarray(thresholds, dtype=float)
+    counts = np.zeros((len(starts), len(window_sizes), len(thresholds)), dtype=np.int32)
+    nonempty = stops > starts
+    if not len(values) or not len(thresholds) or not nonempty.any():
+        return counts
+    order = np.argsort(thresholds, kind="stable")
+    levels = thresholds[order]
+    n_levels = len(levels)
+    lengths = (stops - starts)[nonempty]
+    row_city = np.repeat(np.arange(len(lengths)) * (n_levels + 1), lengths)
+    prefix = _centered_prefix_sums(values, starts, stops)
+    for w, window_size in enumerate(window_sizes):
+        ma, std = _window_moments(prefix, int(window_size))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            z = np.abs(values - ma) / std
+        z[np.isnan(z)] = -np.inf
+        exceeded = np.searchsorted(levels, z, side="left")
+        # поправка на округление: превышен ли следующий порог и действительно ли превышен последний
+        band = std * levels[np.minimum(exceeded, n_levels - 1)]
+        exceeded += (exceeded < n_levels) & ((values > ma + band) | (values < ma - band))
+        band = std * levels[np.maximum(exceeded - 1, 0)]
+        exceeded -= (exceeded > 0) & ~((values > ma + band) | (values < ma - band))
+        hist = np.bincount(row_city + exceeded, minlength=len(lengths) * (n_levels + 1)).reshape(-1, n_levels + 1)
+        # строк, превысивших порог j = строк с exceeded > j
+        tail = np.cumsum(hist[:, ::-1], axis=1)[:, ::-1]
+        counts[nonempty, w, :] = tail[:, 1:][:, np.argsort(order)]
+    return counts
+
+
+# линейная регрессия по центральным моментам групп (n, средние, Sxx, Syy, Sxy) - то же, что linregress,
+# но сразу для многих городов. Формат элементов как у calculate_trend
+def trend_from_moments(n, mean_x, mean_y, sxx, syy, sxy) -> list:
+    regression = regression_from_moments(n, mean_x, mean_y, sxx, syy, sxy)
+    return [_trend_result(regression, i) for i in range(len(regression["slope"]))]
+
+
+def _trend_result(regression: dict, i: int) -> TrendResult:
+    return TrendResult(
+        regression["slope"][i],
+        regression["intercept"][i],
+        regression["r_value"][i],
+        regression["p_value"][i],
+        regression["std_err"][i],
+    )
+
+
+# кэш результатов анализа с вытеснением давно не использованных (LRU).
+# Один на процесс: streamlit на каждый rerun создает новый анализатор, а ключи содержат отпечаток данных.
+# При pickle (воркеры процессов) уезжает пустым - кэш локален для процесса
+class ResultCache:
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, key: tuple, compute):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+        value = compute()
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+        return value
+
+    def __contains__(self, key: tuple) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    # убрать все результаты одного набора данных (ключи начинаются с его отпечатка)
+    def drop(self, fingerprint: str) -> None:
+        with self._lock:
+            for key in [key for key in self._data if key and key[0] == fingerprint]:
+                del self._data[key]
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __getstate__(self) -> dict:
+        return {"max_size": self.max_size}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(state["max_size"])
+
+
+result_cache = ResultCache()
 
 
 class HistoricalDataAnalyzer:
-    def __init__(self, df: pd.DataFrame):
-        self.df = df.copy()
-        self.df["timestamp"] = pd.to_datetime(self.df["timestamp"])
-        self.results = {}
+    # fingerprint можно передать, если он уже известен для этого df (воркеры пула), чтобы не хэшировать заново
+    def __init__(self, df: pd.DataFrame, results: ResultCache | None = None, fingerprint: str | None = None):
+        self.df = self._prepare_frame(df)
+        self._build_city_index()
+        self.fingerprint = fingerprint or self._fingerprint()
+        self.results = results if results is not None else result_cache
         self.benchmark_times = {}
+        self._pool = None
+        self._pool_lock = threading.Lock()
         self.month_to_season = {  ## можно было и умнее сделать, но больше для удобства решил сделать)
             12: "winter",
             1: "winter",
@@ -37,18 +235,81 @@ class HistoricalDataAnalyzer:
             11: "autumn",
         }
 
+    # уже типизированный df (categorical city, datetime64 timestamp - например, из columnar_storage)
+    # берем как есть, без копии и повторного парсинга
+    def _prepare_frame(self, df: pd.DataFrame) -> pd.DataFrame:
+        if pd.api.types.is_datetime64_any_dtype(df["timestamp"]) and isinstance(df["city"].dtype, pd.CategoricalDtype):
+            return df
+        df = df.copy()
+        df["timestamp"] = pd.to_datetime(df["timestamp"])
+        df["city"] = df["city"].astype("category")
+        return df
+
+    # индекс по городам: один раз сортируем по (city, timestamp) и запоминаем границы,
+    # дальше срез города - это iloc по смещениям, без сравнения строк по всему df.
+    # Если df уже отсортирован, сортировка (и копия) пропускается
+    def _build_city_index(self) -> None:
+        codes = self.df["city"].cat.codes.to_numpy()
+        if len(np.unique(codes)) != len(self.df["city"].cat.categories):
+            self.df = self.df.assign(city=self.df["city"].cat.remove_unused_categories())
+            codes = self.df["city"].cat.codes.to_numpy()
+        if not self._is_sorted(codes):
+            self.df = self.df.sort_values(["city", "timestamp"], kind="stable").reset_index(drop=True)
+            codes = self.df["city"].cat.codes.to_numpy()
+        elif not isinstance(self.df.index, pd.RangeIndex) or self.df.index.start != 0 or self.df.index.step != 1:
+            self.df = self.df.reset_index(drop=True)
+        positions = np.arange(len(self.df["city"].cat.categories))
+        starts = np.searchsorted(codes, positions, side="left")
+        stops = np.searchsorted(codes, positions, side="right")
+        self.city_offsets = {
+            city: (int(start), int(stop)) for city, start, stop in zip(self.df["city"].cat.categories, starts, stops)
+        }
+
+    def _is_sorted(self, codes: np.ndarray) -> bool:
+        if len(codes) < 2:
+            return True
+        code_steps = np.diff(codes)
+        time_steps = np.diff(self.df["timestamp"].to_numpy())
+        return bool(np.all(code_steps >= 0) and np.all((code_steps > 0) | (time_steps >= np.timedelta64(0))))
+
+    @property
+    def cities(self) -> list:
+        return list(self.city_offsets)
+
+    # срез без копирования, для неизвестного города - пустой df (как раньше давала маска)
+    def get_city_frame(self, city: str) -> pd.DataFrame:
+        start, stop = self.city_offsets.get(city, (0, 0))
+        return self.df.iloc[start:stop]
+
+    # отпечаток содержимого, чтобы кэш не путал разные наборы данных. Хэшируем сырые байты колонок
+    # (для mmap-хранилища это чтение файла без парсинга)
+    def _fingerprint(self) -> str:
+        digest = hashlib.sha1()
+        for column in self.df.columns:
+            values = self.df[column]
+            digest.update(str(column).encode())
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                digest.update("\x1f".join(map(str, values.cat.categories)).encode())
+                values = values.cat.codes
+            if values.dtype == object:
+                digest.update(pd.util.hash_pandas_object(values, index=False).to_numpy().tobytes())
+            else:
+                digest.update(np.ascontiguousarray(values.to_numpy()).tobytes())
+        return digest.hexdigest()
+
     # базовые показатели
     def calculate_basic_statistics(self, city_data: pd.DataFrame) -> dict:
-        return {
-            "mean": city_data["temperature"].mean(),
-            "std": city_data["temperature"].std(),
-            "min": city_data["temperature"].min(),
-            "max": city_data["temperature"].max(),
-            "median": city_data["temperature"].median(),
-            "q1": city_data["temperature"].quantile(0.25),
-            "q3": city_data["temperature"].quantile(0.75),
-            "count": len(city_data),
-        }
+        with metrics.stage("basic_statistics", rows=len(city_data)):
+            return {
+                "mean": city_data["temperature"].mean(),
+                "std": city_data["temperature"].std(),
+                "min": city_data["temperature"].min(),
+                "max": city_data["temperature"].max(),
+                "median": city_data["temperature"].median(),
+                "q1": city_data["temperature"].quantile(0.25),
+                "q3": city_data["temperature"].quantile(0.75),
+                "count": len(city_data),
+            }
 
     # скользящее
     def calculate_rolling_mean(self, city_data: pd.DataFrame, window_size: int = 30) -> pd.DataFrame:
@@ -58,143 +319,501 @@ class HistoricalDataAnalyzer:
         )
         return city_data
 
-    # аномалии
-    def detect_anomalies(self, city_data: pd.DataFrame, window_size: int = 30, threshold: float = 2.0) -> dict:
-        city_data = self.calculate_rolling_mean(city_data, window_size)
-        city_data[f"std_{window_size}"] = (
-            city_data["temperature"].rolling(window=window_size, center=True, min_periods=1).std()
-        )
-        ma_col = f"ma_{window_size}"
-        std_col = f"std_{window_size}"
-        anomalies_mask = (city_data["temperature"] > city_data[ma_col] + threshold * city_data[std_col]) | (
-            city_data["temperature"] < city_data[ma_col] - threshold * city_data[std_col]
-        )
-        anomalies = city_data[anomalies_mask].copy()
-        anomalies["deviation"] = anomalies["temperature"] - anomalies[ma_col]
-        return {
-            "anomalies": anomalies,
-            "anomaly_count": len(anomalies),
-            "anomaly_percent": (len(anomalies) / len(city_data)) * 100 if len(city_data) > 0 else 0,
-        }
+    # аномалии. Результат (AnomalyResult) хранит позиции аномальных строк и окно только для них;
+    # таблица аномалий и ряд с ma/std для plot_time_series собираются лениво (окно ряда - из этого же прохода).
+    # base_start - позиция city_data в self.df, если это срез анализатора (тогда строки не копируются в pickle).
+    # mode="mad" - устойчивый режим: медиана окна ± threshold * 1.4826 * MAD вместо среднего ± threshold * std
+    def detect_anomalies(
+        self,
+        city_data: pd.DataFrame,
+        window_size: int = 30,
+        threshold: float = 2.0,
+        base_start: int | None = None,
+        mode: str = "std",
+    ) -> AnomalyResult:
+        with metrics.stage("detect_anomalies", rows=len(city_data)):
+            if not city_data["timestamp"].is_monotonic_increasing:
+                city_data = city_data.sort_values("timestamp")
+                base_start = None
+            with metrics.stage(f"detect_anomalies.rolling.{mode}", rows=len(city_data)):
+                ma, std = rolling_moments(city_data["temperature"], window_size, mode)
+            temps = city_data["temperature"].to_numpy(dtype=float)
+            ma = ma.to_numpy()
+            std = std.to_numpy()
+            positions = np.flatnonzero((temps > ma + threshold * std) | (temps < ma - threshold * std))
+            return AnomalyResult(
+                city_data, positions, ma[positions], std[positions], window_size, threshold, base_start, mode, (ma, std)
+            )
 
     # профиль сезона
     def calculate_seasonal_profile(self, city_data: pd.DataFrame) -> pd.DataFrame:
-        seasonal_stats = city_data.groupby("season")["temperature"].agg(["mean", "std", "count"])
-        seasonal_stats["lower"] = seasonal_stats["mean"] - seasonal_stats["std"]
-        seasonal_stats["upper"] = seasonal_stats["mean"] + seasonal_stats["std"]
-        return seasonal_stats
-
-    # тренды
-    def calculate_trend(self, city_data: pd.DataFrame) -> dict:
-        city_data = city_data.copy()
-        city_data["timestamp"] = pd.to_datetime(city_data["timestamp"])  # Фикс: Убедимся в типе
-        city_data["days"] = (city_data["timestamp"] - city_data["timestamp"].min()).dt.days
-        slope, intercept, r_value, p_value, std_err = stats.linregress(city_data["days"], city_data["temperature"])
-        return {
-            "slope": slope,
-            "intercept": intercept,
-            "r_value": r_value,
-            "p_value": p_value,
-            "trend_description": f"Тренд: {'рост' if slope > 0 else 'падение'} на {abs(slope):.4f}°C в день (R²={r_value**2:.2f})",
-        }
+        return self._seasonal_profile(city_data).to_frame()
 
-    # анализ города
-    def analyze_city_sync(self, city: str, window_size: int, threshold: float) -> dict:
-        city_data = self.df[self.df["city"] == city]
-        stats = self.calculate_basic_statistics(city_data)
-        anomalies = self.detect_anomalies(city_data, window_size, threshold)
-        seasonal = self.calculate_seasonal_profile(city_data)
-        trend = self.calculate_trend(city_data)
-        return {
-            "city": city,
-            "stats": stats,
-            "anomalies": anomalies,
-            "seasonal": seasonal,
-            "trend": trend,
-        }
+    def _seasonal_profile(self, city_data: pd.DataFrame) -> SeasonalProfile:
+        with metrics.stage("seasonal_profile", rows=len(city_data)):
+            return SeasonalProfile.from_frame(city_data)
+
+    # дни от первого наблюдения (ось x для тренда)
+    def _days_offset(self, city_data: pd.DataFrame) -> np.ndarray:
+        return days_since_start(pd.to_datetime(city_data["timestamp"]).to_numpy())
+
+    # тренды: регрессия в замкнутой форме (то же, что linregress). days (в порядке строк city_data)
+    # сохраняется в результате для plot_trend
+    def calculate_trend(self, city_data: pd.DataFrame) -> TrendResult:
+        with metrics.stage("calculate_trend", rows=len(city_data)):
+            days = self._days_offset(city_data)
+            with metrics.stage("calculate_trend.regression", rows=len(days)):
+                bounds = np.array([0]), np.array([len(days)])
+                regression = segment_regression(days, city_data["temperature"].to_numpy(), *bounds)
+        trend = _trend_result(regression, 0)
+        trend.days = days
+        return trend
+
+    # анализ города. Статистика, сезоны и тренд не зависят от окна и порога - кэшируются отдельно от аномалий
+    def analyze_city_sync(
+        self, city: str, window_size: int, threshold: float, use_cache: bool = True, mode: str = "std"
+    ) -> CityAnalysis:
+        start, stop = self.city_offsets.get(city, (0, 0))
+        with metrics.stage("analyze_city_sync", rows=stop - start):
+            return self._analyze_city_sync(city, window_size, threshold, use_cache, mode)
+
+    def _analyze_city_sync(
+        self, city: str, window_size: int, threshold: float, use_cache: bool, mode: str
+    ) -> CityAnalysis:
+        with metrics.stage("city_slice"):
+            city_data = self.get_city_frame(city)
+        base_start = self.city_offsets[city][0] if city in self.city_offsets else None
+        if not use_cache:
+            return self.analyze_city_frame(city, city_data, window_size, threshold, base_start, mode)
+        return CityAnalysis(
+            city,
+            self._cached(("stats", city), lambda: self.calculate_basic_statistics(city_data)),
+            self._cached(
+                ("anomalies", city, window_size, threshold, mode),
+                lambda: self.detect_anomalies(city_data, window_size, threshold, base_start, mode),
+            ),
+            self._cached(("seasonal", city), lambda: self.rollup.seasonal_profile(city)),
+            self._cached(("trend", city), lambda: self.calculate_trend(city_data)),
+        )
+
+    # полный анализ готового среза без кэша (так же считают воркеры пула)
+    def analyze_city_frame(
+        self,
+        city: str,
+        city_data: pd.DataFrame,
+        window_size: int,
+        threshold: float,
+        base_start: int | None = None,
+        mode: str = "std",
+    ) -> CityAnalysis:
+        return CityAnalysis(
+            city,
+            self.calculate_basic_statistics(city_data),
+            self.detect_anomalies(city_data, window_size, threshold, base_start, mode),
+            self._seasonal_profile(city_data),
+            self.calculate_trend(city_data),
+        )
+
+    def _cached(self, key: tuple, compute):
+        return self.results.get_or_compute((self.fingerprint,) + key, compute)
+
+    # все города за один проход: groupby для статистик и сезонов, префиксные суммы для окон,
+    # сгруппированные суммы для тренда. Результат в том же формате, что и у analyze_city_sync
+    def analyze_all_cities(self, window_size: int = 30, threshold: float = 2.0, mode: str = "std") -> dict:
+        with metrics.stage("analyze_all_cities", rows=len(self.df)):
+            return self._analyze_all_cities(window_size, threshold, mode)
+
+    def _analyze_all_cities(self, window_size: int, threshold: float, mode: str) -> dict:
+        df = self.df
+        cities = self.cities
+        if not cities:
+            return {}
+        starts = np.array([self.city_offsets[c][0] for c in cities], dtype=np.int64)
+        stops = np.array([self.city_offsets[c][1] for c in cities], dtype=np.int64)
+        temps = df["temperature"].to_numpy(dtype=float)
+
+        grouped = df.groupby("city", observed=True, sort=True)["temperature"]
+        basic = grouped.agg(["mean", "std", "min", "max", "median", "count"])
+        quantiles = grouped.quantile([0.25, 0.75]).unstack()
+
+        # сезонные профили - строки таблицы норм (та же раскладка город x сезон)
+        norms = self.seasonal_norms
+        seasons = np.array(norms.seasons, dtype=object)
+
+        if mode == "mad":
+            ma, std = rolling_median_mad(temps, window_size, starts, stops)
+        elif mode == "std":
+            ma, std = _centered_rolling_moments(temps, starts, stops, window_size)
+        else:
+            raise ValueError(f"Invalid anomaly mode: {mode}")
+        anomaly_rows = np.flatnonzero((temps > ma + threshold * std) | (temps < ma - threshold * std))
+        anomaly_bounds = np.searchsorted(anomaly_rows, np.concatenate((starts, stops[-1:])))
+
+        trends = self._grouped_trend(temps, starts, stops)
+
+        results = {}
+        for i, city in enumerate(cities):
+            count = int(stops[i] - starts[i])
+            rows = anomaly_rows[anomaly_bounds[i] : anomaly_bounds[i + 1]]
+            present = norms.count[i] > 0
+            results[city] = CityAnalysis(
+                city,
+                {
+                    "mean": basic.at[city, "mean"],
+                    "std": basic.at[city, "std"],
+                    "min": basic.at[city, "min"],
+                    "max": basic.at[city, "max"],
+                    "median": basic.at[city, "median"],
+                    "q1": quantiles.at[city, 0.25],
+                    "q3": quantiles.at[city, 0.75],
+                    "count": count,
+                },
+                AnomalyResult(
+                    df.iloc[starts[i] : stops[i]],
+                    rows - starts[i],
+                    ma[rows],
+                    std[rows],
+                    window_size,
+                    threshold,
+                    int(starts[i]),
+                    mode,
+                    (ma[starts[i] : stops[i]], std[starts[i] : stops[i]]),
+                ),
+                SeasonalProfile(
+                    seasons[present], norms.mean[i][present], norms.std[i][present], norms.count[i][present]
+                ),
+                trends[i],
+            )
+        return results
+
+    # поверхность числа аномалий город x окно x порог для подбора параметров (слайдеры окна и порога).
+    # Одно прохождение по данным на все комбинации, результат кэшируется по отпечатку данных
+    def sweep_anomalies(
+        self, window_sizes=range(7, 91), thresholds=(1.0, 1.5, 2.0, 2.5, 3.0), cities: list | None = None
+    ) -> AnomalySweep:
+        window_sizes = tuple(int(w) for w in window_sizes)
+        thresholds = tuple(float(t) for t in thresholds)
+        cities = self.cities if cities is None else [c for c in cities if c in self.city_offsets]
+        return self._cached(
+            ("anomaly_sweep", window_sizes, thresholds, tuple(cities)),
+            lambda: self._sweep_anomalies(window_sizes, thresholds, cities),
+        )
+
+    def _sweep_anomalies(self, window_sizes: tuple, thresholds: tuple, cities: list) -> AnomalySweep:
+        starts = np.array([self.city_offsets[c][0] for c in cities], dtype=np.int64)
+        stops = np.array([self.city_offsets[c][1] for c in cities], dtype=np.int64)
+        temps = self.df["temperature"].to_numpy(dtype=float)
+        if len(cities) != len(self.cities):
+            # подмножество городов: склеиваем их отрезки, чтобы не считать окна по чужим строкам
+            temps = np.concatenate([temps[start:stop] for start, stop in zip(starts, stops)]) if cities else temps[:0]
+            lengths = stops - starts
+            stops = np.cumsum(lengths)
+            starts = stops - lengths
+        totals = stops - starts
+        with metrics.stage("anomaly_sweep", rows=len(temps) * len(window_sizes)):
+            counts = sweep_anomaly_counts(temps, starts, stops, window_sizes, thresholds)
+        return AnomalySweep(cities, window_sizes, thresholds, counts, totals)
+
+    # линейная регрессия temperature ~ days для всех городов по сгруппированным суммам (то же, что linregress)
+    def _grouped_trend(self, temps: np.ndarray, starts: np.ndarray, stops: np.ndarray) -> list:
+        # целые дни от первого наблюдения города, как в calculate_trend
+        days = days_since_start(self.df["timestamp"].to_numpy(), starts, stops).astype(float)
+        trends = trend_from_moments(*segment_moments(days, temps, starts, stops))
+        for trend, start, stop in zip(trends, starts, stops):
+            trend.days = days[start:stop]
+        return trends
+
+    # тренд по периодам (по умолчанию десятилетиям) для всех городов одним проходом:
+    # строки отсортированы по (city, timestamp), так что каждая пара (город, период) - непрерывный отрезок.
+    # x - дни от первого наблюдения города, поэтому slope сравним между периодами
+    def calculate_period_trends(self, period_years: int = 10, cities: list | None = None) -> pd.DataFrame:
+        trends = self._cached(("period_trends", period_years), lambda: self._period_trends(period_years))
+        if cities is not None:
+            trends = trends[trends.index.get_level_values("city").isin(cities)]
+        return trends
+
+    def _period_trends(self, period_years: int) -> pd.DataFrame:
+        columns = ["slope", "intercept", "r_value", "p_value", "std_err", "count"]
+        if len(self.df) == 0:
+            return pd.DataFrame(columns=columns, index=pd.MultiIndex.from_arrays([[], []], names=["city", "period"]))
+        with metrics.stage("period_trends", rows=len(self.df)):
+            cities = self.cities
+            city_starts = np.array([self.city_offsets[c][0] for c in cities], dtype=np.int64)
+            city_stops = np.array([self.city_offsets[c][1] for c in cities], dtype=np.int64)
+            timestamps = self.df["timestamp"].to_numpy()
+            days = days_since_start(timestamps, city_starts, city_stops).astype(float)
+            period = timestamps.astype("datetime64[Y]").astype(np.int64) + 1970
+            period -= period % period_years
+            codes = self.df["city"].cat.codes.to_numpy()
+            boundary = np.flatnonzero((np.diff(codes) != 0) | (np.diff(period) != 0)) + 1
+            starts = np.concatenate(([0], boundary))
+            stops = np.concatenate((boundary, [len(days)]))
+            regression = segment_regression(days, self.df["temperature"].to_numpy(dtype=float), starts, stops)
+            index = pd.MultiIndex.from_arrays(
+                [self.df["city"].to_numpy()[starts].astype(object), period[starts]], names=["city", "period"]
+            )
+            result = pd.DataFrame({column: regression[column] for column in columns}, index=index)
+            result["count"] = result["count"].astype(int)
+        return result
 
-    # паралель
-    def analyze_city_parallel(self, cities: list, window_size: int, threshold: float, method: str = "joblib") -> dict:
-        if method == "joblib":
-            results = Parallel(n_jobs=-1)(
-                delayed(self.analyze_city_sync)(city, window_size, threshold) for city in cities
+    # тренд в скользящем окне из window_size последних наблюдений (для каждой строки city_data)
+    def calculate_rolling_trend(self, city_data: pd.DataFrame, window_size: int = 3650) -> pd.DataFrame:
+        with metrics.stage("rolling_trend", rows=len(city_data)):
+            city_data = city_data.sort_values("timestamp")
+            days = self._days_offset(city_data)
+            bounds = np.array([0]), np.array([len(days)])
+            regression = rolling_regression(days, city_data["temperature"].to_numpy(), *bounds, window_size)
+            return pd.DataFrame(
+                {
+                    "timestamp": city_data["timestamp"].to_numpy(),
+                    "slope": regression["slope"],
+                    "r_value": regression["r_value"],
+                    "p_value": regression["p_value"],
+                    "count": regression["count"].astype(int),
+                },
+                index=city_data.index,
             )
+
+    # потоковый детектор, окна которого уже заполнены хвостом истории каждого города
+    def create_streaming_detector(self, window_size: int = 30, threshold: float = 2.0) -> StreamingAnomalyDetector:
+        detector = StreamingAnomalyDetector(window_size, threshold)
+        for city in self.cities:
+            detector.warm_up(city, self.get_city_frame(city))
+        return detector
+
+    # паралель. Процессы (multiprocess/joblib) работают через долгоживущий пул анализатора:
+    # данные публикуются один раз, в воркеры уходят только смещения городов. Кэш результатов - только у потоков.
+    # method="auto" - стратегию (sync/multithread/multiprocess/vectorized) и нарезку выбирает execution_planner,
+    # выбранный план лежит в result.plan
+    def analyze_city_parallel(
+        self,
+        cities: list,
+        window_size: int,
+        threshold: float,
+        method: str = "joblib",
+        use_cache: bool = True,
+        mode: str = "std",
+    ) -> dict:
+        rows = sum(stop - start for start, stop in (self.city_offsets.get(city, (0, 0)) for city in cities))
+        with metrics.stage(f"analyze_city_parallel.{method}", rows=rows):
+            return self._analyze_city_parallel(cities, window_size, threshold, method, use_cache, mode)
+
+    def _analyze_city_parallel(
+        self,
+        cities: list,
+        window_size: int,
+        threshold: float,
+        method: str,
+        use_cache: bool,
+        mode: str,
+        rows_per_batch: int | None = None,
+    ) -> dict:
+        if method == "auto":
+            from execution_planner import PlannedResults
+
+            plan = self.plan_execution(cities, window_size, threshold, use_cache, mode)
+            logger.info(f"Execution plan: {plan.reason}")
+            results = self._analyze_city_parallel(
+                cities, window_size, threshold, plan.strategy, use_cache, mode, plan.rows_per_batch
+            )
+            return PlannedResults(results, plan)
+        if method == "sync":
+            results = [self.analyze_city_sync(city, window_size, threshold, use_cache, mode) for city in cities]
+        elif method == "vectorized":
+            all_results = self.analyze_all_cities(window_size, threshold, mode)
+            results = [all_results[city] for city in cities if city in all_results]
         elif method == "multithread":
+            analyze = partial(
+                self.analyze_city_sync, window_size=window_size, threshold=threshold, use_cache=use_cache, mode=mode
+            )
+            # потоки получают копию контекста вызывающего (привязанные метрики сессии, см. metrics.bind)
+            contexts = [contextvars.copy_context() for _ in cities]
             with ThreadPoolExecutor() as executor:
-                results = list(
-                    executor.map(
-                        partial(
-                            self.analyze_city_sync,
-                            window_size=window_size,
-                            threshold=threshold,
-                        ),
-                        cities,
-                    )
-                )
-        elif method == "multiprocess":
-            with ProcessPoolExecutor() as executor:
-                results = list(
-                    executor.map(
-                        partial(
-                            self.analyze_city_sync,
-                            window_size=window_size,
-                            threshold=threshold,
-                        ),
-                        cities,
-                    )
-                )
+                results = list(executor.map(lambda context, city: context.run(analyze, city), contexts, cities))
+        elif method in ("joblib", "multiprocess"):
+            tasks = [(city, *self.city_offsets.get(city, (0, 0))) for city in cities]
+            pool = self.worker_pool()
+            if method == "joblib":
+                results = pool.map_joblib(tasks, window_size, threshold, mode, rows_per_batch)
+            else:
+                results = pool.map(tasks, window_size, threshold, mode, rows_per_batch)
+            # из воркеров приходят только позиции аномалий, строки - срезы нашего df
+            for result in results:
+                result.attach(self.df)
         else:
             raise ValueError("Invalid method")
         return {res["city"]: res for res in results}
 
+    # план для method="auto" по размерам городов, числу ядер, кэшу и состоянию пула (модель - execution_planner)
+    def plan_execution(
+        self, cities: list, window_size: int, threshold: float, use_cache: bool = True, mode: str = "std"
+    ) -> ExecutionPlan:
+        from execution_planner import execution_planner
+
+        rows_per_city = [stop - start for start, stop in (self.city_offsets.get(city, (0, 0)) for city in cities)]
+        cached = [
+            use_cache and (self.fingerprint, "anomalies", city, window_size, threshold, mode) in self.results
+            for city in cities
+        ]
+        pool_started = self._pool is not None and self._pool.started
+        return execution_planner.plan(rows_per_city, len(self.df), len(self.city_offsets), mode, cached, pool_started)
+
+    # один пул на анализатор, даже если его одновременно запрашивают несколько сессий streamlit
+    def worker_pool(self) -> AnalyzerPool:
+        pool = self._pool
+        if pool is None:
+            with self._pool_lock:
+                pool = self._pool
+                if pool is None:
+                    pool = self._pool = AnalyzerPool(self.df, self.fingerprint)
+                    weakref.finalize(self, pool.close)
+        return pool
+
+    # остановить воркеров и удалить опубликованные для них данные
+    def close(self) -> None:
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.close()
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state["_pool"] = None
+        del state["_pool_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._pool_lock = threading.Lock()
+
     # асинхронщина
-    async def analyze_city_async(self, city: str, window_size: int, threshold: float) -> dict:
-        return self.analyze_city_sync(city, window_size, threshold)
-
-    # замеры
-    def benchmark_methods(self, city: str, window_size: int, threshold: float) -> dict:
-        import time
-
-        times = {}
-        start = time.time()
-        self.analyze_city_sync(city, window_size, threshold)
-        times["sync"] = time.time() - start
-        start = time.time()
-        self.analyze_city_parallel([city], window_size, threshold, "joblib")
-        times["joblib"] = time.time() - start
-        start = time.time()
-        self.analyze_city_parallel([city], window_size, threshold, "multithread")
-        times["multithread"] = time.time() - start
-        start = time.time()
-        self.analyze_city_parallel([city], window_size, threshold, "multiprocess")
-        times["multiprocess"] = time.time() - start
-        start = time.time()
-        asyncio.run(self.analyze_city_async(city, window_size, threshold))
-        times["async"] = time.time() - start
+    async def analyze_city_async(
+        self, city: str, window_size: int, threshold: float, use_cache: bool = True, mode: str = "std"
+    ) -> CityAnalysis:
+        return self.analyze_city_sync(city, window_size, threshold, use_cache, mode)
+
+    # замеры: warmup + несколько повторов, медиана по perf_counter (подробный отчет - benchmark.py)
+    def benchmark_methods(self, city: str, window_size: int, threshold: float, repeats: int = 3) -> dict:
+        from benchmark import benchmark_analyzer
+
+        results = benchmark_analyzer(
+            self,
+            [city],
+            window_size,
+            threshold,
+            ["sync", "joblib", "multithread", "multiprocess", "async"],
+            repeats=repeats,
+            track_memory=False,
+        )
+        times = {name: result["median_s"] for name, result in results.items()}
         self.benchmark_times = times
         return times
 
+    # режимы аномалий на одном городе: среднее/std (pandas rolling) против медианы/MAD (сортированное окно)
+    def benchmark_modes(self, city: str, window_size: int, threshold: float, repeats: int = 3) -> dict:
+        from benchmark import benchmark_analyzer
+
+        return {
+            mode: benchmark_analyzer(
+                self, [city], window_size, threshold, ["sync"], repeats=repeats, track_memory=False, mode=mode
+            )["sync"]["median_s"]
+            for mode in ("std", "mad")
+        }
+
+    # замеры на всех городах: цикл sync, потоки и векторизованный проход
+    def benchmark_all_cities(self, window_size: int, threshold: float, repeats: int = 3) -> dict:
+        from benchmark import benchmark_analyzer
+
+        results = benchmark_analyzer(
+            self,
+            self.cities,
+            window_size,
+            threshold,
+            ["sync", "multithread", "vectorized"],
+            repeats=repeats,
+            track_memory=False,
+        )
+        return {name: result["median_s"] for name, result in results.items()}
+
     # для работы с текущей погодой
     def analyze_current_weather(self, city: str, api_key: str, method: str = "sync") -> dict:
+        from api_utils import get_current_weather_async, get_current_weather_sync
+
         logger.info(f"Analyzing current weather for {city} using {method}")
-        if method == "sync":
-            current = get_current_weather_sync(city, api_key)
-        else:
-            raise ValueError("Invalid API method")
+        with metrics.stage(f"analyze_current_weather.api.{method}"):
+            if method == "sync":
+                current = get_current_weather_sync(city, api_key)
+            elif method == "async":
+                current = asyncio.run(get_current_weather_async(city, api_key))
+            else:
+                raise ValueError("Invalid API method")
 
         logger.debug(f"Current data: {current}")
-        city_data = self.df[self.df["city"] == city]
-        current_date = datetime.fromtimestamp(current["timestamp"])
+        return self._compare_with_season(city, current)
+
+    # текущая погода сразу для многих городов (асинхронно, с ограничением параллельных запросов).
+    # rate_per_minute - квота API на этот вызов (по умолчанию общая, см. api_utils.DEFAULT_RATE_PER_MINUTE)
+    def analyze_current_weather_many(
+        self, cities: list, api_key: str, concurrency: int = 20, rate_per_minute: float | None = None
+    ) -> dict:
+        from api_utils import fetch_current_weather_many
+
+        logger.info(f"Analyzing current weather for {len(cities)} cities")
+        with metrics.stage("analyze_current_weather_many.api", rows=len(cities)):
+            currents = asyncio.run(
+                fetch_current_weather_many(cities, api_key, concurrency, rate_per_minute=rate_per_minute)
+            )
+        results = {}
+        for city, current in currents.items():
+            try:
+                results[city] = self._compare_with_season(city, current)
+            except ValueError as e:
+                logger.warning(f"Skipping {city}: {e}")
+        return results
+
+    # куб агрегатов город x год x месяц x сезон, один на набор данных (кэшируется по отпечатку).
+    # Из него - сезонные профили, нормы, boxplot и тепловая карта без повторного прохода по строкам
+    @property
+    def rollup(self) -> RollupCube:
+        return self._cached(("rollup",), self._build_rollup)
+
+    def _build_rollup(self) -> RollupCube:
+        with metrics.stage("rollup_cube", rows=len(self.df)):
+            return RollupCube.from_frame(self.df)
+
+    # таблица норм город x сезон - переагрегация куба
+    @property
+    def seasonal_norms(self) -> SeasonalNorms:
+        return self._cached(("seasonal_norms",), lambda: self.rollup.seasonal_norms())
+
+    # оценка многих текущих наблюдений по таблице норм одной векторной операцией.
+    # observations - DataFrame или список словарей с city, temperature, timestamp
+    # (unix-время в секундах считается UTC, либо datetime)
+    def score_current_weather_many(self, observations, threshold: float = 2.0) -> pd.DataFrame:
+        observations = pd.DataFrame(observations)
+        with metrics.stage("score_current_weather_many", rows=len(observations)):
+            timestamps = observations["timestamp"]
+            if pd.api.types.is_numeric_dtype(timestamps):
+                timestamps = pd.to_datetime(timestamps, unit="s")
+            months = pd.DatetimeIndex(pd.to_datetime(timestamps)).month.to_numpy()
+            scored = self.seasonal_norms.score(
+                observations["city"].to_numpy(), observations["temperature"].to_numpy(), months, threshold
+            )
+            scored.insert(1, "timestamp", timestamps.to_numpy())
+        return scored
+
+    # timestamp - unix-время (dt OpenWeatherMap), сезон по месяцу в UTC, как в score_current_weather_many
+    def _compare_with_season(self, city: str, current: dict) -> dict:
+        current_date = datetime.fromtimestamp(current["timestamp"], tz=timezone.utc)
         season = self.month_to_season.get(current_date.month, "winter")
         logger.info(f"Determined season: {season} for month {current_date.month}")
 
-        seasonal_stats = self.calculate_seasonal_profile(city_data)
-        if season not in seasonal_stats.index:
-            logger.error(f"Season '{season}' not in seasonal_stats: {seasonal_stats.index}")
+        norm = self.seasonal_norms.lookup(city, season)
+        if norm is None:
+            logger.error(f"Season '{season}' not in seasonal norms for {city}")
             raise ValueError(f"Сезон '{season}' не найден в исторических данных для {city}")
 
-        seasonal_mean = seasonal_stats.loc[season, "mean"]
-        seasonal_std = seasonal_stats.loc[season, "std"]
+        seasonal_mean, seasonal_std = norm
 
         deviation = current["temperature"] - seasonal_mean
         # 7.85 > 2 * 5
@@ -216,154 +835,104 @@ class HistoricalDataAnalyzer:
             "anomaly_desc": f"Аномалия: {'Да' if is_anomaly else 'Нет'} (отклонение {deviation:.2f}°C)",
         }
 
-    # графики
-    def plot_time_series(self, city_data: pd.DataFrame, window_size: int, threshold: float) -> go.Figure:
-        city_data = city_data.copy()
-        city_data = self.calculate_rolling_mean(city_data, window_size)
-        city_data[f"std_{window_size}"] = (
-            city_data["temperature"].rolling(window=window_size, center=True, min_periods=1).std()
-        )
-        ma_col = f"ma_{window_size}"
-        std_col = f"std_{window_size}"
-        anomalies_mask = (city_data["temperature"] > city_data[ma_col] + threshold * city_data[std_col]) | (
-            city_data["temperature"] < city_data[ma_col] - threshold * city_data[std_col]
-        )
-        anomalies = city_data[anomalies_mask].copy()
-        anomalies["deviation"] = anomalies["temperature"] - anomalies[ma_col]
-        fig = go.Figure()
-        fig.add_trace(
-            go.Scatter(
-                x=city_data["timestamp"],
-                y=city_data["temperature"],
-                mode="lines",
-                name="Температура",
-            )
-        )
-        fig.add_trace(go.Scatter(x=city_data["timestamp"], y=city_data[ma_col], mode="lines", name="MA"))
-        fig.add_trace(
-            go.Scatter(
-                x=anomalies["timestamp"],
-                y=anomalies["temperature"],
-                mode="markers",
-                name="Аномалии",
-                marker=dict(color="red"),
-            )
-        )
-        fig.update_layout(
-            title="Временной ряд температуры",
-            xaxis_title="Дата",
-            yaxis_title="Температура (°C)",
-            width=800,
-            height=600,
+    # графики: сами фигуры строит модуль plots (импортируется при первом графике вместе с plotly),
+    # здесь - подготовка данных из результатов анализа.
+    # max_points ограничивает число точек линий (None - все точки), x_range - видимый интервал дат.
+    # Аномалии рисуются все, без прореживания. anomalies - готовый результат detect_anomalies
+    # (например, results["anomalies"]); если он посчитан с теми же окном, порогом и режимом (mode),
+    # окно не пересчитывается
+    def plot_time_series(
+        self,
+        city_data: pd.DataFrame,
+        window_size: int,
+        threshold: float,
+        max_points: int | None = 2000,
+        x_range: tuple | None = None,
+        anomalies: dict | None = None,
+        mode: str = "std",
+    ) -> go.Figure:
+        import plots
+
+        if (
+            anomalies is None
+            or "series" not in anomalies
+            or (anomalies["window_size"], anomalies["threshold"], anomalies.get("mode", "std"))
+            != (window_size, threshold, mode)
+        ):
+            anomalies = self.detect_anomalies(city_data, window_size, threshold, mode=mode)
+        return plots.plot_time_series(
+            anomalies["series"], anomalies["anomalies"], f"ma_{window_size}", max_points, x_range
         )
-        return fig
+
+    # days из результата calculate_trend, если он посчитан по этим же строкам
+    def _trend_days(self, city_data: pd.DataFrame, trend: dict) -> np.ndarray:
+        days = trend.get("days")
+        if days is None or len(days) != len(city_data):
+            days = self._days_offset(city_data)
+        return days
 
     def plot_seasonal_profile(self, seasonal_stats: pd.DataFrame) -> go.Figure:
-        fig = go.Figure()
-        fig.add_trace(go.Bar(x=seasonal_stats.index, y=seasonal_stats["mean"], name="Среднее"))
-        fig.add_trace(
-            go.Scatter(
-                x=seasonal_stats.index,
-                y=seasonal_stats["mean"],
-                mode="markers",
-                marker=dict(color="rgba(0,0,0,0)", size=0),
-                error_y=dict(type="data", array=seasonal_stats["std"], visible=True),
-                name="STD",
-            )
-        )
-        fig.update_layout(
-            title="Сезонный профиль",
-            xaxis_title="Сезон",
-            yaxis_title="Температура (°C)",
-            width=800,
-            height=600,
-        )
-        return fig
-
-    def plot_heatmap_anomalies(self, anomalies: pd.DataFrame) -> go.Figure:
-        if len(anomalies) == 0:
-            fig = go.Figure()
-            fig.update_layout(title="Тепловая карта аномалий (нет данных)", width=800, height=600)
-            return fig
-        anomalies["year"] = anomalies["timestamp"].dt.year
-        anomalies["month"] = anomalies["timestamp"].dt.month
-        heatmap_data = anomalies.groupby(["year", "month"]).size().unstack(fill_value=0)
-        fig = go.Figure(
-            data=go.Heatmap(
-                z=heatmap_data.values,
-                x=heatmap_data.columns,
-                y=heatmap_data.index,
-                colorscale="Reds",
-            )
-        )
-        fig.update_layout(
-            title="Тепловая карта аномалий",
-            xaxis_title="Месяц",
-            yaxis_title="Год",
-            width=800,
-            height=600,
-        )
-        return fig
-
-    def plot_trend(self, city_data: pd.DataFrame, trend: dict) -> go.Figure:
-        city_data = city_data.copy()
-        city_data["timestamp"] = pd.to_datetime(city_data["timestamp"])  # Фикс: Убедимся в типе
-        city_data["days"] = (city_data["timestamp"] - city_data["timestamp"].min()).dt.days
-        trend_line = trend["intercept"] + trend["slope"] * city_data["days"]
-        fig = go.Figure()
-        fig.add_trace(
-            go.Scatter(
-                x=city_data["timestamp"],
-                y=city_data["temperature"],
-                mode="markers",
-                name="Данные",
-                marker=dict(opacity=0.5),
-            )
-        )
-        fig.add_trace(go.Scatter(x=city_data["timestamp"], y=trend_line, mode="lines", name="Тренд"))
-        fig.update_layout(
-            title="Долгосрочный тренд",
-            xaxis_title="Дата",
-            yaxis_title="Температура (°C)",
-            width=800,
-            height=600,
-        )
-        return fig
+        import plots
+
+        return plots.plot_seasonal_profile(seasonal_stats)
+
+    # anomalies - результат detect_anomalies (тогда год x месяц берутся из куба по позициям строк)
+    # или готовая таблица аномалий
+    def plot_heatmap_anomalies(self, anomalies) -> go.Figure:
+        import plots
+
+        if isinstance(anomalies, AnomalyResult) and self._is_own_slice(anomalies.base_start, anomalies.total):
+            heatmap_data = self.rollup.row_heatmap(anomalies.base_start + anomalies.positions)
+            return plots.plot_anomaly_heatmap(heatmap_data)
+        if isinstance(anomalies, AnomalyResult):
+            anomalies = anomalies.anomalies
+        return plots.plot_heatmap_anomalies(anomalies)
+
+    # строки [start, start + total) - целиком один город в self.df
+    def _is_own_slice(self, start: int | None, total: int) -> bool:
+        if start is None or total == 0 or start + total > len(self.df):
+            return False
+        city = self.df["city"].iat[start]
+        return self.city_offsets.get(city) == (start, start + total)
+
+    def plot_anomaly_sweep(
+        self, sweep: AnomalySweep, city: str, window_size: int | None = None, threshold: float | None = None
+    ) -> go.Figure:
+        import plots
+
+        return plots.plot_anomaly_sweep(sweep.city_frame(city, percent=True), window_size, threshold)
+
+    def plot_trend(
+        self, city_data: pd.DataFrame, trend: dict, max_points: int | None = 2000, x_range: tuple | None = None
+    ) -> go.Figure:
+        import plots
 
+        return plots.plot_trend(city_data, self._trend_days(city_data, trend), trend, max_points, x_range)
+
+    # для среза города из get_city_frame квартили и границы берутся из куба (в фигуру уходят 4 бокса,
+    # а не все строки); для произвольного df - boxplot по строкам
     def plot_seasonal_boxplot(self, city_data: pd.DataFrame) -> go.Figure:
-        fig = go.Figure()
-        for season in city_data["season"].unique():
-            season_data = city_data[city_data["season"] == season]["temperature"]
-            fig.add_trace(go.Box(y=season_data, name=season))
-        fig.update_layout(
-            title="Boxplot температур по сезонам",
-            xaxis_title="Сезон",
-            yaxis_title="Температура (°C)",
-            width=800,
-            height=600,
-        )
-        return fig
-
-    def plot_temperature_scatter(self, city_data: pd.DataFrame, trend: dict) -> go.Figure:
-        city_data = city_data.copy()
-        city_data["timestamp"] = pd.to_datetime(city_data["timestamp"])
-        city_data["days"] = (city_data["timestamp"] - city_data["timestamp"].min()).dt.days
-        trend_line = trend["intercept"] + trend["slope"] * city_data["days"]
-        fig = go.Figure()
-        fig.add_trace(
-            go.Scatter(
-                x=city_data["days"],
-                y=city_data["temperature"],
-                mode="markers",
-                name="Температура",
-            )
-        )
-        fig.add_trace(go.Scatter(x=city_data["days"], y=trend_line, mode="lines", name="Тренд"))
-        fig.update_layout(
-            title="Scatter температуры vs дней",
-            xaxis_title="Дни",
-            yaxis_title="Температура (°C)",
-            width=800,
-            height=600,
+        import plots
+
+        if self._is_city_view(city_data):
+            city = str(self.df["city"].iat[city_data.index.start])
+            return plots.plot_seasonal_box_stats(self.rollup.seasonal_box(city))
+        return plots.plot_seasonal_boxplot(city_data)
+
+    # city_data - срез self.df по одному городу (как из get_city_frame), а не копия или чужой df
+    def _is_city_view(self, city_data: pd.DataFrame) -> bool:
+        index = city_data.index
+        if not len(city_data) or not isinstance(index, pd.RangeIndex) or index.step != 1:
+            return False
+        if not self._is_own_slice(index.start, len(city_data)):
+            return False
+        return city_data["city"].iat[0] == self.df["city"].iat[index.start] and np.may_share_memory(
+            city_data["temperature"].to_numpy(), self.df["temperature"].to_numpy()
         )
-        return fig
+
+    def plot_temperature_scatter(
+        self, city_data: pd.DataFrame, trend: dict, max_points: int | None = 2000, x_range: tuple | None = None
+    ) -> go.Figure:
+        import plots
+
+        return plots.plot_temperature_scatter(city_data, self._trend_days(city_data, trend), trend, max_points, x_range)
@@ -0,0 +1,159 @@
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+"""
+Опциональная телеметрия горячих участков анализа: по каждой стадии (срез города, окно, groupby,
+регрессия, запрос к API, параллельные пути) копятся число вызовов, суммарное/максимальное время,
+обработанные строки и, если включено, изменение выделенной памяти (tracemalloc).
+По умолчанию выключена и почти ничего не стоит; включается metrics.enable() или ANALYZER_METRICS=1
+(ANALYZER_METRICS=memory - вместе с памятью).
+
+Общий metrics можно подменить для текущего контекста через bind(recorder): стадии из этого потока
+(и из asyncio-задач и потоков analyze_city_parallel, запущенных из него) пишутся в привязанный recorder.
+Так у каждой сессии Streamlit свои метрики, и одна сессия не включает, не выключает и не сбрасывает
+метрики другой.
+
+Стадии внутри воркеров multiprocess/joblib пишутся в их собственные процессы,
+здесь видно только общее время параллельного вызова. Память под tracemalloc общая на процесс,
+поэтому при многопоточном запуске дельты стадий перекрываются; tracemalloc останавливается, когда
+учет памяти выключили все recorder-ы, которые его включали.
+"""
+
+_NULL_STAGE = nullcontext()
+_bound = ContextVar("analyzer_metrics", default=None)
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+
+
+def _start_tracing() -> None:
+    global _tracing_users
+    with _tracing_lock:
+        _tracing_users += 1
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+
+def _stop_tracing() -> None:
+    global _tracing_users
+    with _tracing_lock:
+        _tracing_users = max(_tracing_users - 1, 0)
+        if _tracing_users == 0 and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+class _StageStats:
+    __slots__ = ("calls", "total_s", "max_s", "last_s", "rows", "alloc_bytes")
+
+    def __init__(self):
+        self.calls = 0
+        self.total_s = 0.0
+        self.max_s = 0.0
+        self.last_s = 0.0
+        self.rows = 0
+        self.alloc_bytes = 0
+
+
+class MetricsRecorder:
+    def __init__(self, enabled: bool = False, track_memory: bool = False):
+        self._lock = threading.Lock()
+        self._stages = {}
+        self.enabled = False
+        self.track_memory = False
+        if enabled:
+            self.enable(track_memory)
+
+    def enable(self, track_memory: bool = False) -> None:
+        if track_memory != self.track_memory:
+            (_start_tracing if track_memory else _stop_tracing)()
+        self.enabled = True
+        self.track_memory = track_memory
+
+    def disable(self) -> None:
+        if self.track_memory:
+            _stop_tracing()
+        self.enabled = False
+        self.track_memory = False
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stages.clear()
+
+    # with metrics.stage("detect_anomalies", rows=len(city_data)): ...
+    # Если в контексте привязан другой recorder (bind), стадия пишется в него
+    def stage(self, name: str, rows: int | None = None):
+        recorder = _bound.get() or self
+        if not recorder.enabled:
+            return _NULL_STAGE
+        return recorder._measure(name, rows)
+
+    @contextmanager
+    def _measure(self, name: str, rows: int | None):
+        memory = self.track_memory and tracemalloc.is_tracing()
+        allocated_before = tracemalloc.get_traced_memory()[0] if memory else 0
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            allocated = tracemalloc.get_traced_memory()[0] - allocated_before if memory else 0
+            self.record(name, elapsed, rows, allocated)
+
+    def record(self, name: str, seconds: float, rows: int | None = None, alloc_bytes: int = 0) -> None:
+        with self._lock:
+            stats = self._stages.get(name)
+            if stats is None:
+                stats = self._stages[name] = _StageStats()
+            stats.calls += 1
+            stats.total_s += seconds
+            stats.last_s = seconds
+            stats.max_s = max(stats.max_s, seconds)
+            stats.rows += rows or 0
+            stats.alloc_bytes += alloc_bytes
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                name: {
+                    "calls": stats.calls,
+                    "total_s": stats.total_s,
+                    "mean_s": stats.total_s / stats.calls,
+                    "max_s": stats.max_s,
+                    "last_s": stats.last_s,
+                    "rows": stats.rows,
+                    "alloc_bytes": stats.alloc_bytes,
+                }
+                for name, stats in sorted(self._stages.items())
+            }
+
+    # текстовый формат Prometheus (exposition format 0.0.4)
+    def to_prometheus(self, prefix: str = "analyzer") -> str:
+        snapshot = self.snapshot()
+        series = [
+            ("stage_calls_total", "counter", "Number of stage executions", "calls"),
+            ("stage_seconds_total", "counter", "Total time spent in stage", "total_s"),
+            ("stage_seconds_max", "gauge", "Slowest stage execution", "max_s"),
+            ("stage_rows_total", "counter", "Rows processed by stage", "rows"),
+            ("stage_alloc_bytes_total", "gauge", "Net bytes allocated by stage (tracemalloc)", "alloc_bytes"),
+        ]
+        lines = []
+        for suffix, kind, help_text, key in series:
+            metric = f"{prefix}_{suffix}"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for name, stats in snapshot.items():
+                label = name.replace("\\", "\\\\").replace('"', '\\"')
+                lines.append(f'{metric}{{stage="{label}"}} {stats[key]}')
+        return "\n".join(lines) + "\n"
+
+
+# привязать recorder к текущему контексту (None - снова общий metrics)
+def bind(recorder: MetricsRecorder | None) -> None:
+    _bound.set(recorder)
+
+
+_env = os.environ.get("ANALYZER_METRICS", "").lower()
+metrics = MetricsRecorder(enabled=_env not in ("", "0", "false"), track_memory=_env == "memory")
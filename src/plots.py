@@ -0,0 +1,259 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+"""
+Построение графиков (plotly). Модуль импортируется лениво из HistoricalDataAnalyzer.plot_*,
+поэтому анализ без графиков (батч, воркеры) plotly не загружает.
+"""
+
+
+# прореживание для графиков: в каждой корзине оставляем точки минимума и максимума (плюс первую и последнюю),
+# так пики и провалы не теряются, а число точек ограничено max_points (примерно ширина графика в пикселях x2)
+def minmax_downsample_indices(values: np.ndarray, max_points: int | None) -> np.ndarray:
+    n = len(values)
+    if max_points is None or n <= max_points:
+        return np.arange(n)
+    n_buckets = max(1, (max_points - 2) // 2)
+    bucket = -(-n // n_buckets)
+    padded = np.full(n_buckets * bucket, np.nan)
+    padded[:n] = values
+    padded = padded.reshape(n_buckets, bucket)
+    offsets = np.arange(n_buckets) * bucket
+    lows = offsets + np.argmin(np.where(np.isnan(padded), np.inf, padded), axis=1)
+    highs = offsets + np.argmax(np.where(np.isnan(padded), -np.inf, padded), axis=1)
+    indices = np.unique(np.concatenate(([0, n - 1], lows, highs)))
+    return indices[indices < n]
+
+
+# видимый диапазон по оси времени + прореживание; возвращает позиции строк city_data
+def _plot_positions(timestamps: pd.Series, values: pd.Series, max_points: int | None, x_range: tuple | None):
+    positions = np.arange(len(timestamps))
+    if x_range is not None:
+        start, end = pd.Timestamp(x_range[0]), pd.Timestamp(x_range[1])
+        ts = timestamps.to_numpy()
+        positions = positions[(ts >= start.to_datetime64()) & (ts <= end.to_datetime64())]
+    return positions[minmax_downsample_indices(values.to_numpy(dtype=float)[positions], max_points)]
+
+
+def plot_time_series(
+    series: pd.DataFrame, anomalies: pd.DataFrame, ma_col: str, max_points: int | None, x_range: tuple | None
+) -> go.Figure:
+    if x_range is not None:
+        anomalies = anomalies[anomalies["timestamp"].between(pd.Timestamp(x_range[0]), pd.Timestamp(x_range[1]))]
+    positions = _plot_positions(series["timestamp"], series["temperature"], max_points, x_range)
+    visible = series.iloc[positions]
+    fig = go.Figure()
+    fig.add_trace(
+        go.Scatter(
+            x=visible["timestamp"],
+            y=visible["temperature"],
+            mode="lines",
+            name="Температура",
+        )
+    )
+    fig.add_trace(go.Scatter(x=visible["timestamp"], y=visible[ma_col], mode="lines", name="MA"))
+    fig.add_trace(
+        go.Scatter(
+            x=anomalies["timestamp"],
+            y=anomalies["temperature"],
+            mode="markers",
+            name="Аномалии",
+            marker=dict(color="red"),
+        )
+    )
+    fig.update_layout(
+        title="Временной ряд температуры",
+        xaxis_title="Дата",
+        yaxis_title="Температура (°C)",
+        width=800,
+        height=600,
+    )
+    return fig
+
+
+def plot_seasonal_profile(seasonal_stats: pd.DataFrame) -> go.Figure:
+    fig = go.Figure()
+    fig.add_trace(go.Bar(x=seasonal_stats.index, y=seasonal_stats["mean"], name="Среднее"))
+    fig.add_trace(
+        go.Scatter(
+            x=seasonal_stats.index,
+            y=seasonal_stats["mean"],
+            mode="markers",
+            marker=dict(color="rgba(0,0,0,0)", size=0),
+            error_y=dict(type="data", array=seasonal_stats["std"], visible=True),
+            name="STD",
+        )
+    )
+    fig.update_layout(
+        title="Сезонный профиль",
+        xaxis_title="Сезон",
+        yaxis_title="Температура (°C)",
+        width=800,
+        height=600,
+    )
+    return fig
+
+
+def plot_heatmap_anomalies(anomalies: pd.DataFrame) -> go.Figure:
+    if len(anomalies) == 0:
+        return plot_anomaly_heatmap(pd.DataFrame())
+    # без добавления колонок: anomalies может лежать в кэше результатов
+    year = anomalies["timestamp"].dt.year.rename("year")
+    month = anomalies["timestamp"].dt.month.rename("month")
+    return plot_anomaly_heatmap(anomalies.groupby([year, month]).size().unstack(fill_value=0))
+
+
+# heatmap_data - число аномалий, строки - годы, колонки - месяцы (например, RollupCube.row_heatmap)
+def plot_anomaly_heatmap(heatmap_data: pd.DataFrame) -> go.Figure:
+    if heatmap_data.size == 0:
+        fig = go.Figure()
+        fig.update_layout(title="Тепловая карта аномалий (нет данных)", width=800, height=600)
+        return fig
+    fig = go.Figure(
+        data=go.Heatmap(
+            z=heatmap_data.values,
+            x=heatmap_data.columns,
+            y=heatmap_data.index,
+            colorscale="Reds",
+        )
+    )
+    fig.update_layout(
+        title="Тепловая карта аномалий",
+        xaxis_title="Месяц",
+        yaxis_title="Год",
+        width=800,
+        height=600,
+    )
+    return fig
+
+
+# доля аномалий (%) по окну и порогу для одного города; frame - AnomalySweep.city_frame(city, percent=True)
+def plot_anomaly_sweep(
+    frame: pd.DataFrame, window_size: int | None = None, threshold: float | None = None
+) -> go.Figure:
+    fig = go.Figure(
+        data=go.Heatmap(
+            z=frame.values,
+            x=frame.columns,
+            y=frame.index,
+            colorscale="Reds",
+            colorbar={"title": "%"},
+        )
+    )
+    if window_size is not None and threshold is not None:
+        fig.add_trace(
+            go.Scatter(
+                x=[threshold], y=[window_size], mode="markers", marker={"color": "black", "size": 10}, name="Текущие"
+            )
+        )
+    fig.update_layout(
+        title="Доля аномалий по окну и порогу",
+        xaxis_title="Порог (σ)",
+        yaxis_title="Окно (дней)",
+        width=800,
+        height=600,
+    )
+    return fig
+
+
+# days - дни от первого наблюдения в порядке строк city_data
+def plot_trend(
+    city_data: pd.DataFrame, days: np.ndarray, trend: dict, max_points: int | None, x_range: tuple | None
+) -> go.Figure:
+    city_data = city_data.copy()
+    city_data["timestamp"] = pd.to_datetime(city_data["timestamp"])  # Фикс: Убедимся в типе
+    city_data["days"] = days
+    positions = _plot_positions(city_data["timestamp"], city_data["temperature"], max_points, x_range)
+    city_data = city_data.iloc[positions]
+    trend_line = trend["intercept"] + trend["slope"] * city_data["days"]
+    fig = go.Figure()
+    fig.add_trace(
+        go.Scatter(
+            x=city_data["timestamp"],
+            y=city_data["temperature"],
+            mode="markers",
+            name="Данные",
+            marker=dict(opacity=0.5),
+        )
+    )
+    fig.add_trace(go.Scatter(x=city_data["timestamp"], y=trend_line, mode="lines", name="Тренд"))
+    fig.update_layout(
+        title="Долгосрочный тренд",
+        xaxis_title="Дата",
+        yaxis_title="Температура (°C)",
+        width=800,
+        height=600,
+    )
+    return fig
+
+
+def plot_seasonal_boxplot(city_data: pd.DataFrame) -> go.Figure:
+    fig = go.Figure()
+    for season in city_data["season"].unique():
+        season_data = city_data[city_data["season"] == season]["temperature"]
+        fig.add_trace(go.Box(y=season_data, name=season))
+    fig.update_layout(
+        title="Boxplot температур по сезонам",
+        xaxis_title="Сезон",
+        yaxis_title="Температура (°C)",
+        width=800,
+        height=600,
+    )
+    return fig
+
+
+# boxplot по готовым статистикам (RollupCube.seasonal_box): q25/q50/q75, min/max как усы, mean и std
+def plot_seasonal_box_stats(box: pd.DataFrame) -> go.Figure:
+    fig = go.Figure()
+    for season, row in box.iterrows():
+        fig.add_trace(
+            go.Box(
+                x=[season],
+                q1=[row["q25"]],
+                median=[row["q50"]],
+                q3=[row["q75"]],
+                lowerfence=[row["min"]],
+                upperfence=[row["max"]],
+                mean=[row["mean"]],
+                sd=[row["std"]],
+                name=season,
+            )
+        )
+    fig.update_layout(
+        title="Boxplot температур по сезонам",
+        xaxis_title="Сезон",
+        yaxis_title="Температура (°C)",
+        width=800,
+        height=600,
+    )
+    return fig
+
+
+def plot_temperature_scatter(
+    city_data: pd.DataFrame, days: np.ndarray, trend: dict, max_points: int | None, x_range: tuple | None
+) -> go.Figure:
+    city_data = city_data.copy()
+    city_data["timestamp"] = pd.to_datetime(city_data["timestamp"])
+    city_data["days"] = days
+    positions = _plot_positions(city_data["timestamp"], city_data["temperature"], max_points, x_range)
+    city_data = city_data.iloc[positions]
+    trend_line = trend["intercept"] + trend["slope"] * city_data["days"]
+    fig = go.Figure()
+    fig.add_trace(
+        go.Scatter(
+            x=city_data["days"],
+            y=city_data["temperature"],
+            mode="markers",
+            name="Температура",
+        )
+    )
+    fig.add_trace(go.Scatter(x=city_data["days"], y=trend_line, mode="lines", name="Тренд"))
+    fig.update_layout(
+        title="Scatter температуры vs дней",
+        xaxis_title="Дни",
+        yaxis_title="Температура (°C)",
+        width=800,
+        height=600,
+    )
+    return fig
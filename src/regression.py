@@ -0,0 +1,180 @@
+import math
+
+import numpy as np
+
+"""
+Линейная регрессия y ~ x в замкнутой форме сразу для многих групп (городов, десятилетий, окон).
+Группа - непрерывный отрезок строк [start, stop), по нему считаются центрированные суммы
+(n, mean_x, mean_y, Sxx, Syy, Sxy), из них - slope/intercept/r/p/stderr как у scipy.stats.linregress.
+p-value - через регуляризованную неполную бета-функцию (распределение Стьюдента) на NumPy, без scipy.
+"""
+
+NS_PER_DAY = 86_400_000_000_000
+
+_lgamma = np.vectorize(math.lgamma, otypes=[float])
+
+
+# непрерывная дробь для I_x(a, b) (модифицированный метод Лентца), векторно по всем элементам
+def _betacf(a: np.ndarray, b: np.ndarray, x: np.ndarray, eps: float = 1e-15, max_iter: int = 10_000) -> np.ndarray:
+    tiny = 1e-300
+    qab = a + b
+    qap = a + 1.0
+    qam = a - 1.0
+    c = np.ones_like(x)
+    d = 1.0 - qab * x / qap
+    d = np.where(np.abs(d) < tiny, tiny, d)
+    d = 1.0 / d
+    h = d.copy()
+    active = np.ones(x.shape, dtype=bool)
+    for m in range(1, max_iter + 1):
+        m2 = 2 * m
+        aa = m * (b - m) * x / ((qam + m2) * (a + m2))
+        d = 1.0 + aa * d
+        d = np.where(np.abs(d) < tiny, tiny, d)
+        c = 1.0 + aa / c
+        c = np.where(np.abs(c) < tiny, tiny, c)
+        d = 1.0 / d
+        h = np.where(active, h * d * c, h)
+        aa = -(a + m) * (qab + m) * x / ((a + m2) * (qap + m2))
+        d = 1.0 + aa * d
+        d = np.where(np.abs(d) < tiny, tiny, d)
+        c = 1.0 + aa / c
+        c = np.where(np.abs(c) < tiny, tiny, c)
+        d = 1.0 / d
+        delta = d * c
+        h = np.where(active, h * delta, h)
+        active &= np.abs(delta - 1.0) > eps
+        if not active.any():
+            break
+    return h
+
+
+# регуляризованная неполная бета-функция I_x(a, b)
+def betainc(a, b, x) -> np.ndarray:
+    a, b, x = np.broadcast_arrays(*(np.asarray(v, dtype=float) for v in (a, b, x)))
+    result = np.full(x.shape, np.nan)
+    inside = (x > 0) & (x < 1) & (a > 0) & (b > 0)
+    result[(x <= 0) & (a > 0) & (b > 0)] = 0.0
+    result[(x >= 1) & (a > 0) & (b > 0)] = 1.0
+    if inside.any():
+        a, b, x = a[inside], b[inside], x[inside]
+        log_front = _lgamma(a + b) - _lgamma(a) - _lgamma(b) + a * np.log(x) + b * np.log1p(-x)
+        # дробь быстро сходится при x < (a+1)/(a+b+2), иначе через симметрию I_x(a,b) = 1 - I_{1-x}(b,a)
+        direct = x < (a + 1.0) / (a + b + 2.0)
+        values = np.empty(x.shape)
+        values[direct] = np.exp(log_front[direct]) * _betacf(a[direct], b[direct], x[direct]) / a[direct]
+        flip = ~direct
+        values[flip] = 1.0 - np.exp(log_front[flip]) * _betacf(b[flip], a[flip], 1.0 - x[flip]) / b[flip]
+        result[inside] = values
+    return result
+
+
+# двусторонний p-value для t-статистики: P(|T| > |t|) = I_{dof/(dof+t^2)}(dof/2, 1/2)
+def student_t_two_sided(t_stat, dof) -> np.ndarray:
+    t_stat, dof = np.broadcast_arrays(np.asarray(t_stat, dtype=float), np.asarray(dof, dtype=float))
+    with np.errstate(invalid="ignore", divide="ignore", over="ignore"):
+        x = dof / (dof + t_stat * t_stat)
+    x = np.where(np.isinf(t_stat), 0.0, x)
+    return betainc(dof / 2.0, 0.5, x)
+
+
+# регрессия по центрированным суммам, все аргументы - массивы по группам
+def regression_from_moments(n, mean_x, mean_y, sxx, syy, sxy) -> dict:
+    n, mean_x, mean_y, sxx, syy, sxy = (np.asarray(v, dtype=float) for v in (n, mean_x, mean_y, sxx, syy, sxy))
+    dof = n - 2
+    with np.errstate(invalid="ignore", divide="ignore"):
+        slope = sxy / sxx
+        intercept = mean_y - slope * mean_x
+        r_value = np.clip(sxy / np.sqrt(sxx * syy), -1.0, 1.0)
+        t_stat = r_value * np.sqrt(dof / ((1.0 - r_value) * (1.0 + r_value)))
+        std_err = np.sqrt((1.0 - r_value * r_value) * syy / sxx / dof)
+        intercept_stderr = std_err * np.sqrt(sxx / n + mean_x * mean_x)
+    p_value = student_t_two_sided(np.abs(t_stat), dof)
+    # как в linregress: через две точки прямая проходит точно (p = 0, или 1 при одинаковых y),
+    # меньше двух точек - статистики не определены
+    two_points = (n == 2) & (sxx > 0)
+    p_value[two_points] = np.where(syy[two_points] > 0, 0.0, 1.0)
+    std_err[two_points] = 0.0
+    intercept_stderr[two_points] = 0.0
+    p_value[n < 2] = np.nan
+    return {
+        "slope": slope,
+        "intercept": intercept,
+        "r_value": r_value,
+        "p_value": p_value,
+        "std_err": std_err,
+        "intercept_stderr": intercept_stderr,
+        "count": n,
+    }
+
+
+# центрированные суммы по отрезкам [start, stop) (отрезки идут подряд и не пустые).
+# Пары, где x или y не конечны (NaN-пропуски), не участвуют, n - число оставшихся пар
+def segment_moments(x: np.ndarray, y: np.ndarray, starts: np.ndarray, stops: np.ndarray) -> tuple:
+    counts = stops - starts
+    valid = np.isfinite(x) & np.isfinite(y)
+    x = np.where(valid, x, 0.0)
+    y = np.where(valid, y, 0.0)
+    n = np.add.reduceat(valid.astype(float), starts)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_x = np.add.reduceat(x, starts) / n
+        mean_y = np.add.reduceat(y, starts) / n
+    dx = np.where(valid, x - np.repeat(mean_x, counts), 0.0)
+    dy = np.where(valid, y - np.repeat(mean_y, counts), 0.0)
+    sxx = np.add.reduceat(dx * dx, starts)
+    syy = np.add.reduceat(dy * dy, starts)
+    sxy = np.add.reduceat(dx * dy, starts)
+    return n, mean_x, mean_y, sxx, syy, sxy
+
+
+def segment_regression(x: np.ndarray, y: np.ndarray, starts: np.ndarray, stops: np.ndarray) -> dict:
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if len(starts) == 0:
+        return regression_from_moments(*(np.empty(0),) * 6)
+    return regression_from_moments(*segment_moments(x, y, np.asarray(starts), np.asarray(stops)))
+
+
+# регрессия в скользящем окне из window строк (окно заканчивается на текущей строке),
+# префиксные суммы внутри каждого отрезка; x сдвигается к началу отрезка, чтобы не терять точность
+def rolling_regression(x: np.ndarray, y: np.ndarray, starts: np.ndarray, stops: np.ndarray, window: int) -> dict:
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    starts = np.asarray(starts, dtype=np.int64)
+    stops = np.asarray(stops, dtype=np.int64)
+    counts = stops - starts
+    x = x - np.repeat(x[starts], counts) if len(x) else x
+    # пары с NaN не входят ни в суммы, ни в n (окно по-прежнему - window строк)
+    valid = np.isfinite(x) & np.isfinite(y)
+    x = np.where(valid, x, 0.0)
+    y = np.where(valid, y, 0.0)
+
+    def prefix(values: np.ndarray) -> np.ndarray:
+        return np.concatenate(([0.0], np.cumsum(values)))
+
+    pn, px, py, pxx, pyy, pxy = (prefix(v) for v in (valid, x, y, x * x, y * y, x * y))
+    positions = np.arange(len(x))
+    segment_start = np.repeat(starts, counts)
+    hi = positions + 1
+    lo = np.maximum(hi - window, segment_start)
+    n = pn[hi] - pn[lo]
+    sx = px[hi] - px[lo]
+    sy = py[hi] - py[lo]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_x = sx / n
+        mean_y = sy / n
+        sxx = np.maximum(pxx[hi] - pxx[lo] - sx * mean_x, 0.0)
+        syy = np.maximum(pyy[hi] - pyy[lo] - sy * mean_y, 0.0)
+        sxy = pxy[hi] - pxy[lo] - sx * mean_y
+    return regression_from_moments(n, mean_x, mean_y, sxx, syy, sxy)
+
+
+# дни от первого наблюдения (как (ts - ts.min()).dt.days) без pd.to_datetime и копий
+def days_since_start(timestamps: np.ndarray, starts: np.ndarray | None = None, stops: np.ndarray | None = None):
+    ts_ns = np.asarray(timestamps).astype("datetime64[ns]").astype(np.int64)
+    if starts is None:
+        first = ts_ns.min() if len(ts_ns) else 0
+        return (ts_ns - first) // NS_PER_DAY
+    counts = np.asarray(stops) - np.asarray(starts)
+    first = np.minimum.reduceat(ts_ns, starts) if len(starts) else np.empty(0, dtype=np.int64)
+    return (ts_ns - np.repeat(first, counts)) // NS_PER_DAY
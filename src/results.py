@@ -0,0 +1,301 @@
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+
+from robust_window import rolling_median_mad
+
+"""
+Компактные результаты анализа города вместо вложенных dict с копиями DataFrame.
+Аномалии хранятся позициями строк в срезе города (срез df анализатора, без копии) и значениями окна
+только для аномальных строк; сезонный профиль - четыре массива. DataFrame (таблица аномалий, ряд с MA,
+сезонный профиль) собирается лениво, только когда его просят, поэтому результаты тысяч городов
+в памяти и при pickle из воркеров почти ничего не весят.
+
+Для совместимости с прежним форматом объекты читаются как словари: result["anomalies"]["anomaly_count"].
+"""
+
+# режимы аномалий: std - среднее ± k·σ окна, mad - медиана ± k·1.4826·MAD (устойчив к выбросам)
+ANOMALY_MODES = ("std", "mad")
+
+
+# скользящие центр/масштаб с center=True и min_periods=1 (как в detect_anomalies).
+# В режиме mad вместо среднего - медиана, вместо std - 1.4826 * MAD
+def rolling_moments(temperature: pd.Series, window_size: int, mode: str = "std") -> tuple:
+    if mode == "mad":
+        median, scale = rolling_median_mad(temperature.to_numpy(dtype=float), window_size)
+        return pd.Series(median, index=temperature.index), pd.Series(scale, index=temperature.index)
+    if mode != "std":
+        raise ValueError(f"Invalid anomaly mode: {mode}")
+    rolling = temperature.rolling(window=window_size, center=True, min_periods=1)
+    return rolling.mean(), rolling.std()
+
+
+class _ResultMapping(Mapping):
+    __slots__ = ()
+    _keys = ()
+
+    def __getitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    # без вычисления ленивых полей (Mapping.__contains__ дергает __getitem__)
+    def __contains__(self, key) -> bool:
+        return key in self._keys
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self._repr_fields)
+        return f"{type(self).__name__}({fields})"
+
+    def __getstate__(self) -> dict:
+        return {name: getattr(self, name) for name in self._pickled}
+
+    def __setstate__(self, state: dict) -> None:
+        for name in self.__slots__:
+            setattr(self, name, state.get(name))
+
+
+class AnomalyResult(_ResultMapping):
+    __slots__ = (
+        "window_size",
+        "threshold",
+        "mode",
+        "positions",
+        "ma",
+        "std",
+        "total",
+        "base_start",
+        "_source",
+        "_frame",
+        "_series",
+        "_window",
+    )
+    _keys = ("anomalies", "anomaly_count", "anomaly_percent", "series", "mask", "window_size", "threshold", "mode")
+    _repr_fields = ("window_size", "threshold", "mode", "anomaly_count", "total")
+    _pickled = ("window_size", "threshold", "mode", "positions", "ma", "std", "total", "base_start")
+
+    # source - строки города по времени; base_start - позиция source в df анализатора, если source - его срез
+    # (тогда при pickle строки не передаются, а после загрузки подключаются через attach).
+    # В режиме mad колонки ma_/std_ хранят медиану окна и 1.4826 * MAD.
+    # window - (ma, std) по всем строкам source из того же прохода анализа: ряд для графика строится без
+    # повторного окна. В pickle не передается (весит как сам ряд), после загрузки окно считается заново
+    def __init__(
+        self,
+        source: pd.DataFrame,
+        positions: np.ndarray,
+        ma: np.ndarray,
+        std: np.ndarray,
+        window_size: int,
+        threshold: float,
+        base_start: int | None = None,
+        mode: str = "std",
+        window: tuple | None = None,
+    ):
+        self._source = source
+        self.total = len(source)
+        self.positions = np.asarray(positions, dtype=np.int32 if self.total < 2**31 else np.int64)
+        self.ma = np.asarray(ma, dtype=float)
+        self.std = np.asarray(std, dtype=float)
+        self.window_size = window_size
+        self.threshold = threshold
+        self.mode = mode
+        self.base_start = base_start
+        self._frame = None
+        self._series = None
+        self._window = window
+
+    def __getstate__(self) -> dict:
+        state = super().__getstate__()
+        if self.base_start is None:
+            state["_source"] = self._source
+        return state
+
+    def attach(self, df: pd.DataFrame) -> None:
+        if self._source is None and self.base_start is not None:
+            self._source = df.iloc[self.base_start : self.base_start + self.total]
+
+    @property
+    def source(self) -> pd.DataFrame:
+        if self._source is None:
+            raise ValueError("Result is detached from analyzer data, call attach(df) first")
+        return self._source
+
+    @property
+    def anomaly_count(self) -> int:
+        return len(self.positions)
+
+    @property
+    def anomaly_percent(self) -> float:
+        return (len(self.positions) / self.total) * 100 if self.total > 0 else 0
+
+    @property
+    def mask(self) -> np.ndarray:
+        mask = np.zeros(self.total, dtype=bool)
+        mask[self.positions] = True
+        return mask
+
+    # таблица аномалий: строки города + ma/std окна и отклонение
+    @property
+    def anomalies(self) -> pd.DataFrame:
+        if self._frame is None:
+            frame = self.source.iloc[self.positions].copy()
+            frame[f"ma_{self.window_size}"] = self.ma
+            frame[f"std_{self.window_size}"] = self.std
+            frame["deviation"] = frame["temperature"].to_numpy(dtype=float) - self.ma
+            self._frame = frame
+        return self._frame
+
+    # весь ряд с ma/std (для графика); окно берется из анализа, пересчитывается только после pickle
+    @property
+    def series(self) -> pd.DataFrame:
+        if self._series is None:
+            series = self.source.copy()
+            if self._window is not None:
+                ma, std = self._window
+            else:
+                ma, std = rolling_moments(series["temperature"], self.window_size, self.mode or "std")
+            series[f"ma_{self.window_size}"] = ma
+            series[f"std_{self.window_size}"] = std
+            self._series = series
+        return self._series
+
+
+class SeasonalProfile:
+    __slots__ = ("seasons", "mean", "std", "count")
+
+    def __init__(self, seasons, mean: np.ndarray, std: np.ndarray, count: np.ndarray):
+        self.seasons = seasons
+        self.mean = mean
+        self.std = std
+        self.count = count
+
+    # профиль по строкам одного города: bincount по кодам сезона (порядок сезонов как у groupby).
+    # Пустые температуры (NaN) пропускаются, как в groupby: сезон остается в профиле, count - без них
+    @classmethod
+    def from_frame(cls, city_data: pd.DataFrame) -> "SeasonalProfile":
+        season = city_data["season"]
+        if isinstance(season.dtype, pd.CategoricalDtype):
+            codes = season.cat.codes.to_numpy().astype(np.int64)
+            categories = season.cat.categories
+        else:
+            codes, categories = pd.factorize(season, sort=True)
+        temps = city_data["temperature"].to_numpy(dtype=float)
+        present = np.flatnonzero(np.bincount(codes, minlength=len(categories)))
+        finite = np.isfinite(temps)
+        codes, temps = codes[finite], temps[finite]
+        count = np.bincount(codes, minlength=len(categories))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.bincount(codes, weights=temps, minlength=len(categories)) / count
+            deviation = temps - mean[codes]
+            std = np.sqrt(np.bincount(codes, weights=deviation * deviation, minlength=len(categories)) / (count - 1))
+        std[count < 2] = np.nan
+        return cls(np.asarray(categories, dtype=object)[present], mean[present], std[present], count[present])
+
+    def __repr__(self) -> str:
+        return f"SeasonalProfile(seasons={list(self.seasons)!r})"
+
+    def to_frame(self) -> pd.DataFrame:
+        seasonal_stats = pd.DataFrame(
+            {"mean": self.mean, "std": self.std, "count": np.asarray(self.count, dtype=np.int64)},
+            index=pd.Index(self.seasons, dtype=object, name="season"),
+        )
+        seasonal_stats["lower"] = seasonal_stats["mean"] - seasonal_stats["std"]
+        seasonal_stats["upper"] = seasonal_stats["mean"] + seasonal_stats["std"]
+        return seasonal_stats
+
+
+class TrendResult(_ResultMapping):
+    __slots__ = ("slope", "intercept", "r_value", "p_value", "std_err", "days")
+    _keys = ("slope", "intercept", "r_value", "p_value", "std_err", "days", "trend_description")
+    _repr_fields = ("slope", "intercept", "r_value", "p_value")
+    # days - ось x для графика, пересчитывается дешево, поэтому в pickle не уходит
+    _pickled = ("slope", "intercept", "r_value", "p_value", "std_err")
+
+    def __init__(self, slope, intercept, r_value, p_value, std_err, days: np.ndarray | None = None):
+        self.slope = slope
+        self.intercept = intercept
+        self.r_value = r_value
+        self.p_value = p_value
+        self.std_err = std_err
+        self.days = days
+
+    @property
+    def trend_description(self) -> str:
+        return f"Тренд: {'рост' if self.slope > 0 else 'падение'} на {abs(self.slope):.4f}°C в день (R²={self.r_value**2:.2f})"
+
+
+class CityAnalysis(_ResultMapping):
+    __slots__ = ("city", "stats", "anomalies", "seasonal_profile", "trend")
+    _keys = ("city", "stats", "anomalies", "seasonal", "trend")
+    _repr_fields = ("city", "anomalies", "trend")
+    _pickled = __slots__
+
+    def __init__(
+        self, city: str, stats: dict, anomalies: AnomalyResult, seasonal_profile: SeasonalProfile, trend: TrendResult
+    ):
+        self.city = city
+        self.stats = stats
+        self.anomalies = anomalies
+        self.seasonal_profile = seasonal_profile
+        self.trend = trend
+
+    @property
+    def seasonal(self) -> pd.DataFrame:
+        return self.seasonal_profile.to_frame()
+
+    def attach(self, df: pd.DataFrame) -> None:
+        self.anomalies.attach(df)
+
+
+class AnomalySweep:
+    __slots__ = ("cities", "window_sizes", "thresholds", "counts", "totals")
+
+    # counts[city, window, threshold] - число аномалий; totals - строк у города
+    def __init__(self, cities: list, window_sizes, thresholds, counts: np.ndarray, totals: np.ndarray):
+        self.cities = list(cities)
+        self.window_sizes = np.asarray(window_sizes, dtype=np.int64)
+        self.thresholds = np.asarray(thresholds, dtype=float)
+        self.counts = counts
+        self.totals = np.asarray(totals, dtype=np.int64)
+
+    def __repr__(self) -> str:
+        sizes = f"cities={len(self.cities)}, windows={len(self.window_sizes)}, thresholds={len(self.thresholds)}"
+        return f"AnomalySweep({sizes})"
+
+    @property
+    def percent(self) -> np.ndarray:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.totals[:, None, None] > 0, self.counts / self.totals[:, None, None] * 100, 0.0)
+
+    def count(self, city: str, window_size: int, threshold: float) -> int:
+        w = np.flatnonzero(self.window_sizes == window_size)
+        t = np.flatnonzero(np.isclose(self.thresholds, threshold))
+        if not len(w) or not len(t):
+            raise KeyError((window_size, threshold))
+        return int(self.counts[self.cities.index(city), w[0], t[0]])
+
+    # окна x пороги для одного города (для тепловой карты)
+    def city_frame(self, city: str, percent: bool = False) -> pd.DataFrame:
+        i = self.cities.index(city)
+        values = self.percent[i] if percent else self.counts[i]
+        return pd.DataFrame(
+            values,
+            index=pd.Index(self.window_sizes, name="window_size"),
+            columns=pd.Index(self.thresholds, name="threshold"),
+        )
+
+    # длинная таблица city, window_size, threshold, anomaly_count, anomaly_percent
+    def to_frame(self) -> pd.DataFrame:
+        index = pd.MultiIndex.from_product(
+            [self.cities, self.window_sizes, self.thresholds], names=["city", "window_size", "threshold"]
+        )
+        return pd.DataFrame(
+            {"anomaly_count": self.counts.ravel(), "anomaly_percent": self.percent.ravel()}, index=index
+        )
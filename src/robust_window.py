@@ -0,0 +1,88 @@
+from bisect import bisect_left, insort
+
+import numpy as np
+
+"""
+Скользящие медиана и MAD для устойчивого режима аномалий: выброс раздувает std окна и прячет
+соседние аномалии, а медиана и MAD от единичных выбросов почти не сдвигаются.
+
+Окно - отсортированный список: при сдвиге одно значение вставляется и одно удаляется (поиск места -
+бинарный, O(log w)). Медиана - средний элемент. MAD = медиана |x - median|: отклонения влево и вправо
+от медианы - две уже отсортированные последовательности, поэтому нужный порядковый элемент их слияния
+ищется бинарным поиском, без сортировки отклонений. Итого O(n log w) сравнений на ряд вместо
+rolling().apply с полной медианой на каждое окно.
+
+Окно центрированное с min_periods=1, как rolling(center=True) в detect_anomalies. Масштаб возвращается
+как 1.4826 * MAD - оценка σ для нормального распределения, так что порог в σ сравним с режимом mean/std.
+"""
+
+MAD_TO_SIGMA = 1.4826
+
+
+# k-й (с нуля) по возрастанию элемент |s - med| для отсортированного окна s;
+# слева от split - значения меньше медианы (их отклонения растут справа налево), справа - остальные
+def _kth_deviation(window: list, split: int, med: float, k: int) -> float:
+    right = len(window) - split
+    lo = max(0, k + 1 - right)
+    hi = min(k + 1, split)
+    # lo..hi - сколько из k+1 наименьших отклонений приходится на левую часть
+    while lo < hi:
+        taken = (lo + hi) // 2
+        if med - window[split - 1 - taken] < window[split + k - taken] - med:
+            lo = taken + 1
+        else:
+            hi = taken
+    left_value = med - window[split - lo] if lo > 0 else -np.inf
+    right_value = window[split + k - lo] - med if k - lo >= 0 else -np.inf
+    return max(left_value, right_value)
+
+
+def _window_median_mad(window: list) -> tuple:
+    size = len(window)
+    half = size // 2
+    med = window[half] if size % 2 else (window[half - 1] + window[half]) / 2
+    split = bisect_left(window, med)
+    if size % 2:
+        mad = _kth_deviation(window, split, med, half)
+    else:
+        mad = (_kth_deviation(window, split, med, half - 1) + _kth_deviation(window, split, med, half)) / 2
+    return med, mad
+
+
+def _segment_median_mad(values: list, window_size: int, median: np.ndarray, scale: np.ndarray, offset: int) -> None:
+    n = len(values)
+    ahead = (window_size - 1) // 2 + 1
+    window = []
+    added = removed = 0
+    for i in range(n):
+        end = min(i + ahead, n)
+        while added < end:
+            # NaN в окно не попадают (как в rolling().median()): их нельзя упорядочить
+            if values[added] == values[added]:
+                insort(window, values[added])
+            added += 1
+        start = max(i + ahead - window_size, 0)
+        while removed < start:
+            if values[removed] == values[removed]:
+                del window[bisect_left(window, values[removed])]
+            removed += 1
+        if not window:
+            continue
+        med, mad = _window_median_mad(window)
+        median[offset + i] = med
+        scale[offset + i] = mad * MAD_TO_SIGMA if len(window) > 1 else np.nan
+
+
+# медиана и 1.4826 * MAD в центрированном окне; starts/stops - независимые отрезки (города),
+# окно не переходит через границу отрезка. NaN пропускаются; окно без значений дает NaN
+def rolling_median_mad(
+    values: np.ndarray, window_size: int, starts: np.ndarray | None = None, stops: np.ndarray | None = None
+) -> tuple:
+    values = np.asarray(values, dtype=float)
+    if starts is None:
+        starts, stops = [0], [len(values)]
+    median = np.full(len(values), np.nan)
+    scale = np.full(len(values), np.nan)
+    for start, stop in zip(starts, stops):
+        _segment_median_mad(values[start:stop].tolist(), window_size, median, scale, int(start))
+    return median, scale
@@ -0,0 +1,244 @@
+import numpy as np
+import pandas as pd
+
+from results import SeasonalProfile
+from seasonal_norms import SeasonalNorms
+
+"""
+Куб агрегатов город x год x месяц x сезон, строится один раз на набор данных.
+Ячейка - непрерывный отрезок строк с одинаковыми (город, год, месяц, сезон): в df анализатора строки
+отсортированы по (city, timestamp), так что хватает reduceat по границам отрезков, без groupby.
+В ячейке: count, mean, M2 (сумма квадратов отклонений от среднего ячейки), min, max и скетч квантилей -
+разреженная гистограмма с шагом bin_width (°C).
+
+Сезонные, месячные и годовые представления - переагрегация ячеек (их в ~30 раз меньше строк для
+дневных данных): count и сумма складываются, M2 объединяется формулой Чана
+(M2 = sum(M2_i + n_i * (mean_i - mean)^2)), так что std (ddof=1) совпадает с посчитанным по строкам.
+Квантили из скетча приближенные: ошибка не больше bin_width, min/max точные.
+
+Пустые температуры (NaN) в агрегаты и скетч не попадают, как в groupby: границы ячеек по-прежнему
+по всем строкам (row_heatmap ищет ячейку по позиции строки), но count/mean/M2/min/max - только по
+непустым значениям. Ячейка без значений имеет count 0 и при переагрегации пропускается.
+"""
+
+_DIMENSIONS = ("city", "year", "month", "season")
+
+
+class RollupCube:
+    def __init__(
+        self,
+        cities: list,
+        seasons: list,
+        cells: dict,
+        run_starts: np.ndarray,
+        sketch: tuple,
+        bin_origin: float,
+        bin_width: float,
+    ):
+        self.cities = [str(city) for city in cities]
+        self.seasons = [str(season) for season in seasons]
+        # cells: city/season - коды, year, month, count, mean, m2, min, max - массивы по ячейкам
+        self.cells = cells
+        self.run_starts = run_starts
+        # скетч: (ячейка, корзина, число строк) для непустых корзин, отсортирован по ячейке и корзине
+        self.sketch_cells, self.sketch_bins, self.sketch_counts = sketch
+        self.bin_origin = bin_origin
+        self.bin_width = bin_width
+        self._city_codes = {city: code for code, city in enumerate(self.cities)}
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, bin_width: float = 0.5) -> "RollupCube":
+        city = df["city"].astype("category")
+        city_codes = city.cat.codes.to_numpy().astype(np.int64)
+        season_codes, seasons = pd.factorize(df["season"], sort=True)
+        months = df["timestamp"].to_numpy().astype("datetime64[M]").astype(np.int64)
+        temps = df["temperature"].to_numpy(dtype=float)
+        finite = np.isfinite(temps)
+        n = len(temps)
+        if n == 0:
+            empty = np.empty(0, dtype=np.int64)
+            cells = {name: empty for name in ("city", "year", "month", "season", "count")}
+            cells.update({name: np.empty(0) for name in ("mean", "m2", "min", "max")})
+            sketch = (empty, empty, empty)
+            return cls(list(city.cat.categories), list(seasons), cells, empty, sketch, 0.0, bin_width)
+
+        changed = (np.diff(city_codes) != 0) | (np.diff(months) != 0) | (np.diff(season_codes) != 0)
+        starts = np.flatnonzero(np.concatenate(([True], changed)))
+        rows = np.diff(np.append(starts, n))
+        filled = np.where(finite, temps, 0.0)
+        count = np.add.reduceat(finite.astype(np.int64), starts)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.add.reduceat(filled, starts) / count
+        deviation = np.where(finite, filled - np.repeat(mean, rows), 0.0)
+        cells = {
+            "city": city_codes[starts],
+            "year": months[starts] // 12 + 1970,
+            "month": months[starts] % 12 + 1,
+            "season": season_codes[starts].astype(np.int64),
+            "count": count,
+            "mean": mean,
+            "m2": np.add.reduceat(deviation * deviation, starts),
+            # fmin/fmax пропускают NaN; у ячейки без значений останется NaN
+            "min": np.fmin.reduceat(temps, starts),
+            "max": np.fmax.reduceat(temps, starts),
+        }
+
+        if not finite.any():
+            empty = np.empty(0, dtype=np.int64)
+            return cls(list(city.cat.categories), list(seasons), cells, starts, (empty, empty, empty), 0.0, bin_width)
+        row_cells = np.repeat(np.arange(len(starts)), rows)[finite]
+        temps = temps[finite]
+        bin_origin = np.floor(temps.min() / bin_width) * bin_width
+        bins = ((temps - bin_origin) // bin_width).astype(np.int64)
+        n_bins = int(bins.max()) + 1
+        keys, sketch_counts = np.unique(row_cells * n_bins + bins, return_counts=True)
+        sketch = (keys // n_bins, keys % n_bins, sketch_counts)
+        return cls(list(city.cat.categories), list(seasons), cells, starts, sketch, float(bin_origin), bin_width)
+
+    def __repr__(self) -> str:
+        sizes = f"cities={len(self.cities)}, cells={len(self.run_starts)}, sketch={len(self.sketch_cells)}"
+        return f"RollupCube({sizes})"
+
+    def _city_mask(self, city: str | None) -> np.ndarray:
+        if city is None:
+            return np.ones(len(self.run_starts), dtype=bool)
+        code = self._city_codes.get(city, -1)
+        return self.cells["city"] == code
+
+    # объединение ячеек по группам: groups - номер группы для каждой ячейки (-1 - ячейка не участвует).
+    # Ячейки без значений (count 0) пропускаются
+    def _merge(self, groups: np.ndarray, n_groups: int) -> dict:
+        used = (groups >= 0) & (self.cells["count"] > 0)
+        groups = groups[used]
+        cell_count = self.cells["count"][used]
+        cell_mean = self.cells["mean"][used]
+        count = np.bincount(groups, weights=cell_count, minlength=n_groups)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.bincount(groups, weights=cell_count * cell_mean, minlength=n_groups) / count
+            shift = cell_mean - mean[groups]
+            m2_parts = self.cells["m2"][used] + cell_count * shift * shift
+            m2 = np.bincount(groups, weights=m2_parts, minlength=n_groups)
+            std = np.sqrt(m2 / (count - 1))
+        std[count < 2] = np.nan
+        minimum = np.full(n_groups, np.inf)
+        maximum = np.full(n_groups, -np.inf)
+        np.minimum.at(minimum, groups, self.cells["min"][used])
+        np.maximum.at(maximum, groups, self.cells["max"][used])
+        return {"count": count.astype(np.int64), "mean": mean, "std": std, "min": minimum, "max": maximum}
+
+    # квантили групп по скетчу: линейная интерполяция внутри корзины, обрезка по точным min/max
+    def _quantiles(self, groups: np.ndarray, n_groups: int, quantiles: tuple, merged: dict) -> dict:
+        sketch_groups = groups[self.sketch_cells]
+        used = sketch_groups >= 0
+        n_bins = int(self.sketch_bins.max()) + 1 if len(self.sketch_bins) else 1
+        keys, inverse = np.unique(sketch_groups[used] * n_bins + self.sketch_bins[used], return_inverse=True)
+        counts = np.bincount(inverse, weights=self.sketch_counts[used])
+        key_groups = keys // n_bins
+        key_bins = keys % n_bins
+        cumulative = np.cumsum(counts)
+        first = np.searchsorted(key_groups, np.arange(n_groups), side="left")
+        last = np.searchsorted(key_groups, np.arange(n_groups), side="right") - 1
+        before = np.concatenate(([0.0], cumulative))[first]
+        present = merged["count"] > 0
+        result = {}
+        for q in quantiles:
+            values = np.full(n_groups, np.nan)
+            if present.any() and len(keys):
+                target = before + q * merged["count"]
+                entry = np.clip(np.searchsorted(cumulative, target, side="left"), first, np.maximum(last, first))
+                entry = np.minimum(entry, len(keys) - 1)
+                inside = (target - (cumulative[entry] - counts[entry])) / counts[entry]
+                estimate = self.bin_origin + (key_bins[entry] + np.clip(inside, 0.0, 1.0)) * self.bin_width
+                values[present] = np.clip(estimate, merged["min"], merged["max"])[present]
+            result[q] = values
+        return result
+
+    # колонки q25/q50/q75... для переданных квантилей
+    def _quantile_columns(self, groups: np.ndarray, n_groups: int, quantiles: tuple, merged: dict) -> dict:
+        if not quantiles:
+            return {}
+        values = self._quantiles(groups, n_groups, quantiles, merged)
+        return {f"q{round(q * 100):02d}": values[q] for q in quantiles}
+
+    # агрегаты по любому подмножеству измерений (city, year, month, season), опционально с квантилями
+    def aggregate(self, by: tuple = ("season",), city: str | None = None, quantiles: tuple = ()) -> pd.DataFrame:
+        unknown = set(by) - set(_DIMENSIONS)
+        if unknown:
+            raise ValueError(f"Unknown rollup dimensions: {sorted(unknown)}")
+        if not by:
+            raise ValueError("At least one rollup dimension is required")
+        mask = self._city_mask(city)
+        keys = np.stack([self.cells[name][mask] for name in by], axis=1)
+        unique_keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+        groups = np.full(len(mask), -1, dtype=np.int64)
+        groups[mask] = inverse.ravel()
+        merged = self._merge(groups, len(unique_keys))
+        merged.update(self._quantile_columns(groups, len(unique_keys), quantiles, merged))
+        frame = pd.DataFrame(merged)
+        for i, name in enumerate(by):
+            column = unique_keys[:, i].astype(np.int64)
+            if name == "city":
+                frame.insert(i, name, np.asarray(self.cities, dtype=object)[column])
+            elif name == "season":
+                frame.insert(i, name, np.asarray(self.seasons, dtype=object)[column])
+            else:
+                frame.insert(i, name, column)
+        return frame.set_index(list(by))
+
+    # сезонный профиль города (то же, что SeasonalProfile.from_frame по строкам города)
+    def seasonal_profile(self, city: str) -> SeasonalProfile:
+        mask = self._city_mask(city)
+        groups = np.where(mask, self.cells["season"], -1)
+        merged = self._merge(groups, len(self.seasons))
+        present = np.flatnonzero(merged["count"])
+        seasons = np.asarray(self.seasons, dtype=object)
+        return SeasonalProfile(
+            seasons[present], merged["mean"][present], merged["std"][present], merged["count"][present]
+        )
+
+    # таблица норм город x сезон для всех городов сразу
+    def seasonal_norms(self) -> SeasonalNorms:
+        n_seasons = len(self.seasons)
+        shape = (len(self.cities), n_seasons)
+        merged = self._merge(self.cells["city"] * n_seasons + self.cells["season"], shape[0] * n_seasons)
+        return SeasonalNorms(
+            self.cities,
+            self.seasons,
+            merged["mean"].reshape(shape),
+            merged["std"].reshape(shape),
+            merged["count"].reshape(shape).astype(np.int32),
+        )
+
+    # статистики для boxplot по сезонам (сезоны в порядке появления в данных города)
+    def seasonal_box(self, city: str) -> pd.DataFrame:
+        mask = self._city_mask(city)
+        groups = np.where(mask, self.cells["season"], -1)
+        n_seasons = len(self.seasons)
+        merged = self._merge(groups, n_seasons)
+        merged.update(self._quantile_columns(groups, n_seasons, (0.25, 0.5, 0.75), merged))
+        frame = pd.DataFrame(merged, index=pd.Index(self.seasons, dtype=object, name="season"))
+        _, first_seen = np.unique(self.cells["season"][mask], return_index=True)
+        order = self.cells["season"][mask][np.sort(first_seen)]
+        return frame.iloc[order]
+
+    # число отмеченных строк (например, аномалий) по году и месяцу; rows - позиции строк в df, по которому строился куб
+    def row_heatmap(self, rows: np.ndarray) -> pd.DataFrame:
+        cells = np.searchsorted(self.run_starts, np.asarray(rows, dtype=np.int64), side="right") - 1
+        if not len(cells):
+            return pd.DataFrame(index=pd.Index([], name="year"), columns=pd.Index([], name="month"), dtype=np.int64)
+        years = self.cells["year"][cells]
+        months = self.cells["month"][cells]
+        year_index, year_codes = np.unique(years, return_inverse=True)
+        month_index, month_codes = np.unique(months, return_inverse=True)
+        counts = np.zeros((len(year_index), len(month_index)), dtype=np.int64)
+        np.add.at(counts, (year_codes, month_codes), 1)
+        return pd.DataFrame(
+            counts, index=pd.Index(year_index, name="year"), columns=pd.Index(month_index, name="month")
+        )
+
+    # средняя температура год x месяц и годовые агрегаты одного города
+    def monthly(self, city: str) -> pd.DataFrame:
+        return self.aggregate(("year", "month"), city)
+
+    def yearly(self, city: str) -> pd.DataFrame:
+        return self.aggregate(("year",), city)
@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+"""
+Таблица сезонных норм город x сезон: mean/std/count в плотных NumPy-массивах.
+Строится один раз на набор данных из куба агрегатов (RollupCube.seasonal_norms, пустые температуры
+не учитываются), сохраняется в .npz и позволяет оценить сразу тысячи текущих наблюдений одной векторной операцией:
+город -> строка, месяц -> сезон -> столбец, дальше |t - mean| > threshold * std.
+std - выборочное (ddof=1), как в calculate_seasonal_profile.
+"""
+
+MONTH_TO_SEASON = {
+    12: "winter",
+    1: "winter",
+    2: "winter",
+    3: "spring",
+    4: "spring",
+    5: "spring",
+    6: "summer",
+    7: "summer",
+    8: "summer",
+    9: "autumn",
+    10: "autumn",
+    11: "autumn",
+}
+_MONTH_SEASON_NAMES = np.array([None] + [MONTH_TO_SEASON[month] for month in range(1, 13)], dtype=object)
+
+
+class SeasonalNorms:
+    def __init__(self, cities: list, seasons: list, mean: np.ndarray, std: np.ndarray, count: np.ndarray):
+        self.cities = [str(city) for city in cities]
+        self.seasons = [str(season) for season in seasons]
+        self.mean = mean
+        self.std = std
+        self.count = count
+        self._city_rows = {city: row for row, city in enumerate(self.cities)}
+        # месяц (1..12) -> столбец сезона, -1 если такого сезона нет в данных
+        self._season_columns = {season: column for column, season in enumerate(self.seasons)}
+        self._month_columns = np.array(
+            [-1] + [self._season_columns.get(MONTH_TO_SEASON[month], -1) for month in range(1, 13)], dtype=np.int64
+        )
+
+    def save(self, path: str) -> None:
+        np.savez(
+            path,
+            cities=np.array(self.cities, dtype=str),
+            seasons=np.array(self.seasons, dtype=str),
+            mean=self.mean,
+            std=self.std,
+            count=self.count,
+        )
+        logger.info(f"Saved seasonal norms for {len(self.cities)} cities to {path}")
+
+    @classmethod
+    def load(cls, path: str) -> "SeasonalNorms":
+        with np.load(path) as data:
+            return cls(data["cities"].tolist(), data["seasons"].tolist(), data["mean"], data["std"], data["count"])
+
+    # норма одного города и сезона; None, если города или сезона нет в данных или по ним меньше двух значений
+    # (без std нельзя решить, аномалия ли наблюдение)
+    def lookup(self, city: str, season: str) -> tuple | None:
+        row = self._city_rows.get(city)
+        column = self._season_columns.get(season)
+        if row is None or column is None:
+            return None
+        mean, std = float(self.mean[row, column]), float(self.std[row, column])
+        if self.count[row, column] == 0 or not (np.isfinite(mean) and np.isfinite(std)):
+            return None
+        return mean, std
+
+    # оценка многих наблюдений разом: cities, temperatures и months - массивы одной длины.
+    # Неизвестный город или сезон дает NaN в норме и is_anomaly=False
+    def score(self, cities, temperatures, months, threshold: float = 2.0) -> pd.DataFrame:
+        cities = pd.Series(cities, dtype=object)
+        temperatures = np.asarray(temperatures, dtype=float)
+        months = np.clip(np.asarray(months, dtype=np.int64), 0, 12)
+        rows = cities.map(self._city_rows).fillna(-1).to_numpy(dtype=np.int64)
+        columns = self._month_columns[months]
+        known = (rows >= 0) & (columns >= 0)
+        seasonal_mean = np.full(len(rows), np.nan)
+        seasonal_std = np.full(len(rows), np.nan)
+        seasonal_mean[known] = self.mean[rows[known], columns[known]]
+        seasonal_std[known] = self.std[rows[known], columns[known]]
+        deviation = temperatures - seasonal_mean
+        with np.errstate(invalid="ignore", divide="ignore"):
+            z_score = deviation / seasonal_std
+            is_anomaly = np.abs(deviation) > np.abs(seasonal_std) * threshold
+        return pd.DataFrame(
+            {
+                "city": cities.to_numpy(),
+                "season": _MONTH_SEASON_NAMES[months],
+                "temperature": temperatures,
+                "seasonal_mean": seasonal_mean,
+                "seasonal_std": seasonal_std,
+                "deviation": deviation,
+                "z_score": z_score,
+                "is_anomaly": is_anomaly,
+            }
+        )
+
+    def to_frame(self) -> pd.DataFrame:
+        index = pd.MultiIndex.from_product([self.cities, self.seasons], names=["city", "season"])
+        frame = pd.DataFrame(
+            {"mean": self.mean.ravel(), "std": self.std.ravel(), "count": self.count.ravel()}, index=index
+        )
+        return frame[frame["count"] > 0]
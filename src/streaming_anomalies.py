@@ -0,0 +1,102 @@
+import math
+from collections import deque
+
+import pandas as pd
+from loguru import logger
+
+
+# состояние одного города: последние window_size значений и скользящие моменты (Welford с удалением)
+class _CityWindow:
+    __slots__ = ("values", "n", "mean", "m2", "last_timestamp")
+
+    def __init__(self, window_size: int):
+        self.values = deque(maxlen=window_size)
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.last_timestamp = None
+
+    def push(self, value: float) -> None:
+        if len(self.values) == self.values.maxlen:
+            self._remove(self.values[0])
+        self.values.append(value)
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+
+    def _remove(self, value: float) -> None:
+        self.n -= 1
+        if self.n == 0:
+            self.mean = 0.0
+            self.m2 = 0.0
+            return
+        delta = value - self.mean
+        self.mean -= delta / self.n
+        self.m2 = max(self.m2 - delta * (value - self.mean), 0.0)
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else math.nan
+
+
+# потоковый детектор: окно хвостовое (будущих точек еще нет), точка входит в свое окно,
+# как и в detect_anomalies. O(window) памяти на город и O(1) на новую точку
+class StreamingAnomalyDetector:
+    def __init__(self, window_size: int = 30, threshold: float = 2.0):
+        self.window_size = window_size
+        self.threshold = threshold
+        self._windows = {}
+
+    def update(self, city: str, timestamp, temperature: float) -> dict | None:
+        timestamp = pd.Timestamp(timestamp)
+        window = self._windows.get(city)
+        if window is None:
+            window = self._windows[city] = _CityWindow(self.window_size)
+        if window.last_timestamp is not None and timestamp < window.last_timestamp:
+            logger.warning(f"Skipping out-of-order observation for {city}: {timestamp} < {window.last_timestamp}")
+            return None
+        window.last_timestamp = timestamp
+        if not math.isfinite(temperature):
+            logger.warning(f"Skipping empty temperature for {city} at {timestamp}")
+            return None
+        window.push(float(temperature))
+
+        std = window.std
+        deviation = temperature - window.mean
+        return {
+            "city": city,
+            "timestamp": timestamp,
+            "temperature": temperature,
+            "mean": window.mean,
+            "std": std,
+            "deviation": deviation,
+            "is_anomaly": bool(abs(deviation) > self.threshold * std),
+        }
+
+    # пачка наблюдений: DataFrame с колонками city/timestamp/temperature или итерируемое из кортежей
+    def update_many(self, observations) -> list:
+        if isinstance(observations, pd.DataFrame):
+            observations = zip(observations["city"], observations["timestamp"], observations["temperature"])
+        results = []
+        for city, timestamp, temperature in observations:
+            result = self.update(city, timestamp, temperature)
+            if result is not None:
+                results.append(result)
+        return results
+
+    # прогрев окна последними историческими значениями города (например, из HistoricalDataAnalyzer.get_city_frame)
+    def warm_up(self, city: str, city_data: pd.DataFrame) -> None:
+        city_data = city_data[city_data["temperature"].notna()]
+        tail = city_data.sort_values("timestamp").tail(self.window_size)
+        window = self._windows[city] = _CityWindow(self.window_size)
+        for value in tail["temperature"]:
+            window.push(float(value))
+        if len(tail):
+            window.last_timestamp = pd.Timestamp(tail["timestamp"].iloc[-1])
+
+    def reset(self, city: str | None = None) -> None:
+        if city is None:
+            self._windows.clear()
+        else:
+            self._windows.pop(city, None)
@@ -0,0 +1,112 @@
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from loguru import logger
+
+from columnar_storage import load_columnar, save_columnar
+
+"""
+Долгоживущий пул процессов для analyze_city_parallel (multiprocess/joblib).
+Данные анализатора один раз выкладываются во временное колоночное хранилище (.npy),
+воркеры открывают его через mmap - страницы общие для всех процессов через page cache,
+а в задачу уходят только пачки (city, start, stop) и параметры окна.
+Анализатор в воркере создается один раз на набор данных (по отпечатку) и переиспользуется между задачами.
+"""
+
+# состояние процесса-воркера: отпечаток данных -> анализатор поверх mmap
+_worker_analyzers = {}
+
+
+def _worker_analyzer(storage_dir: str, fingerprint: str):
+    analyzer = _worker_analyzers.get(fingerprint)
+    if analyzer is None:
+        from historycal_analiz import HistoricalDataAnalyzer, ResultCache
+
+        _worker_analyzers.clear()
+        analyzer = HistoricalDataAnalyzer(load_columnar(storage_dir), ResultCache(0), fingerprint=fingerprint)
+        _worker_analyzers[fingerprint] = analyzer
+    return analyzer
+
+
+# задача воркера: пачка городов по смещениям строк
+def analyze_offsets(
+    storage_dir: str, fingerprint: str, tasks: list, window_size: int, threshold: float, mode: str = "std"
+) -> list:
+    analyzer = _worker_analyzer(storage_dir, fingerprint)
+    return [
+        analyzer.analyze_city_frame(city, analyzer.df.iloc[start:stop], window_size, threshold, start, mode)
+        for city, start, stop in tasks
+    ]
+
+
+# делим города на пачки: несколько пачек на воркер, чтобы выровнять нагрузку, но не слать по одному городу.
+# rows_per_batch - набирать в пачку подряд идущие города, пока в ней меньше стольких строк
+# (много мелких городов уезжают одной задачей, крупный город - отдельной)
+def make_batches(tasks: list, workers: int, batches_per_worker: int = 4, rows_per_batch: int | None = None) -> list:
+    if not tasks:
+        return []
+    if rows_per_batch is not None:
+        batches, batch, rows = [], [], 0
+        for task in tasks:
+            batch.append(task)
+            rows += task[2] - task[1]
+            if rows >= rows_per_batch:
+                batches.append(batch)
+                batch, rows = [], 0
+        return batches + [batch] if batch else batches
+    batch_size = max(1, -(-len(tasks) // (workers * batches_per_worker)))
+    return [tasks[i : i + batch_size] for i in range(0, len(tasks), batch_size)]
+
+
+class AnalyzerPool:
+    def __init__(self, df: pd.DataFrame, fingerprint: str, max_workers: int | None = None):
+        self.fingerprint = fingerprint
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.storage_dir = tempfile.mkdtemp(prefix="analyzer_pool_")
+        save_columnar(df, self.storage_dir, temperature_dtype=df["temperature"].dtype)
+        self._executor = None
+
+    # процессы уже запущены (следующий map не платит за старт воркеров)
+    @property
+    def started(self) -> bool:
+        return self._executor is not None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.max_workers)
+        return self._executor
+
+    def map(
+        self, tasks: list, window_size: int, threshold: float, mode: str = "std", rows_per_batch: int | None = None
+    ) -> list:
+        futures = [
+            self.executor.submit(
+                analyze_offsets, self.storage_dir, self.fingerprint, batch, window_size, threshold, mode
+            )
+            for batch in make_batches(tasks, self.max_workers, rows_per_batch=rows_per_batch)
+        ]
+        return [result for future in futures for result in future.result()]
+
+    def map_joblib(
+        self, tasks: list, window_size: int, threshold: float, mode: str = "std", rows_per_batch: int | None = None
+    ) -> list:
+        from joblib import Parallel, delayed
+
+        # loky переиспользует своих воркеров между вызовами, вместе с ними живет и _worker_analyzers
+        batches = Parallel(n_jobs=self.max_workers)(
+            delayed(analyze_offsets)(self.storage_dir, self.fingerprint, batch, window_size, threshold, mode)
+            for batch in make_batches(tasks, self.max_workers, rows_per_batch=rows_per_batch)
+        )
+        return [result for batch in batches for result in batch]
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+        if os.path.isdir(self.storage_dir):
+            shutil.rmtree(self.storage_dir, ignore_errors=True)
+            logger.debug(f"Removed worker pool storage {self.storage_dir}")
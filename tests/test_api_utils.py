@@ -0,0 +1,145 @@
+import asyncio
+import threading
+
+import pytest
+import requests
+
+import api_utils
+from api_utils import (
+    MemoryCacheBackend,
+    RetryPolicy,
+    WeatherCache,
+    WeatherRequestScheduler,
+)
+from fake_weather_server import FakeWeatherServer
+
+# проверки клиента OpenWeatherMap на локальном фейковом сервере: кэш, склейка запросов, 401/404, повторы 5xx и 429
+
+
+@pytest.fixture(autouse=True)
+def fresh_client(monkeypatch):
+    # свои кэш и планировщик на тест: большая квота и короткие задержки повторов
+    monkeypatch.setattr(api_utils, "weather_cache", WeatherCache(MemoryCacheBackend(), ttl=600))
+    scheduler = WeatherRequestScheduler(rate_per_minute=6000, retry=RetryPolicy(3, base_delay=0.01, max_delay=0.05))
+    monkeypatch.setattr(api_utils, "weather_scheduler", scheduler)
+    return scheduler
+
+
+@pytest.fixture
+def server():
+    with FakeWeatherServer(latency=0.05) as fake:
+        yield fake
+
+
+def test_sync_response_is_cached(server):
+    first = api_utils.get_current_weather_sync("Moscow", server.api_key, server.url)
+    second = api_utils.get_current_weather_sync("Moscow", server.api_key, server.url)
+
+    assert first == second
+    assert server.requests["Moscow"] == 1
+    assert api_utils.weather_cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+def test_expired_entry_is_refetched(server, monkeypatch):
+    monkeypatch.setattr(api_utils, "weather_cache", WeatherCache(MemoryCacheBackend(), ttl=0))
+    api_utils.get_current_weather_sync("Moscow", server.api_key, server.url)
+    api_utils.get_current_weather_sync("Moscow", server.api_key, server.url)
+
+    assert server.requests["Moscow"] == 2
+
+
+def test_concurrent_sync_requests_are_coalesced(server, fresh_client):
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(api_utils.get_current_weather_sync("Paris", server.api_key, server.url))
+        )
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 5 and all(result == results[0] for result in results)
+    assert server.requests["Paris"] == 1
+    assert fresh_client.stats()["coalesced"] == 4
+    assert api_utils.weather_cache.misses == 1
+
+
+def test_concurrent_async_requests_are_coalesced(server, fresh_client):
+    async def run():
+        return await asyncio.gather(
+            *(api_utils.get_current_weather_async("Paris", server.api_key, api_base=server.url) for _ in range(5))
+        )
+
+    results = asyncio.run(run())
+
+    assert all(result == results[0] for result in results)
+    assert server.requests["Paris"] == 1
+    assert fresh_client.stats()["coalesced"] == 4
+
+
+def test_fetch_many_skips_missing_cities_and_reuses_cache(server):
+    cities = ["Moscow", "Paris", "Nowhere", "Paris", "Tokyo"]
+    results = asyncio.run(api_utils.fetch_current_weather_many(cities, server.api_key, api_base=server.url))
+
+    assert set(results) == {"Moscow", "Paris", "Tokyo"}
+    assert server.requests == {"Moscow": 1, "Paris": 1, "Nowhere": 1, "Tokyo": 1}
+
+    again = asyncio.run(api_utils.fetch_current_weather_many(["Moscow", "Tokyo"], server.api_key, api_base=server.url))
+    assert again == {city: results[city] for city in ("Moscow", "Tokyo")}
+    assert sum(server.requests.values()) == 4
+    assert api_utils.weather_cache.stats()["hits"] == 2
+
+
+def test_unknown_city_is_not_retried(server):
+    with pytest.raises(requests.exceptions.HTTPError) as error:
+        api_utils.get_current_weather_sync("Nowhere", server.api_key, server.url)
+
+    assert error.value.response.status_code == 404
+    assert server.requests["Nowhere"] == 1
+
+
+def test_invalid_key(server):
+    with pytest.raises(ValueError, match="Invalid API key"):
+        api_utils.get_current_weather_sync("Moscow", "wrong", server.url)
+    with pytest.raises(ValueError, match="Invalid API key"):
+        asyncio.run(api_utils.fetch_current_weather_many(["Moscow", "Paris"], "wrong", api_base=server.url))
+
+    assert server.statuses[401] == 3
+    assert server.statuses[200] == 0
+
+
+def test_server_errors_are_retried(fresh_client):
+    # seed=7: первые два ответа 503, третий - 200
+    with FakeWeatherServer(fail_rate=0.5, seed=7) as server:
+        current = api_utils.get_current_weather_sync("Moscow", server.api_key, server.url)
+
+    assert current["temperature"] is not None
+    assert server.statuses[503] == 2
+    assert server.requests["Moscow"] == 3
+    assert fresh_client.stats()["retries"] == 2
+
+
+def test_server_errors_give_up_after_max_retries(fresh_client):
+    with FakeWeatherServer(fail_rate=1.0) as server:
+        with pytest.raises(requests.exceptions.HTTPError):
+            api_utils.get_current_weather_sync("Moscow", server.api_key, server.url)
+        results = asyncio.run(api_utils.fetch_current_weather_many(["Paris"], server.api_key, api_base=server.url))
+
+    assert results == {}
+    assert server.requests["Moscow"] == fresh_client.retry.max_retries + 1
+    assert server.requests["Paris"] == fresh_client.retry.max_retries + 1
+
+
+def test_rate_limited_requests_wait_for_retry_after():
+    with FakeWeatherServer(rate_limit=2, window=0.3, retry_after=0.3) as server:
+        cities = ["Moscow", "Paris", "Tokyo", "Berlin"]
+        results = asyncio.run(
+            api_utils.fetch_current_weather_many(cities, server.api_key, concurrency=4, api_base=server.url)
+        )
+
+    assert set(results) == set(cities)
+    assert server.statuses[429] >= 1
+    assert server.statuses[200] == 4
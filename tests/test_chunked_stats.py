@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmark import make_dataset
+from chunked_stats import ChunkedCityStatistics, read_csv_chunked
+from historycal_analiz import HistoricalDataAnalyzer
+
+# потоковые агрегаты по кускам CSV против анализатора в памяти на тех же данных (с NaN-пропусками)
+
+BIN_WIDTH = 0.1
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    df = make_dataset(3, 1000, seed=11)
+    rng = np.random.default_rng(11)
+    temps = df["temperature"].to_numpy(dtype=float).copy()
+    temps[rng.random(len(temps)) < 0.05] = np.nan
+    # длинный пропуск, который попадает на границу кусков, и пропуск в первой строке города
+    temps[1490:1530] = np.nan
+    temps[0] = np.nan
+    df["temperature"] = temps
+    return df
+
+
+@pytest.fixture(scope="module")
+def analyzer(dataset):
+    return HistoricalDataAnalyzer(dataset)
+
+
+@pytest.fixture(scope="module")
+def chunked(dataset, tmp_path_factory):
+    path = tmp_path_factory.mktemp("chunked") / "temperature_data.csv"
+    dataset.to_csv(path, index=False)
+    # куски не совпадают с границами городов
+    return read_csv_chunked(path, chunksize=317, bin_width=BIN_WIDTH)
+
+
+def test_basic_statistics_match(analyzer, chunked):
+    for city in analyzer.cities:
+        expected = analyzer.calculate_basic_statistics(analyzer.get_city_frame(city))
+        actual = chunked.calculate_basic_statistics(city)
+
+        assert actual["count"] == expected["count"]
+        for key in ("mean", "std", "min", "max"):
+            assert actual[key] == pytest.approx(expected[key], rel=1e-9), key
+        # квантили по гистограмме - с точностью до корзины
+        for key in ("median", "q1", "q3"):
+            assert actual[key] == pytest.approx(expected[key], abs=BIN_WIDTH), key
+
+
+def test_seasonal_profile_matches(analyzer, chunked):
+    for city in analyzer.cities:
+        expected = analyzer.calculate_seasonal_profile(analyzer.get_city_frame(city))
+        actual = chunked.calculate_seasonal_profile(city)
+
+        pd.testing.assert_frame_equal(actual, expected, check_dtype=False, check_index_type=False)
+
+
+def test_trend_matches(analyzer, chunked):
+    for city in analyzer.cities:
+        expected = analyzer.calculate_trend(analyzer.get_city_frame(city))
+        actual = chunked.calculate_trend(city)
+
+        for key in ("slope", "intercept", "r_value", "p_value", "std_err"):
+            assert actual[key] == pytest.approx(expected[key], rel=1e-6, abs=1e-12), key
+
+
+def test_merge_equals_single_pass(dataset):
+    whole = ChunkedCityStatistics(bin_width=BIN_WIDTH)
+    whole.update(dataset)
+    left, right = ChunkedCityStatistics(bin_width=BIN_WIDTH), ChunkedCityStatistics(bin_width=BIN_WIDTH)
+    left.update(dataset.iloc[:1234])
+    right.update(dataset.iloc[1234:])
+    left.merge(right)
+
+    for city in whole.cities:
+        expected, actual = whole.analyze_city(city), left.analyze_city(city)
+        assert actual["stats"] == pytest.approx(expected["stats"], rel=1e-9)
+        pd.testing.assert_frame_equal(actual["seasonal"], expected["seasonal"])
+        assert actual["trend"]["slope"] == pytest.approx(expected["trend"]["slope"], rel=1e-9)
@@ -0,0 +1,78 @@
+import gc
+import os
+import threading
+import time
+
+import historycal_analiz
+from benchmark import make_dataset
+from dataset_cache import AnalyzerCache
+from worker_pool import AnalyzerPool
+
+# общий кэш анализаторов: вытеснение не ломает сессии, которые еще работают на пуле; пул у анализатора один
+
+
+def csv_bytes(seed: int) -> bytes:
+    return make_dataset(2, 60, seed=seed).to_csv(index=False).encode()
+
+
+def test_eviction_keeps_pool_of_live_analyzer():
+    cache = AnalyzerCache(max_entries=1)
+    analyzer = cache.get_or_load(csv_bytes(1))
+    pool = analyzer.worker_pool()
+    cities = analyzer.cities
+
+    cache.get_or_load(csv_bytes(2))
+
+    assert cache.stats()["evictions"] == 1
+    assert os.path.isdir(pool.storage_dir)
+    assert analyzer.worker_pool() is pool
+    results = analyzer.analyze_city_parallel(cities, 10, 2.0, method="multiprocess", use_cache=False)
+    assert sorted(results) == sorted(cities)
+
+    # последняя ссылка ушла - пул закрывает weakref.finalize
+    del analyzer, results
+    gc.collect()
+    assert not os.path.isdir(pool.storage_dir)
+
+
+def test_concurrent_sessions_share_one_pool(monkeypatch):
+    created = []
+
+    class SlowPool(AnalyzerPool):
+        def __init__(self, *args, **kwargs):
+            time.sleep(0.05)
+            super().__init__(*args, **kwargs)
+            created.append(self)
+
+    monkeypatch.setattr(historycal_analiz, "AnalyzerPool", SlowPool)
+    analyzer = AnalyzerCache().get_or_load(csv_bytes(3))
+    barrier = threading.Barrier(8)
+    pools = []
+
+    def session():
+        barrier.wait()
+        pools.append(analyzer.worker_pool())
+
+    threads = [threading.Thread(target=session) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(created) == 1
+    assert all(pool is created[0] for pool in pools)
+    analyzer.close()
+    assert not os.path.isdir(created[0].storage_dir)
+
+
+def test_clear_drops_entries_without_closing_pools():
+    cache = AnalyzerCache()
+    analyzer = cache.get_or_load(csv_bytes(4))
+    pool = analyzer.worker_pool()
+
+    cache.clear()
+
+    assert cache.stats()["entries"] == 0
+    assert os.path.isdir(pool.storage_dir)
+    analyzer.close()
+    assert not os.path.isdir(pool.storage_dir)
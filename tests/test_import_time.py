@@ -0,0 +1,60 @@
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+"""
+Время холодного импорта ядра анализа (python -X importtime в отдельном процессе).
+Падает, если historycal_analiz/api_utils тянут при загрузке тяжелые модули (plotly, scipy, joblib, ...)
+или если собственная стоимость импорта (без numpy/pandas, которые нужны всегда) больше бюджета.
+"""
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+HEAVY_MODULES = ["plotly", "scipy", "joblib", "aiohttp", "requests", "streamlit"]
+# без них ядро не работает, их время не считаем
+BASELINE_MODULES = ["numpy", "pandas"]
+BUDGET_MS = {"historycal_analiz": 150.0, "api_utils": 150.0}
+
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+# (модуль, вложенность, собственное время мкс, накопленное время мкс) для каждого импорта
+def import_profile(module: str) -> list:
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=SRC,
+    )
+    profile = []
+    for line in completed.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            profile.append((name, len(indent), int(self_us), int(cumulative_us)))
+    return profile
+
+
+@pytest.mark.parametrize("module", sorted(BUDGET_MS))
+def test_import_skips_heavy_modules(module):
+    loaded = {name for name, _, _, _ in import_profile(module)}
+
+    assert not loaded & set(HEAVY_MODULES), f"{module} imports {sorted(loaded & set(HEAVY_MODULES))} at load time"
+
+
+@pytest.mark.parametrize("module", sorted(BUDGET_MS))
+def test_import_time_budget(module):
+    # лучший из трех холодных запусков, чтобы не ловить случайную нагрузку машины
+    own_ms = float("inf")
+    for _ in range(3):
+        profile = import_profile(module)
+        total_us = sum(cumulative for name, _, _, cumulative in profile if name == module)
+        baseline_us = sum(cumulative for name, _, _, cumulative in profile if name in BASELINE_MODULES)
+        own_ms = min(own_ms, (total_us - baseline_us) / 1000)
+        if own_ms <= BUDGET_MS[module]:
+            break
+
+    assert own_ms <= BUDGET_MS[module], f"{module} import takes {own_ms:.1f} ms without numpy/pandas"
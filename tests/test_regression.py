@@ -0,0 +1,130 @@
+import numpy as np
+import pytest
+from scipy import stats
+
+from regression import rolling_regression, segment_regression
+
+# регрессия в замкнутой форме против scipy.stats.linregress: малые n, точная прямая, постоянные x/y, NaN-пропуски
+
+FIELDS = {
+    "slope": "slope",
+    "intercept": "intercept",
+    "r_value": "rvalue",
+    "p_value": "pvalue",
+    "std_err": "stderr",
+    "intercept_stderr": "intercept_stderr",
+}
+
+
+def single(x, y) -> dict:
+    x = np.asarray(x, dtype=float)
+    regression = segment_regression(x, np.asarray(y, dtype=float), np.array([0]), np.array([len(x)]))
+    return {name: values[0] for name, values in regression.items()}
+
+
+# сравнение с linregress по конечным парам (x, y)
+def assert_matches_linregress(result: dict, x, y):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    finite = np.isfinite(x) & np.isfinite(y)
+    expected = stats.linregress(x[finite], y[finite])
+    for name, attribute in FIELDS.items():
+        # abs: при точной прямой linregress сдвигает r от 1 на TINY, и p получается ~1e-10 вместо 0
+        assert result[name] == pytest.approx(getattr(expected, attribute), rel=1e-9, abs=1e-9, nan_ok=True), name
+    assert result["count"] == finite.sum()
+
+
+@pytest.mark.parametrize("n", [3, 4, 5, 10, 365, 3650])
+def test_random_series(n):
+    rng = np.random.default_rng(n)
+    x = np.sort(rng.uniform(0, 1000, n))
+    y = 0.01 * x + rng.normal(0, 5, n)
+
+    assert_matches_linregress(single(x, y), x, y)
+
+
+def test_integer_days_with_seasonality():
+    days = np.arange(3650, dtype=float)
+    temps = 10 + 15 * np.sin(2 * np.pi * days / 365) + 0.001 * days + np.random.default_rng(1).normal(0, 3, len(days))
+
+    assert_matches_linregress(single(days, temps), days, temps)
+
+
+@pytest.mark.parametrize("n", [2, 3, 10])
+def test_perfect_fit(n):
+    x = np.arange(n, dtype=float)
+    y = 2.0 * x + 1.0
+    result = single(x, y)
+
+    assert_matches_linregress(result, x, y)
+    assert result["r_value"] == 1.0
+    assert result["std_err"] == 0.0
+
+
+@pytest.mark.parametrize("n", [2, 5])
+def test_constant_y(n):
+    x = np.arange(n, dtype=float)
+    y = np.full(n, 7.5)
+
+    assert_matches_linregress(single(x, y), x, y)
+
+
+def test_constant_x_is_undefined():
+    x = np.full(5, 3.0)
+    y = np.arange(5, dtype=float)
+    result = single(x, y)
+
+    with pytest.raises(ValueError):
+        stats.linregress(x, y)
+    assert all(np.isnan(result[name]) for name in FIELDS)
+
+
+def test_fewer_than_two_points_is_undefined():
+    result = single([1.0], [2.0])
+
+    assert np.isnan(result["p_value"]) and np.isnan(result["std_err"])
+
+
+def test_nan_rows_are_skipped():
+    rng = np.random.default_rng(3)
+    x = np.arange(200, dtype=float)
+    y = 0.05 * x + rng.normal(0, 2, len(x))
+    y[[0, 5, 6, 7, 120, 199]] = np.nan
+    x[50] = np.nan
+
+    assert_matches_linregress(single(x, y), x, y)
+
+
+def test_segments_with_nan_rows():
+    rng = np.random.default_rng(4)
+    counts = [2, 3, 4, 50, 7]
+    starts = np.cumsum([0] + counts[:-1])
+    stops = starts + counts
+    x = np.concatenate([np.arange(count, dtype=float) for count in counts])
+    y = rng.normal(0, 1, len(x)) + 0.3 * x
+    y[[3, 10, 11, 40]] = np.nan
+    regression = segment_regression(x, y, starts, stops)
+
+    for i, (start, stop) in enumerate(zip(starts, stops)):
+        result = {name: values[i] for name, values in regression.items()}
+        assert_matches_linregress(result, x[start:stop], y[start:stop])
+
+
+def test_rolling_regression_with_nan_rows():
+    rng = np.random.default_rng(5)
+    x = np.arange(120, dtype=float)
+    y = 0.1 * x + rng.normal(0, 1, len(x))
+    y[[0, 30, 31, 32, 90]] = np.nan
+    starts, stops = np.array([0, 60]), np.array([60, 120])
+    window = 15
+    regression = rolling_regression(x, y, starts, stops, window)
+
+    for row in range(len(x)):
+        segment = 0 if row < 60 else 1
+        lo = max(row + 1 - window, starts[segment])
+        if np.isfinite(y[lo : row + 1]).sum() < 3:
+            continue
+        # rolling_regression сдвигает x к началу отрезка - intercept считается от другого нуля
+        shifted = x[lo : row + 1] - x[starts[segment]]
+        result = {name: values[row] for name, values in regression.items()}
+        assert_matches_linregress(result, shifted, y[lo : row + 1])
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from robust_window import MAD_TO_SIGMA, rolling_median_mad
+
+# скользящие медиана/MAD на отсортированном окне против прямого счета и rolling(center=True, min_periods=1)
+
+WINDOW_SIZES = [1, 2, 3, 4, 7, 8, 30, 31]
+
+
+def make_values(n: int = 400, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    # округление до целых дает много одинаковых значений (совпадения медианы и отклонений)
+    values = np.round(rng.normal(10, 5, n))
+    values[rng.random(n) < 0.05] = np.nan
+    values[100:150] = np.nan
+    values[200:220] = 3.0
+    values[-3:] = np.nan
+    return values
+
+
+# прямой счет: для каждой строки свое окно, как у rolling(center=True) внутри отрезка, NaN выброшены
+def brute_force(values: np.ndarray, window_size: int, starts, stops) -> tuple:
+    median = np.full(len(values), np.nan)
+    scale = np.full(len(values), np.nan)
+    ahead = (window_size - 1) // 2 + 1
+    for start, stop in zip(starts, stops):
+        for i in range(start, stop):
+            window = values[max(i + ahead - window_size, start) : min(i + ahead, stop)]
+            window = window[~np.isnan(window)]
+            if not len(window):
+                continue
+            median[i] = np.median(window)
+            if len(window) > 1:
+                scale[i] = np.median(np.abs(window - median[i])) * MAD_TO_SIGMA
+    return median, scale
+
+
+def pandas_rolling(values: np.ndarray, window_size: int, starts, stops) -> tuple:
+    medians, scales = [], []
+    for start, stop in zip(starts, stops):
+        rolling = pd.Series(values[start:stop]).rolling(window_size, center=True, min_periods=1)
+        medians.append(rolling.median().to_numpy())
+        mad = rolling.apply(lambda w: np.nanmedian(np.abs(w - np.nanmedian(w))), raw=True).to_numpy()
+        count = rolling.count().to_numpy()
+        scales.append(np.where(count > 1, mad * MAD_TO_SIGMA, np.nan))
+    return np.concatenate(medians), np.concatenate(scales)
+
+
+@pytest.mark.parametrize("window_size", WINDOW_SIZES)
+def test_matches_brute_force_and_pandas(window_size):
+    values = make_values()
+    bounds = [0], [len(values)]
+    median, scale = rolling_median_mad(values, window_size)
+
+    for expected_median, expected_scale in (
+        brute_force(values, window_size, *bounds),
+        pandas_rolling(values, window_size, *bounds),
+    ):
+        np.testing.assert_allclose(median, expected_median, rtol=0, atol=1e-12)
+        np.testing.assert_allclose(scale, expected_scale, rtol=0, atol=1e-12)
+
+
+@pytest.mark.parametrize("window_size", WINDOW_SIZES)
+def test_window_stops_at_segment_edges(window_size):
+    values = make_values(seed=1)
+    # короткие отрезки (1 и 2 строки, короче окна), отрезок только из NaN и отрезок, начинающийся с NaN
+    stops = np.array([1, 3, 40, 100, 150, 260, 400])
+    starts = np.concatenate(([0], stops[:-1]))
+    median, scale = rolling_median_mad(values, window_size, starts, stops)
+    expected_median, expected_scale = pandas_rolling(values, window_size, starts, stops)
+
+    np.testing.assert_allclose(median, expected_median, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(scale, expected_scale, rtol=0, atol=1e-12)
+    assert np.isnan(median[100:150]).all()
+
+
+def test_ties_have_zero_scale():
+    values = np.array([5.0, 5.0, 5.0, 5.0, 9.0, 5.0, 5.0])
+    median, scale = rolling_median_mad(values, 5)
+
+    assert (median == 5.0).all()
+    assert (scale == 0.0).all()
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from benchmark import make_dataset
+from historycal_analiz import HistoricalDataAnalyzer, ResultCache
+
+# поверхность аномалий (окна x пороги за один проход) против detect_anomalies для каждой пары окно/порог
+
+WINDOW_SIZES = [2, 3, 7, 30, 31, 90, 365]
+THRESHOLDS = [0.5, 1.0, 1.5, 2.0, 2.5, 3.0, 3.7]
+
+
+@pytest.fixture(scope="module")
+def analyzer():
+    df = make_dataset(3, 900, seed=5)
+    temps = df["temperature"].to_numpy(dtype=float).copy()
+    rng = np.random.default_rng(5)
+    # у второго города - редкие пропуски, длинный пропуск длиннее части окон и пропуск в первой строке
+    second = df["city"].to_numpy() == df["city"].unique()[1]
+    rows = np.flatnonzero(second)
+    temps[rows[rng.random(len(rows)) < 0.05]] = np.nan
+    temps[rows[100:140]] = np.nan
+    temps[rows[0]] = np.nan
+    # ровно на пороге: повтор значения внутри окна
+    temps[rows[500:510]] = temps[rows[500]]
+    df["temperature"] = temps
+    return HistoricalDataAnalyzer(df, results=ResultCache())
+
+
+def test_sweep_matches_detect_anomalies(analyzer):
+    sweep = analyzer.sweep_anomalies(WINDOW_SIZES, THRESHOLDS)
+
+    for city in analyzer.cities:
+        city_data = analyzer.get_city_frame(city)
+        for window_size in WINDOW_SIZES:
+            for threshold in THRESHOLDS:
+                expected = analyzer.detect_anomalies(city_data, window_size, threshold)["anomaly_count"]
+                assert sweep.count(city, window_size, threshold) == expected, (city, window_size, threshold)
+
+
+def test_city_subset_matches_full_sweep(analyzer):
+    city = analyzer.cities[1]
+    full = analyzer.sweep_anomalies(WINDOW_SIZES, THRESHOLDS)
+    subset = analyzer.sweep_anomalies(WINDOW_SIZES, THRESHOLDS[::-1], cities=[city])
+
+    for window_size in WINDOW_SIZES:
+        for threshold in THRESHOLDS:
+            assert subset.count(city, window_size, threshold) == full.count(city, window_size, threshold)
+
+
+def test_unknown_combination_raises(analyzer):
+    sweep = analyzer.sweep_anomalies([7], [2.0])
+
+    with pytest.raises(KeyError):
+        sweep.count(analyzer.cities[0], 8, 2.0)